@@ -0,0 +1,50 @@
+"""Add counters table
+
+Revision ID: 5d1e8a3f2b70
+Revises: 23a54be4ea7d
+Create Date: 2026-10-16 10:12:41.208374
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1e8a3f2b70'
+down_revision: Union[str, Sequence[str], None] = '23a54be4ea7d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('counters',
+    sa.Column('name', sa.String(length=64), nullable=False, comment='计数器名称'),
+    sa.Column('value', sa.BigInteger(), nullable=False, comment='计数值'),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    # Backfill from the current data
+    op.execute(
+        "INSERT INTO counters (name, value) "
+        "SELECT 'posts:live', COUNT(*) FROM posts WHERE is_deleted = 0"
+    )
+    op.execute(
+        "INSERT INTO counters (name, value) "
+        "SELECT CONCAT('posts:live:user:', user_id), COUNT(*) FROM posts "
+        "WHERE is_deleted = 0 GROUP BY user_id"
+    )
+    op.execute(
+        "INSERT INTO counters (name, value) "
+        "SELECT CONCAT('comments:roots:post:', c.post_id), COUNT(*) FROM comments c "
+        "WHERE c.parent_id IS NULL AND (c.is_deleted = 0 OR EXISTS ("
+        "  SELECT 1 FROM comments r WHERE r.root_id = c.id AND r.parent_id IS NOT NULL AND r.is_deleted = 0"
+        ")) GROUP BY c.post_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('counters')
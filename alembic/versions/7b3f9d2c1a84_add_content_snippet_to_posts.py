@@ -0,0 +1,34 @@
+"""Add content_snippet to posts
+
+Revision ID: 7b3f9d2c1a84
+Revises: c28f5b6e4d19
+Create Date: 2026-10-16 23:05:41.275310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3f9d2c1a84'
+down_revision: Union[str, Sequence[str], None] = 'c28f5b6e4d19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('posts', sa.Column('content_snippet', sa.String(length=64), server_default='', nullable=False, comment='正文摘要'))
+
+    # Backfill with the same rule as crud.make_snippet: first 50 characters, "..." if truncated
+    op.execute(
+        "UPDATE posts SET content_snippet = "
+        "CASE WHEN CHAR_LENGTH(content) > 50 THEN CONCAT(LEFT(content, 50), '...') ELSE content END"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('posts', 'content_snippet')
@@ -0,0 +1,31 @@
+"""Add roots to post_counter_shards
+
+Revision ID: 9d4b2e7f6a13
+Revises: e3a9c5d7f214
+Create Date: 2026-10-17 09:12:40.218364
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4b2e7f6a13'
+down_revision: Union[str, Sequence[str], None] = 'e3a9c5d7f214'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing shards carry no root deltas: fill them with 0, then drop the default like the other columns
+    op.add_column('post_counter_shards', sa.Column('roots', sa.Integer(), nullable=False, server_default='0', comment='未折叠的可见根评论数增量'))
+    op.alter_column('post_counter_shards', 'roots', existing_type=sa.Integer(), existing_nullable=False, existing_comment='未折叠的可见根评论数增量', server_default=None)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Run post_counters.fold() first, otherwise unfolded root deltas are lost
+    op.drop_column('post_counter_shards', 'roots')
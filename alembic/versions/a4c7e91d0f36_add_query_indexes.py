@@ -0,0 +1,36 @@
+"""Add indexes for feed, comment and login queries
+
+Revision ID: a4c7e91d0f36
+Revises: 5d1e8a3f2b70
+Create Date: 2026-10-16 11:03:27.551902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c7e91d0f36'
+down_revision: Union[str, Sequence[str], None] = '5d1e8a3f2b70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_users_username', 'users', ['username'], unique=False)
+    op.create_index('ix_posts_feed', 'posts', ['is_deleted', 'created_at', 'id'], unique=False)
+    op.create_index('ix_posts_user_feed', 'posts', ['user_id', 'is_deleted', 'created_at', 'id'], unique=False)
+    op.create_index('ix_comments_post_roots', 'comments', ['post_id', 'parent_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_comments_root_replies', 'comments', ['root_id', 'is_deleted', 'created_at', 'id', 'parent_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_comments_root_replies', table_name='comments')
+    op.drop_index('ix_comments_post_roots', table_name='comments')
+    op.drop_index('ix_posts_user_feed', table_name='posts')
+    op.drop_index('ix_posts_feed', table_name='posts')
+    op.drop_index('ix_users_username', table_name='users')
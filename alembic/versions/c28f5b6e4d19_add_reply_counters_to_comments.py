@@ -0,0 +1,40 @@
+"""Add reply counters to comments
+
+Revision ID: c28f5b6e4d19
+Revises: a4c7e91d0f36
+Create Date: 2026-10-16 13:46:08.913420
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c28f5b6e4d19'
+down_revision: Union[str, Sequence[str], None] = 'a4c7e91d0f36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('comments', sa.Column('reply_count', sa.Integer(), server_default='0', nullable=False, comment='子回复总数 (含已删除)'))
+    op.add_column('comments', sa.Column('live_reply_count', sa.Integer(), server_default='0', nullable=False, comment='未删除的子回复数'))
+
+    # Backfill root comments from their existing replies
+    op.execute(
+        "UPDATE comments c "
+        "JOIN ("
+        "  SELECT root_id, COUNT(*) AS total, SUM(is_deleted = 0) AS live "
+        "  FROM comments WHERE parent_id IS NOT NULL GROUP BY root_id"
+        ") r ON r.root_id = c.id "
+        "SET c.reply_count = r.total, c.live_reply_count = r.live"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('comments', 'live_reply_count')
+    op.drop_column('comments', 'reply_count')
@@ -0,0 +1,34 @@
+"""Add post_counter_shards
+
+Revision ID: e3a9c5d7f214
+Revises: 7b3f9d2c1a84
+Create Date: 2026-10-16 23:48:12.530917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a9c5d7f214'
+down_revision: Union[str, Sequence[str], None] = '7b3f9d2c1a84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('post_counter_shards',
+    sa.Column('post_id', sa.Integer(), autoincrement=False, nullable=False, comment='帖子ID'),
+    sa.Column('shard', sa.SmallInteger(), autoincrement=False, nullable=False, comment='分片号'),
+    sa.Column('comments', sa.Integer(), nullable=False, comment='未折叠的评论数增量'),
+    sa.Column('views', sa.Integer(), nullable=False, comment='未折叠的阅读数增量'),
+    sa.PrimaryKeyConstraint('post_id', 'shard')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('post_counter_shards')
@@ -0,0 +1,128 @@
+"""
+Bytes transferred and latency per feed page, full Post entities vs. the projected list query.
+
+before: SELECT posts.* (content included) and slice the snippet in Python (the old get_posts)
+after:  crud.get_posts -> POST_LIST_COLUMNS with the stored content_snippet
+
+Posts are seeded with 10 KB+ bodies. Uses a throwaway SQLite file by default;
+set BENCH_DATABASE_URL to an empty MySQL schema (mysql+aiomysql://...) to measure over the network.
+
+Usage:
+    python -m benchmarks.bench_feed_query [--posts 2000] [--body-kb 10] [--page-sizes 10 50] [--runs 50]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from sqlalchemy import desc, event, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import undefer
+
+from my_app import crud, models, schemas
+from my_app.database import Base
+
+
+def row_bytes(row) -> int:
+    # Rough size of the values the driver handed back
+    return sum(len(str(v).encode()) for v in row if v is not None)
+
+
+async def seed(engine, posts: int, body_kb: int) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(models.User).values(id=1, username="bench"))
+        body = "正文" * (body_kb * 1024 // 6 + 1)  # 3 bytes per CJK character in UTF-8
+        for start in range(0, posts, 500):
+            await conn.execute(insert(models.Post), [
+                {
+                    "user_id": 1, "title": f"post {i}", "content": body,
+                    "content_snippet": crud.make_snippet(body), "is_deleted": False,
+                    "view_count": 0, "comment_count": 0,
+                }
+                for i in range(start, min(start + 500, posts))
+            ])
+
+
+async def page_before(db: AsyncSession, page_size: int):
+    stmt = (
+        select(models.Post)
+        .options(undefer(models.Post.content))
+        .where(models.Post.is_deleted == False)
+        .order_by(desc(models.Post.created_at), desc(models.Post.id))
+        .limit(page_size + 1)
+    )
+    posts = (await db.execute(stmt)).scalars().all()[:page_size]
+    return [p.content[:50] + "..." if len(p.content) > 50 else p.content for p in posts]
+
+
+async def page_after(db: AsyncSession, page_size: int):
+    posts, _, _ = await crud.get_posts(db, page_size=page_size, count_mode=schemas.CountMode.none)
+    return [p.content_snippet for p in posts]
+
+
+async def measure(engine, fn, page_size: int, runs: int):
+    Session = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    timings = []
+    for i in range(runs + 5):
+        async with Session() as db:
+            start = time.perf_counter()
+            snippets = await fn(db, page_size)
+            if i >= 5:  # first runs warm the cache and pool
+                timings.append(time.perf_counter() - start)
+
+    # Replay the page query once to size the rows it sends back
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    async with Session() as db:
+        await fn(db, page_size)
+    event.remove(engine.sync_engine, "before_cursor_execute", capture)
+    statement, parameters = captured[-1]
+    async with engine.connect() as conn:
+        rows = (await conn.exec_driver_sql(statement, parameters)).all()
+    return snippets, sum(row_bytes(r) for r in rows), statistics.median(timings) * 1000
+
+
+async def run(args) -> None:
+    url = os.environ.get("BENCH_DATABASE_URL")
+    tmp = None
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        url = f"sqlite+aiosqlite:///{tmp.name}"
+    engine = create_async_engine(url)
+    try:
+        await seed(engine, args.posts, args.body_kb)
+        print(f"{args.posts} posts, ~{args.body_kb} KB body, {engine.dialect.name}")
+        print(f"{'page':>5}{'before bytes':>14}{'after bytes':>13}{'before ms':>11}{'after ms':>10}")
+        for page_size in args.page_sizes:
+            before, b_bytes, b_ms = await measure(engine, page_before, page_size, args.runs)
+            after, a_bytes, a_ms = await measure(engine, page_after, page_size, args.runs)
+            assert before == after, "snippets differ"
+            print(f"{page_size:>5}{b_bytes:>14.0f}{a_bytes:>13.0f}{b_ms:>11.2f}{a_ms:>10.2f}")
+    finally:
+        await engine.dispose()
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--body-kb", type=int, default=10)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--runs", type=int, default=50)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Comment throughput on a single hot post as concurrency grows, posts-row counter vs. sharded counter.
+
+row:     the old create_comment, UPDATE posts SET comment_count = comment_count + 1 in the
+         comment transaction, and + 1 on the post's visible-root row in counters for root comments
+         (every writer waits for the same row locks)
+sharded: crud.create_comment as it is now, + 1 on a random post_counter_shards row for both
+
+Each worker alternates root comments and replies under its own root, so the rows all writers share
+are the post's counters; a reply also locks its root, which only that worker writes to.
+Row locks only exist on a real server: set BENCH_DATABASE_URL to an empty MySQL schema
+(mysql+aiomysql://..., tables are dropped). On the default throwaway SQLite file every write takes
+the database lock, so both modes stay flat there. Redis: BENCH_REDIS_URL, otherwise fakeredis.
+
+Usage:
+    python -m benchmarks.bench_hot_post_comments [--concurrency 1 2 4 8 16 32] [--seconds 5] [--shards 16]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from my_app import counters, crud, models, post_counters, schemas
+from my_app.database import Base, settings
+from my_app.metrics import TimedRedis
+from my_app.redis_utils import RedisClient
+
+POST_ID = 1
+
+
+async def row_counter(db: AsyncSession, post_id: int, comments: int = 0, views: int = 0, roots: int = 0) -> None:
+    await db.execute(
+        update(models.Post)
+        .where(models.Post.id == post_id)
+        .values(comment_count=models.Post.comment_count + comments)
+    )
+    if roots:
+        await counters.bump(db, counters.visible_root_comments(post_id), roots)
+
+
+async def seed(engine, workers: int) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(models.User), [{"id": i, "username": f"user{i}"} for i in range(1, workers + 1)])
+        await conn.execute(insert(models.Post).values(
+            id=POST_ID, user_id=1, title="hot", content="hot", content_snippet="hot",
+            is_deleted=False, view_count=0, comment_count=0,
+        ))
+        await conn.execute(insert(models.Comment), [
+            {"id": i, "post_id": POST_ID, "user_id": i, "root_id": i, "content": "root",
+             "is_deleted": False, "reply_count": 0, "live_reply_count": 0}
+            for i in range(1, workers + 1)
+        ])
+        await conn.execute(insert(models.Counter).values(name=counters.visible_root_comments(POST_ID), value=workers))
+
+
+async def measure(Session, workers: int, seconds: float) -> float:
+    done = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(i: int) -> None:
+        nonlocal done
+        comments = [
+            schemas.CommentCreate(post_id=POST_ID, content="root"),
+            schemas.CommentCreate(post_id=POST_ID, content="reply", parent_id=i),
+        ]
+        while time.perf_counter() < deadline:
+            async with Session() as db:
+                await crud.create_comment(db, comments[done % 2], user_id=i)
+            done += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(1, workers + 1)))
+    return done / (time.perf_counter() - start)
+
+
+async def total_comments(Session, seeded_roots: int) -> int:
+    async with Session() as db:
+        await post_counters.fold(db)
+        stored = (await db.execute(select(models.Post.comment_count).where(models.Post.id == POST_ID))).scalar()
+        actual = (await db.execute(select(func.count()).select_from(models.Comment))).scalar() - seeded_roots
+        stored_roots = await counters.get_value(db, counters.visible_root_comments(POST_ID))
+        actual_roots = (await db.execute(select(func.count()).select_from(models.Comment).where(
+            models.Comment.parent_id.is_(None)))).scalar()
+    assert stored == actual, f"comment_count {stored} != {actual} comments"
+    assert stored_roots == actual_roots, f"visible roots {stored_roots} != {actual_roots} root comments"
+    return stored
+
+
+async def run(args) -> None:
+    url = os.environ.get("BENCH_DATABASE_URL")
+    tmp = None
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        url = f"sqlite+aiosqlite:///{tmp.name}"
+    top = max(args.concurrency)
+    engine = create_async_engine(url, pool_size=top, max_overflow=0)
+    Session = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+    if os.environ.get("BENCH_REDIS_URL"):
+        RedisClient._instance = TimedRedis.from_url(os.environ["BENCH_REDIS_URL"], decode_responses=True)
+    else:
+        import fakeredis
+
+        RedisClient._instance = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    settings.POST_COUNTER_SHARDS = args.shards
+
+    sharded_add = crud.post_counters.add
+    try:
+        print(f"{engine.dialect.name}, {args.seconds}s per run, {args.shards} shards")
+        print(f"{'workers':>8}{'row c/s':>12}{'sharded c/s':>14}{'ratio':>8}")
+        for workers in args.concurrency:
+            rates = []
+            for counter in (row_counter, sharded_add):
+                await seed(engine, top)
+                crud.post_counters.add = counter
+                rates.append(await measure(Session, workers, args.seconds))
+                crud.post_counters.add = sharded_add
+                await total_comments(Session, top)
+            print(f"{workers:>8}{rates[0]:>12.0f}{rates[1]:>14.0f}{rates[1] / rates[0]:>7.1f}x")
+    finally:
+        crud.post_counters.add = sharded_add
+        await engine.dispose()
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--shards", type=int, default=16)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Per-request overhead of the rate limiter (one token bucket check).
+
+redis: the Lua token bucket, one EVALSHA round trip. Uses BENCH_REDIS_URL if set
+       (e.g. redis://localhost:6379/15), otherwise fakeredis, which runs the script
+       in process and says more about CPU cost than about a real round trip.
+local: the in-process fallback used while Redis is unavailable.
+
+Usage:
+    python -m benchmarks.bench_rate_limit [--calls 5000] [--identities 1000]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from my_app import rate_limit
+from my_app.metrics import TimedRedis
+from my_app.redis_utils import RedisClient
+
+
+class DownRedis:
+    """Stands in for an unreachable server so hit() takes the fallback path."""
+
+    def register_script(self, script):
+        async def call(**kwargs):
+            raise RedisConnectionError("bench: redis down")
+        return call
+
+
+def redis_client():
+    url = os.environ.get("BENCH_REDIS_URL")
+    if url:
+        return TimedRedis.from_url(url, decode_responses=True), "redis"
+    import fakeredis
+
+    return fakeredis.aioredis.FakeRedis(decode_responses=True), "fakeredis"
+
+
+async def measure(calls: int, identities: int):
+    # Large bucket so every call is allowed and does the full read-refill-write
+    rule = rate_limit.Rule("bench", capacity=10**9, period=1)
+    timings = []
+    for i in range(calls + 100):
+        start = time.perf_counter()
+        decision = await rate_limit.hit(rule, f"user:{i % identities}")
+        if i >= 100:  # first calls load the script
+            timings.append(time.perf_counter() - start)
+        assert decision.allowed
+    timings.sort()
+    return (
+        statistics.fmean(timings) * 1e6,
+        timings[len(timings) // 2] * 1e6,
+        timings[int(len(timings) * 0.99)] * 1e6,
+    )
+
+
+async def run(args) -> None:
+    client, name = redis_client()
+    print(f"{'backend':<12}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}")
+    for label, instance in ((name, client), ("local", DownRedis())):
+        RedisClient._instance = instance
+        rate_limit._bucket_script = None
+        mean, p50, p99 = await measure(args.calls, args.identities)
+        print(f"{label:<12}{mean:>10.1f}{p50:>10.1f}{p99:>10.1f}")
+    if name == "redis":
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--identities", type=int, default=1000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
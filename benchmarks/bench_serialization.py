@@ -0,0 +1,140 @@
+"""
+Per-item serialization cost of the list endpoints, before and after the fast path.
+
+before: Pydantic model per row -> response_model validation -> stdlib json (the old read_posts /
+        read_post_comments path)
+after:  row projected straight into a dict -> orjson
+
+Usage:
+    python -m benchmarks.bench_serialization [--sizes 10 100 1000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import timeit
+from datetime import datetime, timedelta
+
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from pydantic import TypeAdapter
+
+from my_app import models, schemas
+from my_app.crud import make_snippet
+from my_app.main import to_comment_list_item, to_pagination, to_post_list_item
+from my_app.responses import ORJSONResponse
+
+NOW = datetime(2026, 1, 1, 12, 0, 0, 123456)
+
+
+def make_posts(n: int):
+    return [
+        models.Post(
+            id=i, user_id=i % 50 + 1, title=f"post {i}", content="正文内容 " * 40, content_snippet=make_snippet("正文内容 " * 40),
+            is_deleted=False, view_count=i * 3, comment_count=i % 7, created_at=NOW - timedelta(seconds=i),
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+def make_comments(n: int):
+    users = [models.User(id=i, username=f"user{i}", avatar_url=None, created_at=NOW) for i in range(1, 51)]
+    return [
+        models.Comment(
+            id=i, post_id=1, user_id=users[i % 50].id, user=users[i % 50], reply_to_user=None,
+            content="评论内容 " * 10, is_deleted=False, parent_id=None, root_id=i,
+            reply_count=i % 5, live_reply_count=i % 5, created_at=NOW - timedelta(seconds=i),
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+def stdlib_render(content) -> bytes:
+    # starlette.responses.JSONResponse.render
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+# ---- posts ----
+POSTS_ADAPTER = TypeAdapter(schemas.ResponseModel[schemas.PaginatedList[schemas.PostListItem]])
+
+
+def posts_before(posts) -> bytes:
+    items = []
+    for p in posts:
+        snippet = p.content[:50] + "..." if len(p.content) > 50 else p.content
+        items.append(schemas.PostListItem(
+            id=p.id, user_id=p.user_id, title=p.title, content_snippet=snippet,
+            view_count=p.view_count, comment_count=p.comment_count, created_at=p.created_at,
+        ))
+    model = schemas.ResponseModel(data=schemas.PaginatedList(
+        pagination=schemas.PaginationData(page=1, pageSize=len(posts), total=10000),
+        list=items,
+    ))
+    validated = POSTS_ADAPTER.validate_python(model)
+    return stdlib_render(POSTS_ADAPTER.dump_python(validated, mode="json"))
+
+
+def posts_after(posts) -> bytes:
+    return ORJSONResponse({"code": 200, "msg": "success", "data": {
+        "pagination": to_pagination(1, len(posts), 10000, None),
+        "list": [to_post_list_item(p) for p in posts],
+    }}).body
+
+
+# ---- comments ----
+COMMENTS_ADAPTER = TypeAdapter(schemas.ResponseModel[schemas.CommentListResponse])
+
+
+def comments_before(comments) -> bytes:
+    items = []
+    for c in comments:
+        item = schemas.CommentListItem.model_validate(c)
+        item.reply_count = c.live_reply_count
+        item.replies = []
+        items.append(item)
+    model = schemas.ResponseModel(data=schemas.CommentListResponse(
+        pagination=schemas.PaginationData(page=1, pageSize=len(comments), total=10000, total_root_comments=10000),
+        list=items,
+    ))
+    validated = COMMENTS_ADAPTER.validate_python(model)
+    return stdlib_render(COMMENTS_ADAPTER.dump_python(validated, mode="json"))
+
+
+def comments_after(comments) -> bytes:
+    return ORJSONResponse({"code": 200, "msg": "success", "data": {
+        "pagination": to_pagination(1, len(comments), 10000, None, total_root_comments=10000),
+        "list": [to_comment_list_item(c, reply_count=c.live_reply_count) for c in comments],
+    }}).body
+
+
+CASES = [
+    ("posts", make_posts, posts_before, posts_after),
+    ("comments", make_comments, comments_before, comments_after),
+]
+
+
+def per_item_us(fn, rows, repeat: int) -> float:
+    number = max(1, 2000 // len(rows))
+    best = min(timeit.repeat(lambda: fn(rows), number=number, repeat=repeat))
+    return best / number / len(rows) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'endpoint':<10}{'items':>7}{'before us/item':>16}{'after us/item':>15}{'speedup':>9}")
+    for name, make, before, after in CASES:
+        for size in args.sizes:
+            rows = make(size)
+            # Both paths must produce the same JSON document
+            assert json.loads(before(rows)) == json.loads(after(rows)), f"{name}: output differs"
+            b = per_item_us(before, rows, args.repeat)
+            a = per_item_us(after, rows, args.repeat)
+            print(f"{name:<10}{size:>7}{b:>16.2f}{a:>15.2f}{b / a:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
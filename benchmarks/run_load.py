@@ -0,0 +1,466 @@
+"""
+Concurrent load run over every endpoint in my_app.main, in process through httpx.ASGITransport.
+
+Each endpoint gets its own phase (`--requests` calls from `--concurrency` workers), then a
+"mixed" phase interleaves the weighted read/write scenarios. Reported per endpoint:
+throughput, p50/p95/p99 latency and status codes; errors are 5xx responses and exceptions
+(404 on a soft-deleted post is a valid answer). Latency includes the in-process client, so
+compare runs against each other rather than against numbers from a real network.
+
+Backends (see benchmarks/backends.py): BENCH_DATABASE_URL / BENCH_REDIS_URL, otherwise a
+throwaway SQLite file and fakeredis. The database is reseeded with benchmarks.seed unless
+--no-seed is given (tables are dropped!). Results are written to benchmarks/results/ as JSON,
+named <timestamp>-<git sha>.json; pass an older file as --baseline to print the deltas.
+
+Usage:
+    python -m benchmarks.run_load [--users 1000 --posts 10000 --comments 50000]
+                                  [--concurrency 16] [--requests 300] [--only thread hot]
+    python -m benchmarks.seed --posts 1000000 --comments 10000000    # once, into ./bench.db
+    python -m benchmarks.run_load --no-seed --sqlite bench.db --baseline benchmarks/results/<old>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks import backends as bench_backends
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+# =======================
+# Scenarios
+# =======================
+class Context:
+    """Ids sampled from the seeded data plus per-worker state (tokens, cursors, created rows)."""
+
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random, max_user_id: int, max_post_id: int,
+                 recent_posts: List[int], threads: List[tuple], run_tag: str):
+        self.client = client
+        self.rng = rng
+        self.max_user_id = max_user_id
+        self.max_post_id = max_post_id
+        self.recent_posts = recent_posts or [1]
+        self.threads = threads or [(1, 1)]  # (root comment id, post id) of roots with replies
+        self.run_tag = run_tag
+        self.admin: Dict[str, str] = {}
+        self.tokens: List[Dict[str, str]] = []
+        self.cursors: Dict[int, Optional[str]] = {}
+        self.etags: Dict[int, str] = {}
+        # (id, author's headers) of rows created during the run, deleted again by the DELETE scenarios
+        self.created_posts: List[tuple] = []
+        self.created_comments: List[tuple] = []
+        self.sequence = 0
+
+    def auth(self, worker: int) -> Dict[str, str]:
+        return self.tokens[worker % len(self.tokens)]
+
+    def pick_post(self) -> int:
+        # Most traffic lands on recent posts, the rest anywhere in the archive
+        if self.rng.random() < 0.8:
+            return self.rng.choice(self.recent_posts)
+        return self.rng.randint(1, self.max_post_id)
+
+    def next_name(self, worker: int) -> str:
+        self.sequence += 1
+        return f"load-{self.run_tag}-{worker}-{self.sequence}"
+
+
+class Scenario:
+    def __init__(self, method: str, route: str, variant: str, weight: int,
+                 call: Callable[[Context, int], Awaitable[httpx.Response]]):
+        self.method = method
+        self.route = route
+        self.name = f"{method} {route}" + (f" [{variant}]" if variant else "")
+        self.weight = weight
+        self.call = call
+
+
+SCENARIOS: List[Scenario] = []
+
+
+def scenario(method: str, route: str, variant: str = "", weight: int = 0):
+    """Register a scenario; weight is its share in the mixed phase (0 = excluded)."""
+    def register(call):
+        SCENARIOS.append(Scenario(method, route, variant, weight, call))
+        return call
+    return register
+
+
+@scenario("POST", "/token", weight=1)
+async def login(ctx: Context, worker: int):
+    username = f"user{ctx.rng.randint(1, ctx.max_user_id)}"
+    return await ctx.client.post("/token", data={"username": username, "password": "x"})
+
+
+@scenario("POST", "/users")
+async def create_user(ctx: Context, worker: int):
+    return await ctx.client.post("/users", json={"username": ctx.next_name(worker)})
+
+
+@scenario("GET", "/users/me", weight=2)
+async def read_users_me(ctx: Context, worker: int):
+    return await ctx.client.get("/users/me", headers=ctx.auth(worker))
+
+
+@scenario("GET", "/users/{user_id}", weight=2)
+async def read_user(ctx: Context, worker: int):
+    return await ctx.client.get(f"/users/{ctx.rng.randint(1, ctx.max_user_id)}")
+
+
+@scenario("GET", "/posts", "page", weight=10)
+async def read_posts_page(ctx: Context, worker: int):
+    return await ctx.client.get("/posts", params={"page": ctx.rng.randint(1, 20), "pageSize": 10})
+
+
+@scenario("GET", "/posts", "cursor", weight=10)
+async def read_posts_cursor(ctx: Context, worker: int):
+    # Each worker keeps scrolling its own feed, restarting from the top after the last page
+    params = {"pageSize": 10, "count": "none"}
+    if ctx.cursors.get(worker):
+        params["cursor"] = ctx.cursors[worker]
+    response = await ctx.client.get("/posts", params=params)
+    if response.status_code == 200:
+        ctx.cursors[worker] = response.json()["data"]["pagination"]["next_cursor"]
+    return response
+
+
+@scenario("GET", "/posts/hot", weight=5)
+async def read_hot_posts(ctx: Context, worker: int):
+    return await ctx.client.get("/posts/hot")
+
+
+async def get_post(ctx: Context, post_id: int, headers: Dict[str, str]) -> httpx.Response:
+    response = await ctx.client.get(f"/posts/{post_id}", headers=headers)
+    if "etag" in response.headers:
+        ctx.etags[post_id] = response.headers["etag"]
+    return response
+
+
+@scenario("GET", "/posts/{post_id}", weight=20)
+async def read_post(ctx: Context, worker: int):
+    return await get_post(ctx, ctx.pick_post(), {})
+
+
+@scenario("GET", "/posts/{post_id}", "revalidate", weight=10)
+async def revalidate_post(ctx: Context, worker: int):
+    # Mostly posts this client has already seen, sent with If-None-Match; 304 on a hit
+    if ctx.etags and ctx.rng.random() < 0.9:
+        post_id = ctx.rng.choice(list(ctx.etags))
+    else:
+        post_id = ctx.pick_post()
+    headers = {"If-None-Match": ctx.etags[post_id]} if post_id in ctx.etags else {}
+    return await get_post(ctx, post_id, headers)
+
+
+@scenario("GET", "/posts/{post_id}/comments", weight=10)
+async def read_post_comments(ctx: Context, worker: int):
+    return await ctx.client.get(f"/posts/{ctx.pick_post()}/comments")
+
+
+@scenario("GET", "/posts/{post_id}/thread", weight=10)
+async def read_post_thread(ctx: Context, worker: int):
+    return await ctx.client.get(f"/posts/{ctx.pick_post()}/thread")
+
+
+@scenario("GET", "/comments/{comment_id}/replies", weight=5)
+async def read_comment_replies(ctx: Context, worker: int):
+    root_id, _ = ctx.rng.choice(ctx.threads)
+    return await ctx.client.get(f"/comments/{root_id}/replies")
+
+
+@scenario("POST", "/posts", weight=1)
+async def create_post(ctx: Context, worker: int):
+    headers = ctx.auth(worker)
+    response = await ctx.client.post(
+        "/posts", json={"title": ctx.next_name(worker), "content": "压测内容 " * 50}, headers=headers
+    )
+    if response.status_code == 201:
+        ctx.created_posts.append((response.json()["data"]["id"], headers))
+    return response
+
+
+@scenario("DELETE", "/posts/{post_id}")
+async def delete_post(ctx: Context, worker: int):
+    # Deletes posts created earlier in the run (as their author); 404 once they run out
+    post_id, headers = ctx.created_posts.pop() if ctx.created_posts else (0, ctx.auth(worker))
+    return await ctx.client.delete(f"/posts/{post_id}", headers=headers)
+
+
+@scenario("POST", "/posts/{post_id}/comments", weight=3)
+async def create_comment(ctx: Context, worker: int):
+    if ctx.rng.random() < 0.5:
+        post_id, body = ctx.pick_post(), {"content": "压测评论"}
+    else:
+        root_id, post_id = ctx.rng.choice(ctx.threads)
+        body = {"content": "压测回复", "parent_id": root_id}
+    headers = ctx.auth(worker)
+    response = await ctx.client.post(f"/posts/{post_id}/comments", json=body, headers=headers)
+    if response.status_code in (201, 202):  # 202: COMMENT_ASYNC_WRITES, queued
+        ctx.created_comments.append((response.json()["data"]["id"], headers))
+    return response
+
+
+@scenario("DELETE", "/comments/{comment_id}")
+async def delete_comment(ctx: Context, worker: int):
+    comment_id, headers = ctx.created_comments.pop() if ctx.created_comments else (0, ctx.auth(worker))
+    return await ctx.client.delete(f"/comments/{comment_id}", headers=headers)
+
+
+@scenario("GET", "/admin/cache/stats")
+async def read_cache_stats(ctx: Context, worker: int):
+    return await ctx.client.get("/admin/cache/stats", headers=ctx.admin)
+
+
+@scenario("GET", "/metrics")
+async def read_metrics(ctx: Context, worker: int):
+    return await ctx.client.get("/metrics")
+
+
+@scenario("GET", "/admin/slow-queries")
+async def read_slow_queries(ctx: Context, worker: int):
+    return await ctx.client.get("/admin/slow-queries", headers=ctx.admin)
+
+
+@scenario("GET", "/admin/admission")
+async def read_admission_status(ctx: Context, worker: int):
+    return await ctx.client.get("/admin/admission", headers=ctx.admin)
+
+
+@scenario("GET", "/admin/comment-queue")
+async def read_comment_queue_status(ctx: Context, worker: int):
+    return await ctx.client.get("/admin/comment-queue", headers=ctx.admin)
+
+
+@scenario("GET", "/admin/bloom")
+async def read_bloom_status(ctx: Context, worker: int):
+    return await ctx.client.get("/admin/bloom", headers=ctx.admin)
+
+
+@scenario("GET", "/admin/profile")
+async def read_profile_report(ctx: Context, worker: int):
+    return await ctx.client.get("/admin/profile", headers=ctx.admin)
+
+
+@scenario("DELETE", "/admin/profile")
+async def reset_profile_report(ctx: Context, worker: int):
+    return await ctx.client.delete("/admin/profile", headers=ctx.admin)
+
+
+def uncovered_routes(app) -> List[str]:
+    """Routes of the app no scenario drives, so a new endpoint cannot silently go unmeasured."""
+    from fastapi.routing import APIRoute
+
+    covered = {(s.method, s.route) for s in SCENARIOS}
+    missing = []
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            missing.extend(f"{m} {route.path}" for m in sorted(route.methods) if (m, route.path) not in covered)
+    return missing
+
+
+# =======================
+# Runner
+# =======================
+def summarize(latencies: List[float], statuses: Counter, wall: float) -> dict:
+    count = len(latencies)
+    ms = sorted(x * 1000 for x in latencies)
+    cuts = statistics.quantiles(ms, n=100, method="inclusive") if count > 1 else ms * 99
+    errors = sum(n for status, n in statuses.items() if status == "exception" or int(status) >= 500)
+    return {
+        "requests": count,
+        "errors": errors,
+        "rps": round(count / wall, 1) if wall else 0.0,
+        "mean_ms": round(statistics.fmean(ms), 2) if ms else None,
+        "p50_ms": round(cuts[49], 2) if ms else None,
+        "p95_ms": round(cuts[94], 2) if ms else None,
+        "p99_ms": round(cuts[98], 2) if ms else None,
+        "max_ms": round(ms[-1], 2) if ms else None,
+        "statuses": dict(sorted(statuses.items())),
+    }
+
+
+async def run_phase(ctx: Context, scenarios: List[Scenario], requests: int, concurrency: int) -> Dict[str, dict]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+    weights = [s.weight or 1 for s in scenarios]
+    remaining = requests
+
+    async def worker(index: int) -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            s = scenarios[0] if len(scenarios) == 1 else ctx.rng.choices(scenarios, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = str((await s.call(ctx, index)).status_code)
+            except Exception as exc:  # noqa: BLE001 - an endpoint blowing up is a result, not a crash
+                status = "exception"
+                print(f"  {s.name}: {exc!r}", file=sys.stderr)
+            latencies[s.name].append(time.perf_counter() - start)
+            statuses[s.name][status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    wall = time.perf_counter() - start
+    results = {name: summarize(latencies[name], statuses[name], wall) for name in sorted(latencies)}
+    if len(scenarios) > 1:
+        results["all"] = summarize(
+            [x for values in latencies.values() for x in values], sum(statuses.values(), Counter()), wall
+        )
+    return results
+
+
+async def prepare(ctx: Context, concurrency: int) -> None:
+    async def token(username: str) -> Dict[str, str]:
+        response = await ctx.client.post("/token", data={"username": username, "password": "x"})
+        response.raise_for_status()
+        return {"Authorization": "Bearer " + response.json()["access_token"]}
+
+    ctx.admin = await token(f"user{bench_backends.BENCH_ADMIN_USER_ID}")
+    ctx.tokens = [await token(f"user{2 + i % max(ctx.max_user_id - 1, 1)}") for i in range(concurrency)]
+
+
+async def sample_ids(limit: int = 2000):
+    from sqlalchemy import func, select
+
+    from my_app import database, models
+
+    async with database.AsyncSessionLocal() as db:
+        max_user_id = (await db.execute(select(func.max(models.User.id)))).scalar() or 1
+        max_post_id = (await db.execute(select(func.max(models.Post.id)))).scalar() or 1
+        recent_posts = (await db.execute(
+            select(models.Post.id)
+            .where(models.Post.is_deleted == False, models.Post.comment_count > 0)
+            .order_by(models.Post.id.desc()).limit(limit)
+        )).scalars().all()
+        threads = (await db.execute(
+            select(models.Comment.id, models.Comment.post_id)
+            .where(models.Comment.parent_id.is_(None), models.Comment.reply_count > 0)
+            .order_by(models.Comment.id.desc()).limit(limit)
+        )).all()
+    return max_user_id, max_post_id, list(recent_posts), [tuple(t) for t in threads]
+
+
+def git_revision() -> dict:
+    def git(*args: str) -> str:
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ""
+    return {"commit": git("rev-parse", "--short", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def print_results(results: Dict[str, dict], baseline: Optional[Dict[str, dict]]) -> None:
+    header = f"{'endpoint':<44}{'reqs':>6}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+    if baseline:
+        header += f"{'Δrps':>8}{'Δp50':>8}{'Δp99':>8}"
+    print(header)
+    for phase, endpoints in results.items():
+        for name, r in endpoints.items():
+            label = name if phase == name else f"{phase}: {name}"
+            line = f"{label:<44}{r['requests']:>6}{r['errors']:>5}{r['rps']:>9.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+            old = (baseline or {}).get(phase, {}).get(name)
+            if old:
+                def delta(key):
+                    return f"{(r[key] - old[key]) / old[key] * 100:+.0f}%" if old[key] else "-"
+                line += f"{delta('rps'):>8}{delta('p50_ms'):>8}{delta('p99_ms'):>8}"
+            print(line)
+
+
+async def run(args, backends: bench_backends.Backends) -> dict:
+    from benchmarks import seed as seeder
+
+    from my_app import database
+    from my_app.main import app
+
+    bench_backends.install(backends)
+    if not args.no_seed:
+        await seeder.seed(
+            backends.database_url, args.users, args.posts, args.comments,
+            deleted_rate=args.deleted_rate, seed_value=args.seed,
+        )
+    await bench_backends.flush_redis()
+
+    missing = uncovered_routes(app)
+    if missing:
+        print("warning: no scenario for " + ", ".join(missing), file=sys.stderr)
+
+    rng = random.Random(args.seed)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        ctx = Context(client, rng, *await sample_ids(), run_tag=f"{time.time_ns() % 10**10:x}")
+        await prepare(ctx, args.concurrency)
+
+        results: Dict[str, Dict[str, dict]] = {}
+        selected = [s for s in SCENARIOS if not args.only or any(word in s.name for word in args.only)]
+        for s in selected:
+            results[s.name] = await run_phase(ctx, [s], args.requests, args.concurrency)
+            print(f"  {s.name}: {results[s.name][s.name]['rps']} req/s", file=sys.stderr)
+        mixed = [s for s in selected if s.weight]
+        if mixed and not args.no_mixed:
+            results["mixed"] = await run_phase(ctx, mixed, args.requests * len(mixed), args.concurrency)
+    await database.engine.dispose()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "backends": backends.describe(),
+            "scale": {"users": ctx.max_user_id, "posts": ctx.max_post_id, "seeded": not args.no_seed},
+            "concurrency": args.concurrency,
+            "requests_per_phase": args.requests,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    bench_backends.add_scale_arguments(parser)
+    parser.add_argument("--no-seed", action="store_true", help="reuse the data already in the database")
+    parser.add_argument("--sqlite", help="SQLite file to use instead of a throwaway one")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=300, help="requests per endpoint phase")
+    parser.add_argument("--only", nargs="+", help="run only scenarios whose name contains one of these")
+    parser.add_argument("--no-mixed", action="store_true")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>-<sha>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    backends = bench_backends.configure(args.sqlite)
+    try:
+        report = asyncio.run(run(args, backends))
+    finally:
+        backends.cleanup()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_results(report["results"], baseline)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{report['meta']['git']['commit'] or 'nogit'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import asyncio
+import math
+import time
+from typing import Dict
+
+from . import metrics
+from . import database
+from .database import settings
+
+# =======================
+# Admission Control
+# =======================
+# 数据库会话依赖 (get_db / get_read_db) 之前的准入闸门，读写各一个：
+#   - 同时持有会话的请求数不超过 concurrency (应与连接池大小匹配)，多余的请求排队
+#   - 排队超过 ADMISSION_MAX_WAIT 秒，或排队人数已达 ADMISSION_MAX_QUEUE，立即拒绝 (503 + Retry-After)
+# 流量高峰时快速失败，而不是让请求在连接池里一直等到前端超时、白白占用数据库。
+# 计数为每个 worker 进程独立；concurrency 为 0 时不限制。
+
+
+class Overloaded(Exception):
+    def __init__(self, gate: "Gate", reason: str):
+        super().__init__(f"{gate.name}: {reason}")
+        self.gate = gate
+        self.reason = reason
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.gate.max_wait))
+
+
+class Gate:
+    def __init__(self, name: str, concurrency: int, max_wait: float, max_queue: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(concurrency) if concurrency > 0 else None
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+
+    def _shed(self, reason: str) -> Overloaded:
+        self.shed += 1
+        metrics.ADMISSION_SHED.labels(self.name, reason).inc()
+        return Overloaded(self, reason)
+
+    async def acquire(self) -> None:
+        """取得一个名额；排队超时或队列已满时抛出 Overloaded"""
+        if self._semaphore is not None:
+            if self._semaphore.locked():
+                if self.max_queue and self.waiting >= self.max_queue:
+                    raise self._shed("queue_full")
+                self.waiting += 1
+                start = time.perf_counter()
+                try:
+                    await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+                except asyncio.TimeoutError:
+                    raise self._shed("timeout") from None
+                finally:
+                    self.waiting -= 1
+                    metrics.ADMISSION_WAIT_SECONDS.labels(self.name).observe(time.perf_counter() - start)
+            else:
+                await self._semaphore.acquire()
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "concurrency": self.concurrency,
+            "max_wait": self.max_wait,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+reads = Gate("read", settings.ADMISSION_READ_CONCURRENCY, settings.ADMISSION_MAX_WAIT, settings.ADMISSION_MAX_QUEUE)
+writes = Gate("write", settings.ADMISSION_WRITE_CONCURRENCY, settings.ADMISSION_MAX_WAIT, settings.ADMISSION_MAX_QUEUE)
+
+for _gate in (reads, writes):
+    metrics.ADMISSION_IN_FLIGHT.labels(_gate.name).set_function(lambda g=_gate: g.in_flight)
+    metrics.ADMISSION_WAITING.labels(_gate.name).set_function(lambda g=_gate: g.waiting)
+
+
+# =======================
+# Connection Pools
+# =======================
+def _pools() -> Dict[str, object]:
+    pools = {"primary": database.engine.sync_engine.pool}
+    for i, replica in enumerate(database.replica_router.replicas):
+        pools[f"replica{i}"] = replica.engine.sync_engine.pool
+    return pools
+
+
+def pool_status() -> Dict[str, Dict[str, int]]:
+    """每个连接池的容量与占用 (QueuePool；内存 SQLite 等其他连接池没有这些数字)"""
+    result = {}
+    for name, pool in _pools().items():
+        if hasattr(pool, "checkedout"):
+            result[name] = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+            }
+    return result
+
+
+# engine.dispose() 会换上新的连接池对象，因此每次抓取时重新取
+for _name, _pool in _pools().items():
+    if hasattr(_pool, "checkedout"):
+        for _state in ("size", "checked_out", "checked_in"):
+            metrics.DB_POOL_CONNECTIONS.labels(_name, _state).set_function(
+                lambda name=_name, state=_state: pool_status().get(name, {}).get(state, 0)
+            )
+
+
+def snapshot() -> dict:
+    return {"read": reads.snapshot(), "write": writes.snapshot(), "pools": pool_status()}
@@ -0,0 +1,70 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+from . import schemas, user_cache
+from .database import settings
+
+# =======================
+# Auth Cache
+# =======================
+# L1 (进程内, LRU + TTL): token -> 用户快照，省去 JWT 解码和用户查询
+# L2: user_id -> 用户快照，取自 user_cache (进程内 LRU + Redis)，未命中时按主键查库
+# L1 条目的过期时间不会晚于 token 自身的 exp；用户失效通知 (pub/sub) 到达时清除该用户的 token。
+
+# token sha256 -> (expires_at, user snapshot)
+_tokens: "OrderedDict[str, Tuple[float, schemas.UserOut]]" = OrderedDict()
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def get_token(token: str) -> Optional[schemas.UserOut]:
+    key = _token_key(token)
+    entry = _tokens.get(key)
+    if entry is None:
+        return None
+    expires_at, user = entry
+    if expires_at <= time.time():
+        _tokens.pop(key, None)
+        return None
+    _tokens.move_to_end(key)
+    return user
+
+
+def put_token(token: str, user: schemas.UserOut, token_exp: Optional[float]) -> None:
+    expires_at = time.time() + settings.AUTH_CACHE_TTL
+    if token_exp is not None:
+        expires_at = min(expires_at, token_exp)
+    key = _token_key(token)
+    _tokens[key] = (expires_at, user)
+    _tokens.move_to_end(key)
+    while len(_tokens) > settings.AUTH_CACHE_SIZE:
+        _tokens.popitem(last=False)
+
+
+async def get_user(user_id: int) -> Optional[schemas.UserOut]:
+    return (await user_cache.get_cached([user_id])).get(user_id)
+
+
+async def put_user(user: schemas.UserOut) -> None:
+    await user_cache.put([user])
+
+
+def _drop_tokens(user_id: Optional[int]) -> None:
+    if user_id is None:
+        _tokens.clear()
+        return
+    for key in [k for k, (_, u) in _tokens.items() if u.id == user_id]:
+        _tokens.pop(key, None)
+
+
+user_cache.on_invalidate(_drop_tokens)
+
+
+async def invalidate_user(user_id: int) -> None:
+    """用户信息变更后调用：清除所有 worker 中该用户的 token 与用户快照"""
+    await user_cache.invalidate(user_id)
@@ -0,0 +1,334 @@
+import asyncio
+import hashlib
+import logging
+import math
+import uuid
+from typing import Dict, Iterable, List, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, metrics, database
+from .database import settings
+from .redis_utils import RedisClient, release_lock
+
+logger = logging.getLogger(__name__)
+
+# =======================
+# Cache Penetration Guard
+# =======================
+# 探测随机 ID 的爬虫 / 客户端产生的请求全部未命中缓存，直接落到数据库。两层拦截：
+#   - Bloom 过滤器 (Redis 位图，每类 ID 一个)：过滤器说 "不存在" 就一定不存在，直接 404，不查库
+#     创建帖子 / 用户 / 评论时加入，python -m my_app.bloom 全量重建 (启动时若未建好也会自动重建一次)
+#   - 否定缓存：查库未找到 (或帖子已软删除) 的 ID 短时间内直接 404 (NEGATIVE_CACHE_TTL)
+#     在从库上未找到时先回主库确认，避免从库延迟把刚创建的 ID 缓存成 404
+# 位数 m 与哈希个数 k 由 BLOOM_EXPECTED_IDS 与 BLOOM_FALSE_POSITIVE_RATE 计算：
+#     m = -n * ln(p) / ln(2)^2,  k = m / n * ln(2)
+# 过滤器只有在全量重建完成 (ready 标记与当前 m:k 一致) 后才参与判断，避免漏加的 ID 被误判为不存在。
+# 漏加 (提交后、加入前进程退出，Redis 异常，绕过接口写入的行) 不能只记在进程内存里：
+#   rebuilt_max 为上次重建开始时表中的最大 ID，max_id 为加入过的最大 ID；
+#   过滤器判 "不存在" 但 ID 落在 (rebuilt_max, max_id] 内时不信任过滤器，回库确认 (再写否定缓存)。
+#   大于 max_id 的 ID 仍直接 404：自增 ID 下，漏加的 ID 在下一次成功加入后即回到回库区间。
+# 本进程内已知的加入失败还会撤下 ready 标记，直到下次重建。Redis 不可用时全部降级为查库。
+# 重建期间新加入的 ID 同时写入 delta 位图，重建结束时与新位图合并后原子替换。
+# 软删除的帖子不在重建后的过滤器中；评论始终保留 (已删除的根评论下可能仍有回复)。
+
+BITS_KEY = "bloom:{kind}"
+DELTA_KEY = "bloom:{kind}:delta"
+READY_KEY = "bloom:{kind}:ready"
+REBUILT_MAX_KEY = "bloom:{kind}:rebuilt_max"
+MAX_ID_KEY = "bloom:{kind}:max_id"
+REBUILD_LOCK_KEY = "bloom:{kind}:rebuild_lock"
+REBUILD_LOCK_TTL_MS = 30 * 60 * 1000
+NEGATIVE_KEY = "missing:{kind}:{id}"
+# Small chunks: hashing runs on the event loop between queries
+REBUILD_CHUNK = 2000
+
+# kind -> (model, only rows matching this are "existing")
+KINDS = {
+    "post": (models.Post, models.Post.is_deleted == False),
+    "user": (models.User, None),
+    "comment": (models.Comment, None),
+}
+
+# KEYS: bits, delta, max id, negative keys...; ARGV: largest id, offsets
+# Marks the id(s) in the filter (and in the delta while a rebuild runs), raises max id
+# and drops their negative entries
+_ADD_LUA = """
+local rebuilding = redis.call('EXISTS', KEYS[2]) == 1
+for i = 2, #ARGV do
+    redis.call('SETBIT', KEYS[1], ARGV[i], 1)
+    if rebuilding then
+        redis.call('SETBIT', KEYS[2], ARGV[i], 1)
+    end
+end
+if tonumber(redis.call('GET', KEYS[3]) or '0') < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[3], ARGV[1])
+end
+for i = 4, #KEYS do
+    redis.call('DEL', KEYS[i])
+end
+return 1
+"""
+
+# KEYS: bits, ready, negative, rebuilt max, max id; ARGV: expected ready value, id, offsets...
+# Returns 'negative', 'unknown' (filter not built), 'absent', 'unverified' (absent, but added after
+# the last rebuild while an add may have been lost: check the DB) or 'maybe'
+_CHECK_LUA = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return 'negative'
+end
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 'unknown'
+end
+for i = 3, #ARGV do
+    if redis.call('GETBIT', KEYS[1], ARGV[i]) == 0 then
+        local id = tonumber(ARGV[2])
+        if id > tonumber(redis.call('GET', KEYS[4]) or '0') and id <= tonumber(redis.call('GET', KEYS[5]) or '0') then
+            return 'unverified'
+        end
+        return 'absent'
+    end
+end
+return 'maybe'
+"""
+
+_scripts: Dict[str, object] = {}
+# Kinds whose add() failed: the filter may miss ids, take it out of service at the next chance
+_dirty: set = set()
+
+
+class BloomStats:
+    """进程内拦截计数 (每个 worker 独立统计)"""
+    rejected: Dict[str, int] = {kind: 0 for kind in KINDS}
+    negative_hits: Dict[str, int] = {kind: 0 for kind in KINDS}
+    # Looked up in the DB and not found (the filter let it through, or was not built yet)
+    db_misses: Dict[str, int] = {kind: 0 for kind in KINDS}
+
+
+def size() -> Tuple[int, int]:
+    """(m 位数, k 哈希个数)"""
+    n = max(settings.BLOOM_EXPECTED_IDS, 1)
+    p = min(max(settings.BLOOM_FALSE_POSITIVE_RATE, 1e-9), 0.5)
+    m = math.ceil(-n * math.log(p) / math.log(2) ** 2)
+    k = max(1, round(m / n * math.log(2)))
+    return m, k
+
+
+def _ready_value() -> str:
+    return "%d:%d" % size()
+
+
+def offsets(item_id: int) -> List[int]:
+    # Double hashing: k positions from one 128-bit digest
+    m, k = size()
+    digest = hashlib.blake2b(str(item_id).encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "big")
+    h2 = int.from_bytes(digest[8:], "big") | 1
+    return [(h1 + i * h2) % m for i in range(k)]
+
+
+def _script(name: str, source: str):
+    redis = RedisClient.get_instance()
+    if name not in _scripts:
+        _scripts[name] = redis.register_script(source)
+    return _scripts[name], redis
+
+
+async def _retire_dirty(redis) -> None:
+    for kind in list(_dirty):
+        await redis.delete(READY_KEY.format(kind=kind))
+        _dirty.discard(kind)
+        logger.warning("bloom: %s filter disabled after a failed add, run a rebuild", kind)
+
+
+async def add(kind: str, ids: Iterable[int]) -> None:
+    """写事务提交后调用：把新 ID 加入过滤器并清除它们的否定缓存"""
+    ids = list(ids)
+    if not settings.BLOOM_FILTER_ENABLED or not ids:
+        return
+    try:
+        script, redis = _script("add", _ADD_LUA)
+        await _retire_dirty(redis)
+        await script(
+            keys=[BITS_KEY.format(kind=kind), DELTA_KEY.format(kind=kind), MAX_ID_KEY.format(kind=kind),
+                  *(NEGATIVE_KEY.format(kind=kind, id=i) for i in ids)],
+            args=[max(ids), *(offset for i in ids for offset in offsets(i))],
+            client=redis,
+        )
+    except RedisError:
+        _dirty.add(kind)
+        try:
+            await _retire_dirty(RedisClient.get_instance())
+        except RedisError:
+            pass  # retried by the next check / add in this process; other processes rely on max_id
+
+
+async def is_missing(kind: str, item_id: int) -> bool:
+    """True = 确定不存在 (过滤器未命中或否定缓存)，可直接 404；False = 需要查库"""
+    if not settings.BLOOM_FILTER_ENABLED:
+        return False
+    try:
+        script, redis = _script("check", _CHECK_LUA)
+        await _retire_dirty(redis)
+        result = await script(
+            keys=[BITS_KEY.format(kind=kind), READY_KEY.format(kind=kind), NEGATIVE_KEY.format(kind=kind, id=item_id),
+                  REBUILT_MAX_KEY.format(kind=kind), MAX_ID_KEY.format(kind=kind)],
+            args=[_ready_value(), item_id, *offsets(item_id)],
+            client=redis,
+        )
+    except RedisError:
+        return False
+    metrics.BLOOM_CHECKS.labels(kind, result).inc()
+    if result == "absent":
+        BloomStats.rejected[kind] += 1
+        return True
+    if result == "negative":
+        BloomStats.negative_hits[kind] += 1
+        return True
+    return False
+
+
+async def _exists(db: AsyncSession, kind: str, item_id: int) -> bool:
+    model, condition = KINDS[kind]
+    stmt = select(model.id).where(model.id == item_id)
+    if condition is not None:
+        stmt = stmt.where(condition)
+    return (await db.execute(stmt)).scalar() is not None
+
+
+async def mark_missing(db: AsyncSession, kind: str, item_id: int) -> None:
+    """在 db 上查库未找到 (或帖子已删除) 后调用：写入否定缓存"""
+    if not settings.BLOOM_FILTER_ENABLED:
+        return
+    if database.is_replica_session(db):
+        async with database.read_session(use_primary=True) as primary:
+            if await _exists(primary, kind, item_id):
+                return  # not replicated yet
+    BloomStats.db_misses[kind] += 1
+    await mark_deleted(kind, item_id)
+
+
+async def mark_deleted(kind: str, item_id: int) -> None:
+    """软删除提交后调用：写入否定缓存 (过滤器无法删除元素)"""
+    if not settings.BLOOM_FILTER_ENABLED:
+        return
+    try:
+        await RedisClient.get_instance().set(
+            NEGATIVE_KEY.format(kind=kind, id=item_id), 1, ex=settings.NEGATIVE_CACHE_TTL
+        )
+    except RedisError:
+        pass
+
+
+async def rebuild(db: AsyncSession, kind: str) -> int:
+    """从数据库全量重建一个过滤器，返回加入的 ID 数；另一个 worker 正在重建时返回 -1"""
+    redis = RedisClient.get_instance()
+    token = uuid.uuid4().hex
+    lock_key = REBUILD_LOCK_KEY.format(kind=kind)
+    if not await redis.set(lock_key, token, nx=True, px=REBUILD_LOCK_TTL_MS):
+        return -1
+
+    bits_key, delta_key = BITS_KEY.format(kind=kind), DELTA_KEY.format(kind=kind)
+    new_key = f"{bits_key}:new"
+    try:
+        # From here on add() also writes to the delta, so ids created during the scan are not lost
+        await redis.setbit(delta_key, 0, 0)
+        m, _ = size()
+        bitmap = bytearray((m + 7) // 8)
+        model, condition = KINDS[kind]
+        # Rows up to here are covered by the scan (or left out on purpose), later ones by the delta
+        scanned_max = (await db.execute(select(func.max(model.id)))).scalar() or 0
+        stmt = select(model.id).order_by(model.id).limit(REBUILD_CHUNK)
+        if condition is not None:
+            stmt = stmt.where(condition)
+        count, last_id = 0, 0
+        while True:
+            ids = (await db.execute(stmt.where(model.id > last_id))).scalars().all()
+            if not ids:
+                break
+            for item_id in ids:
+                for offset in offsets(item_id):
+                    bitmap[offset >> 3] |= 0x80 >> (offset & 7)  # Redis bit 0 is the high bit of byte 0
+            count += len(ids)
+            last_id = ids[-1]
+            await db.rollback()  # don't hold one long read transaction
+
+        await redis.set(new_key, bytes(bitmap))
+        pipe = redis.pipeline(transaction=True)
+        pipe.bitop("OR", new_key, new_key, delta_key)
+        pipe.rename(new_key, bits_key)
+        pipe.delete(delta_key)
+        # Ids up to scanned_max were read from the DB; later ones come from add() (see is_missing)
+        pipe.set(REBUILT_MAX_KEY.format(kind=kind), scanned_max)
+        pipe.set(READY_KEY.format(kind=kind), _ready_value())
+        await pipe.execute()
+        _dirty.discard(kind)
+        return count
+    finally:
+        pipe = redis.pipeline(transaction=False)
+        pipe.delete(new_key, delta_key)
+        await pipe.execute()
+        await release_lock(lock_key, token)
+
+
+async def ensure_built(session_factory) -> None:
+    """启动时：重建尚未建好 (或 m:k 已变化) 的过滤器"""
+    if not settings.BLOOM_FILTER_ENABLED:
+        return
+    for kind in KINDS:
+        try:
+            if await RedisClient.get_instance().get(READY_KEY.format(kind=kind)) == _ready_value():
+                continue
+            async with session_factory() as db:
+                count = await rebuild(db, kind)
+            if count >= 0:
+                logger.info("bloom: built %s filter with %d ids", kind, count)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("bloom: building %s filter failed", kind)
+
+
+async def status() -> dict:
+    """每个过滤器的参数、填充率、按填充率估算的误判率，以及本进程的拦截计数"""
+    redis = RedisClient.get_instance()
+    m, k = size()
+    result = {}
+    for kind in KINDS:
+        ones = await redis.bitcount(BITS_KEY.format(kind=kind))
+        rejected, db_misses = BloomStats.rejected[kind], BloomStats.db_misses[kind]
+        result[kind] = {
+            "ready": await redis.get(READY_KEY.format(kind=kind)) == _ready_value(),
+            # Absent ids in (rebuilt_max_id, max_id] are still looked up in the DB
+            "rebuilt_max_id": int(await redis.get(REBUILT_MAX_KEY.format(kind=kind)) or 0),
+            "max_id": int(await redis.get(MAX_ID_KEY.format(kind=kind)) or 0),
+            "bits": m,
+            "hashes": k,
+            "expected_ids": settings.BLOOM_EXPECTED_IDS,
+            "configured_fpr": settings.BLOOM_FALSE_POSITIVE_RATE,
+            "fill_ratio": round(ones / m, 6),
+            "estimated_fpr": round((ones / m) ** k, 6),
+            "rejected": rejected,
+            "negative_hits": BloomStats.negative_hits[kind],
+            "db_misses": db_misses,
+            # Share of absent ids that still reached the DB (soft-deleted posts count here too)
+            "observed_fpr": round(db_misses / (rejected + db_misses), 6) if rejected + db_misses else 0.0,
+        }
+    return result
+
+
+async def _rebuild_all() -> None:
+    from . import database
+
+    for kind in KINDS:
+        async with database.AsyncSessionLocal() as db:
+            count = await rebuild(db, kind)
+        print(f"{kind}: {'rebuild already running' if count < 0 else f'{count} ids'}")
+    await RedisClient.close()
+
+
+if __name__ == "__main__":
+    # Bulk (re)build of all filters: python -m my_app.bloom
+    asyncio.run(_rebuild_all())
@@ -0,0 +1,237 @@
+import asyncio
+import math
+import random
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from redis.exceptions import RedisError
+
+from . import schemas
+from .database import settings
+from .redis_utils import RedisClient, release_lock
+
+# =======================
+# Post Detail Cache (Cache-Aside)
+# =======================
+# 读：先查 Redis，未命中再查 MySQL 并回填
+# 写：删帖时删除缓存，评论数变化时刷新缓存，阅读数写回后原地累加缓存中的 view_count
+# Redis 不可用时所有操作降级为直接读库，不影响接口可用性
+#
+# 防击穿 (热门帖子过期时不让所有 worker 同时回源)：
+#   - 重建锁：未命中时只有拿到锁的请求查库回填，其他请求短暂等待新值，等不到再直接读库 (不回填)
+#   - 提前刷新 (XFetch)：命中时以随过期临近、随重建耗时 delta 增大的概率提前重建，
+#         -delta * POST_CACHE_XFETCH_BETA * ln(rand()) >= 剩余 TTL
+#     热门 key 通常在过期前就被某个请求 (拿到锁后) 刷新，其余请求继续使用旧值
+# 缓存值为 "delta|json"，delta 为上次重建耗时 (秒)
+
+POST_DETAIL_KEY = "post:detail:{post_id}"
+REBUILD_LOCK_KEY = "post:detail:{post_id}:rebuild"
+REBUILD_LOCK_TTL_MS = 5000
+# How long a miss waits for another worker's rebuild before reading the DB itself
+REBUILD_WAIT_SECONDS = 0.2
+REBUILD_POLL_SECONDS = 0.02
+
+
+# KEYS: detail keys; ARGV: view deltas (same order)
+# Adds the flushed views to cached details in place, keeping their TTL. JSON strings escape their quotes,
+# so the pattern can only match the view_count field itself
+_ADD_VIEWS_LUA = """
+for i, key in ipairs(KEYS) do
+    local raw = redis.call('GET', key)
+    if raw then
+        local updated, n = string.gsub(raw, '"view_count":(%d+)', function(v)
+            return '"view_count":' .. string.format('%d', tonumber(v) + tonumber(ARGV[i]))
+        end, 1)
+        if n == 1 then
+            redis.call('SET', key, updated, 'KEEPTTL')
+        end
+    end
+end
+return 1
+"""
+
+_add_views_script = None
+
+
+class CacheStats:
+    """进程内命中/未命中计数 (每个 worker 独立统计)"""
+    hits: int = 0
+    misses: int = 0
+    errors: int = 0
+    early_refreshes: int = 0
+    rebuild_waits: int = 0
+
+    @classmethod
+    def snapshot(cls) -> dict:
+        lookups = cls.hits + cls.misses
+        return {
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "errors": cls.errors,
+            "early_refreshes": cls.early_refreshes,
+            "rebuild_waits": cls.rebuild_waits,
+            "hit_ratio": round(cls.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _post_key(post_id: int) -> str:
+    return POST_DETAIL_KEY.format(post_id=post_id)
+
+
+def _ttl() -> int:
+    # TTL + random jitter, so keys filled at the same moment do not expire together
+    return settings.POST_CACHE_TTL + random.randint(0, settings.POST_CACHE_TTL_JITTER)
+
+
+def _encode(detail: schemas.PostDetail, delta: float) -> str:
+    return f"{delta:.6f}|{detail.model_dump_json()}"
+
+
+def _decode(raw: str) -> Tuple[schemas.PostDetail, float]:
+    if raw.startswith("{"):
+        return schemas.PostDetail.model_validate_json(raw), 0.0  # written before delta was stored
+    delta, _, payload = raw.partition("|")
+    return schemas.PostDetail.model_validate_json(payload), float(delta)
+
+
+def _refresh_early(delta: float, ttl_ms: int) -> bool:
+    if ttl_ms < 0:
+        return False  # no expiry
+    # 1 - random() is in (0, 1], so log() is defined
+    return -delta * settings.POST_CACHE_XFETCH_BETA * math.log(1.0 - random.random()) >= ttl_ms / 1000
+
+
+async def _read(post_id: int) -> Optional[Tuple[schemas.PostDetail, float, int]]:
+    pipe = RedisClient.get_instance().pipeline(transaction=False)
+    pipe.get(_post_key(post_id))
+    pipe.pttl(_post_key(post_id))
+    raw, ttl_ms = await pipe.execute()
+    if raw is None:
+        return None
+    return (*_decode(raw), ttl_ms)
+
+
+async def _lock(post_id: int) -> Optional[str]:
+    token = uuid.uuid4().hex
+    key = REBUILD_LOCK_KEY.format(post_id=post_id)
+    if await RedisClient.get_instance().set(key, token, nx=True, px=REBUILD_LOCK_TTL_MS):
+        return token
+    return None
+
+
+async def _unlock(post_id: int, token: str) -> None:
+    await release_lock(REBUILD_LOCK_KEY.format(post_id=post_id), token)
+
+
+async def _rebuild(post_id: int, token: str, build: Callable[[], Awaitable[Optional[schemas.PostDetail]]]):
+    try:
+        start = time.perf_counter()
+        detail = await build()
+        if detail is not None:
+            await set_post_detail(detail, time.perf_counter() - start)
+        return detail
+    finally:
+        try:
+            await _unlock(post_id, token)
+        except RedisError:
+            CacheStats.errors += 1
+
+
+async def _wait_for_rebuild(post_id: int) -> Optional[schemas.PostDetail]:
+    CacheStats.rebuild_waits += 1
+    deadline = time.monotonic() + REBUILD_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        await asyncio.sleep(REBUILD_POLL_SECONDS)
+        cached = await _read(post_id)
+        if cached is not None:
+            return cached[0]
+    return None
+
+
+async def get_post_detail(
+    post_id: int,
+    build: Callable[[], Awaitable[Optional[schemas.PostDetail]]],
+    fallback: Optional[Callable[[], Awaitable[Optional[schemas.PostDetail]]]] = None,
+) -> Optional[schemas.PostDetail]:
+    """
+    读取帖子详情缓存，未命中 (或被选中提前刷新) 时用 build() 从数据库重建。
+    同一时刻全集群只有持有重建锁的请求执行 build() 并回填。
+    不回填的直接读库用 fallback() (默认 build)：回填必须读主库，直接读可以走从库。
+    """
+    try:
+        cached = await _read(post_id)
+        if cached is not None:
+            detail, delta, ttl_ms = cached
+            CacheStats.hits += 1
+            if not _refresh_early(delta, ttl_ms):
+                return detail
+            # Chosen to refresh early: whoever gets the lock rebuilds, everyone else keeps the cached value
+            token = await _lock(post_id)
+            if token is None:
+                return detail
+            CacheStats.early_refreshes += 1
+            return await _rebuild(post_id, token, build)
+
+        CacheStats.misses += 1
+        token = await _lock(post_id)
+        if token is not None:
+            return await _rebuild(post_id, token, build)
+        detail = await _wait_for_rebuild(post_id)
+        if detail is not None:
+            return detail
+    except RedisError:
+        CacheStats.errors += 1
+    # Redis down, or the rebuild in another worker is slow: read the DB without filling the cache
+    return await (fallback or build)()
+
+
+async def set_post_detail(detail: schemas.PostDetail, delta: float) -> None:
+    """写入缓存；delta 为构建 detail 的耗时 (秒)，决定提前刷新的概率"""
+    try:
+        await RedisClient.get_instance().set(_post_key(detail.id), _encode(detail, delta), ex=_ttl())
+    except RedisError:
+        CacheStats.errors += 1
+
+
+async def refresh_post_detail(detail: schemas.PostDetail, delta: float) -> None:
+    """只刷新已经在缓存中的帖子，冷数据等下次读取时再回填"""
+    try:
+        await RedisClient.get_instance().set(
+            _post_key(detail.id), _encode(detail, delta), ex=_ttl(), xx=True
+        )
+    except RedisError:
+        CacheStats.errors += 1
+
+
+async def is_post_detail_cached(post_id: int) -> bool:
+    try:
+        return bool(await RedisClient.get_instance().exists(_post_key(post_id)))
+    except RedisError:
+        CacheStats.errors += 1
+        return False
+
+
+async def add_views(deltas: Dict[int, int]) -> None:
+    """
+    阅读数写回数据库后调用：把写回的增量加到已缓存的 view_count 上 (不删除缓存)。
+    读请求在缓存值上叠加的是尚未写回的增量，两者相加即为当前阅读数。
+    """
+    global _add_views_script
+    if not deltas:
+        return
+    try:
+        redis = RedisClient.get_instance()
+        if _add_views_script is None:
+            _add_views_script = redis.register_script(_ADD_VIEWS_LUA)
+        await _add_views_script(
+            keys=[_post_key(post_id) for post_id in deltas], args=list(deltas.values()), client=redis
+        )
+    except RedisError:
+        CacheStats.errors += 1
+
+
+async def invalidate_post_detail(post_id: int) -> None:
+    try:
+        await RedisClient.get_instance().delete(_post_key(post_id))
+    except RedisError:
+        CacheStats.errors += 1
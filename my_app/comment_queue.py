@@ -0,0 +1,395 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas, metrics, cache, counters, ranking, http_cache, post_counters, bloom
+from .redis_utils import RedisClient
+
+logger = logging.getLogger(__name__)
+
+# =======================
+# Async Comment Ingestion
+# =======================
+# COMMENT_ASYNC_WRITES 开启后，发布评论接口只做校验、预留 ID 并追加到 Redis Stream (返回 202)，
+# 由后台消费者批量写库，评论高峰不再是 "每条评论一个写事务"：
+#   - 一批消息: 一条多行 INSERT，root_id 批量解析，根评论回复数、帖子评论数、可见根评论数按帖子/根评论合并累加
+#   - 至少一次投递: 提交后才 XACK；崩溃未确认的消息由其他消费者 XAUTOCLAIM 接管重放
+#   - 幂等: 评论 ID 在入队时预留，重放时已写入的 ID 直接跳过 (与计数在同一事务中，不会重复累加)
+#   - 同一条消息多次失败后移入死信 Stream
+# 已确认的消息随即 XDEL，因此 XLEN 即积压量 (消费滞后)。
+# Redis 不可用时接口退回同步写入。
+#
+# 评论 ID 预留：counters 表中的 comments:ids:reserved 记录已分配出去的最大 ID (不小于 comments 表的最大 ID)，
+# 每个 worker 一次从数据库领取 ID_BLOCK_SIZE 个，在 Redis 中逐个发放；退回同步写入时也从这里领取单个 ID，
+# 因此同步写入的评论不会占用已入队评论的 ID。关闭 COMMENT_ASYNC_WRITES 前需先消费完积压。
+#
+# stream   : 待写入的评论
+# pending  : 已入队未写库的评论 {id: "post_id:root_id"}，供回复尚未落库的评论时校验父评论
+# next_id  : 当前 ID 段中上一个发放的 ID；next_id:end 为该段最后一个 ID
+
+STREAM_KEY = "comments:ingest"
+DEAD_KEY = "comments:ingest:dead"
+PENDING_KEY = "comments:ingest:pending"
+SEQUENCE_KEY = "comments:next_id"
+SEQUENCE_END_KEY = "comments:next_id:end"
+ID_BLOCK_SIZE = 1000
+GROUP = "comment-writers"
+MAX_DELIVERIES = 5
+
+# KEYS: sequence, block end; ARGV: new block (last id before it, last id of it), '' = none
+# 发放当前 ID 段的下一个 ID；段用完时换成 ARGV 中的新段，没有新段则返回 nil (先从数据库领取)
+_RESERVE_LUA = """
+local current = tonumber(redis.call('GET', KEYS[1]))
+local last = tonumber(redis.call('GET', KEYS[2]))
+if not current or not last or current >= last then
+    if ARGV[1] == '' then
+        return nil
+    end
+    redis.call('SET', KEYS[1], ARGV[1])
+    redis.call('SET', KEYS[2], ARGV[2])
+end
+return redis.call('INCR', KEYS[1])
+"""
+
+_reserve_script = None
+
+
+class CommentRejected(Exception):
+    """校验失败 (帖子或父评论不存在)：入队时拒绝；落库时父评论已不存在则移入死信"""
+
+
+class ParentNotWritten(Exception):
+    """父评论还在队列中未落库，消息稍后重试"""
+
+
+class IdConflict(Exception):
+    """消息的评论 ID 已被另一条评论占用 (预留规则被绕过，如关闭异步写入时仍有积压)，移入死信"""
+
+
+async def allocate_ids(db: AsyncSession, n: int) -> int:
+    """从数据库领取 n 个连续的评论 ID (单独提交)，返回第一个"""
+    name = counters.reserved_comment_ids()
+    await counters.bump(db, name, n)
+    # The bump holds the row lock until commit, so the value read back is ours
+    reserved = (await db.execute(select(models.Counter.value).where(models.Counter.name == name))).scalar()
+    # Never hand out ids below rows written without a reservation (e.g. before async writes were enabled)
+    max_id = (await db.execute(select(func.max(models.Comment.id)))).scalar() or 0
+    if reserved - n < max_id:
+        await counters.bump(db, name, max_id - (reserved - n))
+        reserved = max_id + n
+    await db.commit()
+    return reserved - n + 1
+
+
+async def _reserve_id(db: AsyncSession) -> int:
+    global _reserve_script
+    redis = RedisClient.get_instance()
+    if _reserve_script is None:
+        _reserve_script = redis.register_script(_RESERVE_LUA)
+    reserved = await _reserve_script(keys=[SEQUENCE_KEY, SEQUENCE_END_KEY], args=["", ""], client=redis)
+    if reserved is None:
+        # Block used up: take a new one (if another worker installed one meanwhile, ours is skipped)
+        first = await allocate_ids(db, ID_BLOCK_SIZE)
+        reserved = await _reserve_script(
+            keys=[SEQUENCE_KEY, SEQUENCE_END_KEY], args=[first - 1, first + ID_BLOCK_SIZE - 1], client=redis
+        )
+    return int(reserved)
+
+
+async def _resolve_parent(db: AsyncSession, parent_id: int) -> Optional[Tuple[int, int]]:
+    # (post_id, root_id) of a queued or stored comment
+    queued = await RedisClient.get_instance().hget(PENDING_KEY, parent_id)
+    if queued is not None:
+        post_id, root_id = queued.split(":")
+        return int(post_id), int(root_id)
+    row = (await db.execute(
+        select(models.Comment.post_id, models.Comment.root_id).where(models.Comment.id == parent_id)
+    )).first()
+    return (row.post_id, row.root_id) if row is not None else None
+
+
+async def enqueue(db: AsyncSession, comment: schemas.CommentCreate, user_id: int) -> Optional[schemas.CommentCreatedData]:
+    """
+    校验评论并追加到写入队列，返回带预留 ID 的结果。
+    帖子或父评论不存在时抛出 CommentRejected；Redis 不可用时返回 None，由调用方同步写入。
+    """
+    # Only the post is checked against the filter: the parent may still be waiting in the queue
+    if await bloom.is_missing("post", comment.post_id):
+        raise CommentRejected("Post not found")
+    post_exists = (await db.execute(
+        select(models.Post.id).where(models.Post.id == comment.post_id).where(models.Post.is_deleted == False)
+    )).scalar()
+    if post_exists is None:
+        await bloom.mark_missing(db, "post", comment.post_id)
+        raise CommentRejected("Post not found")
+
+    try:
+        parent = None
+        if comment.parent_id is not None:
+            parent = await _resolve_parent(db, comment.parent_id)
+            if parent is None or parent[0] != comment.post_id:
+                raise CommentRejected("Parent comment not found")
+
+        comment_id = await _reserve_id(db)
+        root_id = parent[1] if parent is not None else comment_id
+        pipe = RedisClient.get_instance().pipeline(transaction=True)
+        pipe.xadd(STREAM_KEY, {
+            "id": comment_id,
+            "post_id": comment.post_id,
+            "user_id": user_id,
+            "parent_id": comment.parent_id or "",
+            "reply_to_user_id": comment.reply_to_user_id or "",
+            "content": comment.content,
+        })
+        pipe.hset(PENDING_KEY, comment_id, f"{comment.post_id}:{root_id}")
+        await pipe.execute()
+    except RedisError:
+        logger.warning("comment queue: redis unavailable, writing comment synchronously")
+        return None
+
+    return schemas.CommentCreatedData(
+        id=comment_id, root_id=root_id, parent_id=comment.parent_id, content=comment.content
+    )
+
+
+# =======================
+# Consumer
+# =======================
+def _parse(fields: Dict[str, str]) -> dict:
+    return {
+        "id": int(fields["id"]),
+        "post_id": int(fields["post_id"]),
+        "user_id": int(fields["user_id"]),
+        "parent_id": int(fields["parent_id"]) if fields["parent_id"] else None,
+        "reply_to_user_id": int(fields["reply_to_user_id"]) if fields["reply_to_user_id"] else None,
+        "content": fields["content"],
+    }
+
+
+async def write_batch(db: AsyncSession, entries: List[Tuple[str, Dict[str, str]]]) -> int:
+    """
+    把一批 Stream 消息写入数据库 (一个事务)，返回新写入的评论数；已写入过的消息跳过。
+    评论 ID 已被另一条评论占用时抛出 IdConflict (不改用新 ID：客户端拿到的就是预留的 ID)。
+    """
+    messages = [_parse(fields) for _, fields in entries]
+    if not messages:
+        return 0
+    ids = [m["id"] for m in messages]
+
+    # Redelivered messages: the comment and its counters were committed together, skip both
+    stored = {
+        row.id: tuple(row[1:])
+        for row in (await db.execute(
+            select(
+                models.Comment.id, models.Comment.post_id, models.Comment.user_id,
+                models.Comment.parent_id, models.Comment.content,
+            ).where(models.Comment.id.in_(ids))
+        )).all()
+    }
+    fresh = []
+    for m in messages:
+        if m["id"] not in stored:
+            fresh.append(m)
+        elif stored[m["id"]] != (m["post_id"], m["user_id"], m["parent_id"], m["content"]):
+            raise IdConflict(m["id"])
+    if not fresh:
+        return 0
+
+    # root_id: parents in this batch are resolved in order, the rest in one query
+    batch_ids = {m["id"] for m in fresh}
+    outside = {m["parent_id"] for m in fresh if m["parent_id"] is not None} - batch_ids
+    stored_roots = dict((await db.execute(
+        select(models.Comment.id, models.Comment.root_id).where(models.Comment.id.in_(outside))
+    )).all()) if outside else {}
+    if outside - stored_roots.keys():
+        # A parent still waiting in the queue (e.g. in another consumer's batch): retry later, it gets written first
+        queued = await RedisClient.get_instance().hmget(PENDING_KEY, list(outside - stored_roots.keys()))
+        if any(q is not None for q in queued):
+            raise ParentNotWritten()
+    roots_in_batch: Dict[int, int] = {}
+    for m in fresh:
+        parent = m["parent_id"]
+        if parent is None:
+            m["root_id"] = m["id"]
+        else:
+            m["root_id"] = roots_in_batch.get(parent) or stored_roots.get(parent)
+            if m["root_id"] is None:
+                # Checked by enqueue, so only a lost parent gets here: never turn a reply into a root
+                raise CommentRejected("Parent comment not found")
+        roots_in_batch[m["id"]] = m["root_id"]
+
+    new_roots = {m["id"] for m in fresh if m["root_id"] == m["id"]}
+    replies_per_root = Counter(m["root_id"] for m in fresh if m["root_id"] != m["id"])
+    visible_roots: Dict[int, int] = Counter(m["post_id"] for m in fresh if m["id"] in new_roots)
+
+    await db.execute(insert(models.Comment), [
+        {
+            "id": m["id"],
+            "post_id": m["post_id"],
+            "user_id": m["user_id"],
+            "parent_id": m["parent_id"],
+            "root_id": m["root_id"],
+            "reply_to_user_id": m["reply_to_user_id"],
+            "content": m["content"],
+            "is_deleted": False,
+            # Roots created in this batch get their replies from this batch right away
+            "reply_count": replies_per_root.get(m["id"], 0),
+            "live_reply_count": replies_per_root.get(m["id"], 0),
+        }
+        for m in fresh
+    ])
+
+    # Existing roots: one UPDATE per distinct reply delta, then re-read to see which deleted roots came back
+    by_delta: Dict[int, List[int]] = defaultdict(list)
+    for root_id, n in replies_per_root.items():
+        if root_id not in new_roots:
+            by_delta[n].append(root_id)
+    for n, root_ids in by_delta.items():
+        await db.execute(
+            update(models.Comment)
+            .where(models.Comment.id.in_(root_ids))
+            .values(reply_count=models.Comment.reply_count + n, live_reply_count=models.Comment.live_reply_count + n)
+            .execution_options(synchronize_session=False)
+        )
+    if by_delta:
+        revived = (await db.execute(
+            select(models.Comment.id, models.Comment.post_id, models.Comment.live_reply_count)
+            .where(models.Comment.id.in_([r for root_ids in by_delta.values() for r in root_ids]))
+            .where(models.Comment.is_deleted == True)
+        )).all()
+        for row in revived:
+            if row.live_reply_count == replies_per_root[row.id]:
+                visible_roots[row.post_id] += 1
+
+    per_post = Counter(m["post_id"] for m in fresh)
+    # Replies of revived roots belong to the same post, so visible_roots only has posts of this batch
+    await post_counters.add_many(
+        db, {post_id: (n, 0, visible_roots.get(post_id, 0)) for post_id, n in per_post.items()}
+    )
+    await db.commit()
+
+    await bloom.add("comment", [m["id"] for m in fresh])
+    await counters.invalidate(*(counters.visible_root_comments(p) for p in visible_roots))
+    await http_cache.touch(*(http_cache.post_key(p) for p in per_post))
+    for post_id, n in per_post.items():
+        await ranking.on_comment_created(post_id, n)
+        await cache.invalidate_post_detail(post_id)
+    return len(fresh)
+
+
+async def _ensure_group(redis) -> None:
+    try:
+        await redis.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def _finish(redis, entries: List[Tuple[str, Dict[str, str]]]) -> None:
+    # Acknowledge and drop the messages so XLEN stays equal to the backlog
+    if not entries:
+        return
+    entry_ids = [entry_id for entry_id, _ in entries]
+    pipe = redis.pipeline(transaction=False)
+    pipe.xack(STREAM_KEY, GROUP, *entry_ids)
+    pipe.xdel(STREAM_KEY, *entry_ids)
+    pipe.hdel(PENDING_KEY, *(fields["id"] for _, fields in entries))
+    await pipe.execute()
+    now_ms = time.time() * 1000
+    for entry_id in entry_ids:
+        metrics.COMMENT_INGEST_DELAY_SECONDS.observe(max(now_ms - int(entry_id.split("-")[0]), 0) / 1000)
+
+
+async def _write_one_by_one(session_factory, redis, entries) -> None:
+    # A failed batch is retried message by message so one bad message can't block the stream
+    for entry in entries:
+        try:
+            async with session_factory() as db:
+                written = await write_batch(db, [entry])
+            await _finish(redis, [entry])
+            metrics.COMMENT_INGEST_MESSAGES.labels("written" if written else "duplicate").inc()
+        except RedisError:
+            raise
+        except Exception as e:
+            if isinstance(e, ParentNotWritten):
+                logger.info("comment queue: message %s waits for its parent", entry[0])
+            elif isinstance(e, IdConflict):
+                logger.error("comment queue: comment id %s of message %s is already taken", e, entry[0])
+            elif isinstance(e, CommentRejected):
+                logger.error("comment queue: message %s rejected: %s", entry[0], e)
+            else:
+                logger.exception("comment queue: message %s failed", entry[0])
+            delivered = await redis.xpending_range(STREAM_KEY, GROUP, min=entry[0], max=entry[0], count=1)
+            # A conflict or rejection fails the same way on every retry
+            if isinstance(e, (IdConflict, CommentRejected)) or (delivered and delivered[0]["times_delivered"] >= MAX_DELIVERIES):
+                await redis.xadd(DEAD_KEY, entry[1])
+                await _finish(redis, [entry])
+                metrics.COMMENT_INGEST_MESSAGES.labels("dead").inc()
+                logger.error("comment queue: message %s moved to %s", entry[0], DEAD_KEY)
+
+
+async def consume_once(session_factory, consumer: str, batch_size: int, block_ms: int, claim_idle_ms: int) -> int:
+    """处理一批消息：优先接管空闲超过 claim_idle_ms 的未确认消息，否则读取新消息；返回处理的消息数"""
+    redis = RedisClient.get_instance()
+    await _ensure_group(redis)
+    claimed = await redis.xautoclaim(STREAM_KEY, GROUP, consumer, min_idle_time=claim_idle_ms,
+                                     start_id="0-0", count=batch_size)
+    entries = claimed[1]
+    if not entries:
+        response = await redis.xreadgroup(GROUP, consumer, {STREAM_KEY: ">"}, count=batch_size, block=block_ms)
+        entries = response[0][1] if response else []
+    # XAUTOCLAIM returns None for entries deleted meanwhile
+    entries = [entry for entry in entries if entry[1]]
+    if entries:
+        try:
+            async with session_factory() as db:
+                written = await write_batch(db, entries)
+        except Exception:
+            logger.warning("comment queue: batch of %d failed, retrying one by one", len(entries), exc_info=True)
+            await _write_one_by_one(session_factory, redis, entries)
+        else:
+            await _finish(redis, entries)
+            metrics.COMMENT_INGEST_MESSAGES.labels("written").inc(written)
+            metrics.COMMENT_INGEST_MESSAGES.labels("duplicate").inc(len(entries) - written)
+    metrics.COMMENT_INGEST_BACKLOG.set(await redis.xlen(STREAM_KEY))
+    return len(entries)
+
+
+async def status() -> dict:
+    """积压量、最早一条消息的等待时间与各消费者的未确认数"""
+    redis = RedisClient.get_instance()
+    oldest = await redis.xrange(STREAM_KEY, count=1)
+    try:
+        consumers = await redis.xinfo_consumers(STREAM_KEY, GROUP)
+    except ResponseError:
+        consumers = []  # no stream / group yet
+    return {
+        "backlog": await redis.xlen(STREAM_KEY),
+        "oldest_age_seconds": round(time.time() - int(oldest[0][0].split("-")[0]) / 1000, 3) if oldest else 0,
+        "dead": await redis.xlen(DEAD_KEY),
+        "consumers": {c["name"]: c["pending"] for c in consumers},
+    }
+
+
+async def run_consumer(session_factory, batch_size: int, block_ms: int, claim_idle_ms: int) -> None:
+    """后台任务：持续消费评论写入队列"""
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    while True:
+        try:
+            await consume_once(session_factory, consumer, batch_size, block_ms, claim_idle_ms)
+        except asyncio.CancelledError:
+            raise
+        except RedisError:
+            logger.warning("comment queue: redis unavailable, consumer paused")
+            await asyncio.sleep(1)
+        except Exception:
+            logger.exception("comment queue: consume failed")
+            await asyncio.sleep(1)
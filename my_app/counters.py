@@ -0,0 +1,117 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, database
+from .redis_utils import RedisClient
+
+# =======================
+# Maintained Counters
+# =======================
+# 列表接口的 total 不再每次 COUNT(*)，而是读取 counters 表中由 CRUD 事务维护的计数，
+# 并在 Redis 中缓存。写操作提交后删除对应缓存。
+# 缓存只从主库回填：从库可能落后，回填的旧值会在 Redis 中保留 COUNTER_CACHE_TTL 秒。
+
+COUNTER_CACHE_KEY = "counter:{name}"
+COUNTER_CACHE_TTL = 300
+
+
+def live_posts() -> str:
+    return "posts:live"
+
+
+def live_posts_of_user(user_id: int) -> str:
+    return f"posts:live:user:{user_id}"
+
+
+def visible_root_comments(post_id: int) -> str:
+    return f"comments:roots:post:{post_id}"
+
+
+def reserved_comment_ids() -> str:
+    # Highest comment id handed out by comment_queue.allocate_ids
+    return "comments:ids:reserved"
+
+
+def applied_view_batch() -> str:
+    # Id of the last FLUSHING hash view_counter committed (a marker, not a count)
+    return "views:batch:applied"
+
+
+async def bump(db: AsyncSession, name: str, delta: int) -> None:
+    """在当前事务中原子地调整计数 (不提交)"""
+    table = models.Counter.__table__
+    if db.get_bind().dialect.name == "mysql":
+        stmt = mysql.insert(table).values(name=name, value=delta)
+        stmt = stmt.on_duplicate_key_update(value=table.c.value + delta)
+    else:
+        stmt = sqlite.insert(table).values(name=name, value=delta)
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.name], set_={"value": table.c.value + delta})
+    await db.execute(stmt)
+
+
+# Reads the part of a counter not in its counters row yet (e.g. counter shards) from the given session
+Pending = Callable[[AsyncSession], Awaitable[int]]
+
+
+async def get_value(db: AsyncSession, name: str, pending: Optional[Pending] = None) -> int:
+    return (await get_values(db, [name], {name: pending} if pending is not None else None))[name]
+
+
+async def _load(db: AsyncSession, names: List[str], pending: Dict[str, Pending]) -> Dict[str, int]:
+    # Row and pending part are read in the same transaction, so a concurrent fold is seen entirely or not at all
+    loaded = dict((await db.execute(
+        select(models.Counter.name, models.Counter.value).where(models.Counter.name.in_(names))
+    )).all())
+    for name in names:
+        if name in pending:
+            loaded[name] = loaded.get(name, 0) + await pending[name](db)
+    return loaded
+
+
+async def get_values(
+    db: AsyncSession, names: List[str], pending: Optional[Dict[str, Pending]] = None
+) -> Dict[str, int]:
+    """读取计数：先查 Redis，未命中的再查 counters 表 (主库，加上 pending 中未并入的部分) 并回填"""
+    values: Dict[str, Optional[int]] = dict.fromkeys(names)
+    redis = RedisClient.get_instance()
+    keys = [COUNTER_CACHE_KEY.format(name=n) for n in names]
+    try:
+        for name, raw in zip(names, await redis.mget(keys)):
+            if raw is not None:
+                values[name] = int(raw)
+    except RedisError:
+        pass
+
+    missing = [n for n, v in values.items() if v is None]
+    if not missing:
+        return values
+
+    if database.is_replica_session(db):
+        async with database.read_session(use_primary=True) as primary:
+            loaded = await _load(primary, missing, pending or {})
+    else:
+        loaded = await _load(db, missing, pending or {})
+    for name in missing:
+        values[name] = max(loaded.get(name, 0), 0)
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for name in missing:
+            pipe.set(COUNTER_CACHE_KEY.format(name=name), values[name], ex=COUNTER_CACHE_TTL)
+        await pipe.execute()
+    except RedisError:
+        pass
+    return values
+
+
+async def invalidate(*names: str) -> None:
+    """写事务提交后调用，删除缓存的计数"""
+    if not names:
+        return
+    try:
+        await RedisClient.get_instance().delete(*(COUNTER_CACHE_KEY.format(name=n) for n in names))
+    except RedisError:
+        pass
@@ -1,13 +1,21 @@
+import time
 from typing import List, Optional, Sequence, Dict
 from datetime import datetime
-from sqlalchemy import select, update, desc, func, or_, exists, and_
-from sqlalchemy.orm import aliased
+from sqlalchemy import Row, select, update, desc, func, or_, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, undefer
 
-from . import models, schemas
+from . import database, models, schemas, cache, view_counter, counters, ranking, http_cache, post_counters, singleflight, bloom
+from .pagination import Cursor, encode_cursor
 # from .security import get_password_hash # 导入哈希函数 (Removded for simulation mode)
 
+def _next_cursor(rows: Sequence, page_size: int) -> Optional[str]:
+    # `rows` was fetched with limit page_size + 1; the extra row only signals "has more"
+    if len(rows) <= page_size:
+        return None
+    last = rows[page_size - 1]
+    return encode_cursor(last.created_at, last.id)
+
 # =======================
 # User CRUD
 # =======================
@@ -30,6 +38,7 @@ async def create_user(db: AsyncSession, user: schemas.UserCreate) -> models.User
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    await bloom.add("user", [db_user.id])
     return db_user
 
 async def get_user(db: AsyncSession, user_id: int) -> Optional[models.User]:
@@ -39,83 +48,233 @@ async def get_user(db: AsyncSession, user_id: int) -> Optional[models.User]:
 # =======================
 # Post CRUD
 # =======================
-# =======================
-# Post CRUD
-# =======================
+SNIPPET_LENGTH = 50
+
+# 列表接口 (PostListItem) 需要的列，不含正文
+POST_LIST_COLUMNS = (
+    models.Post.id,
+    models.Post.user_id,
+    models.Post.title,
+    models.Post.content_snippet,
+    models.Post.view_count,
+    models.Post.comment_count,
+    models.Post.created_at,
+)
+
+def make_snippet(content: str) -> str:
+    # 前 50 个字符作为列表摘要
+    return content[:SNIPPET_LENGTH] + "..." if len(content) > SNIPPET_LENGTH else content
+
 async def create_post(db: AsyncSession, post: schemas.PostCreate, user_id: int) -> models.Post:
-    db_post = models.Post(**post.model_dump(), user_id=user_id)
+    db_post = models.Post(**post.model_dump(), content_snippet=make_snippet(post.content), user_id=user_id)
     db.add(db_post)
+    # Keep the feed totals in the same transaction as the insert
+    await counters.bump(db, counters.live_posts(), 1)
+    await counters.bump(db, counters.live_posts_of_user(user_id), 1)
     await db.commit()
     await db.refresh(db_post)
+    await bloom.add("post", [db_post.id])
+    await counters.invalidate(counters.live_posts(), counters.live_posts_of_user(user_id))
+    await ranking.on_post_created(db_post.id, db_post.created_at)
+    await http_cache.touch(http_cache.feed_key())
     return db_post
 
 async def get_post(db: AsyncSession, post_id: int) -> Optional[models.Post]:
     stmt = (
         select(models.Post)
-        .options(selectinload(models.Post.user))
+        .options(selectinload(models.Post.user), undefer(models.Post.content))
         .where(models.Post.id == post_id)
         .where(models.Post.is_deleted == False)
     )
     result = await db.execute(stmt)
-    post = result.scalar_one_or_none()
-    
-    # Increment view count if found (simple implementation)
-    if post:
-        # Note: This is not concurrency safe for high traffic, use atomic update in real prod
-        post.view_count += 1
-        await db.commit()
-        await db.refresh(post)
-    
-    return post
+    # Read-only: views are recorded by view_counter and written back in batches
+    return result.scalar_one_or_none()
 
-async def get_posts(db: AsyncSession, page: int = 1, page_size: int = 10, user_id: Optional[int] = None) -> tuple[Sequence[models.Post], int]:
-    skip = (page - 1) * page_size
-    
-    # Count query
-    count_stmt = select(func.count()).select_from(models.Post).where(models.Post.is_deleted == False)
-    if user_id is not None:
-        count_stmt = count_stmt.where(models.Post.user_id == user_id)
-        
-    total_result = await db.execute(count_stmt)
-    total = total_result.scalar() or 0
+async def _to_post_detail(db: AsyncSession, post: models.Post) -> schemas.PostDetail:
+    # The detail page shows exact counts: add the shards not folded into the posts row yet
+    comments, views, _ = (await post_counters.unfolded(db, [post.id])).get(post.id, (0, 0, 0))
+    return schemas.PostDetail(
+        id=post.id,
+        user_id=post.user_id,
+        title=post.title,
+        content=post.content,
+        view_count=post.view_count + views,
+        comment_count=post.comment_count + comments,
+        created_at=post.created_at
+    )
+
+async def get_post_detail(db: AsyncSession, post_id: int) -> Optional[schemas.PostDetail]:
+    """
+    Cache-aside read for the post detail page.
+    Hit: no MySQL access at all. Miss: load from DB and fill the cache (one rebuild cluster-wide).
+    The returned view_count is the stored value plus views not yet flushed.
+    The cache is filled from the primary: a lagging replica could re-cache a post just deleted.
+    """
+    async def load(session: AsyncSession) -> Optional[schemas.PostDetail]:
+        post = await get_post(session, post_id)
+        return await _to_post_detail(session, post) if post is not None else None
+
+    async def build() -> Optional[schemas.PostDetail]:
+        if not database.is_replica_session(db):
+            return await load(db)
+        async with database.read_session(use_primary=True) as primary:
+            return await load(primary)
+
+    detail = await singleflight.do(
+        ("get_post_detail", db.get_bind(), post_id),
+        lambda: cache.get_post_detail(post_id, build, fallback=lambda: load(db)),
+    )
+    if detail is None:
+        return None
+
+    # Shared with concurrent callers: copy before adding this request's view
+    detail = detail.model_copy()
+    detail.view_count += await record_post_view(post_id)
+    return detail
+
+async def record_post_view(post_id: int) -> int:
+    """Count one view (Redis only); returns the views not yet flushed to the posts table."""
+    pending = await view_counter.record_view(post_id)
+    await ranking.on_post_viewed(post_id)
+    return pending
+
+async def get_posts_by_ids(db: AsyncSession, post_ids: List[int]) -> List[Row]:
+    """Load live posts (POST_LIST_COLUMNS only) by id in one query, keeping the order of `post_ids`."""
+    if not post_ids:
+        return []
+    result = await db.execute(
+        select(*POST_LIST_COLUMNS)
+        .where(models.Post.id.in_(post_ids))
+        .where(models.Post.is_deleted == False)
+    )
+    by_id = {p.id: p for p in result.all()}
+    return [by_id[pid] for pid in post_ids if pid in by_id]
+
+async def get_posts(
+    db: AsyncSession,
+    page: int = 1,
+    page_size: int = 10,
+    user_id: Optional[int] = None,
+    cursor: Optional[Cursor] = None,
+    count_mode: schemas.CountMode = schemas.CountMode.estimated
+) -> tuple[Sequence[Row], Optional[int], Optional[str]]:
+    """
+    Get a page of posts (POST_LIST_COLUMNS only), newest first.
+    With `cursor` the page is located by keyset seek and `page` is ignored.
+    Returns (posts, total, next_cursor); total is None for CountMode.none.
+    Identical concurrent calls share one result.
+    """
+    return await singleflight.do(
+        ("get_posts", db.get_bind(), page, page_size, user_id, cursor, count_mode),
+        lambda: _get_posts(db, page, page_size, user_id, cursor, count_mode),
+    )
+
+async def _get_posts(
+    db: AsyncSession,
+    page: int,
+    page_size: int,
+    user_id: Optional[int],
+    cursor: Optional[Cursor],
+    count_mode: schemas.CountMode
+) -> tuple[Sequence[Row], Optional[int], Optional[str]]:
+    total: Optional[int] = None
+    if count_mode == schemas.CountMode.exact:
+        count_stmt = select(func.count()).select_from(models.Post).where(models.Post.is_deleted == False)
+        if user_id is not None:
+            count_stmt = count_stmt.where(models.Post.user_id == user_id)
+        total_result = await db.execute(count_stmt)
+        total = total_result.scalar() or 0
+    elif count_mode == schemas.CountMode.estimated:
+        name = counters.live_posts() if user_id is None else counters.live_posts_of_user(user_id)
+        total = await counters.get_value(db, name)
     
     # Data query
     stmt = (
-        select(models.Post)
+        select(*POST_LIST_COLUMNS)
         # .options(selectinload(models.Post.user)) # Optimize: Load user if we want to show author name
         .where(models.Post.is_deleted == False)
     )
     
     if user_id is not None:
         stmt = stmt.where(models.Post.user_id == user_id)
-        
-    stmt = (
-        stmt.order_by(desc(models.Post.created_at), desc(models.Post.id))
-        .offset(skip)
-        .limit(page_size)
-    )
-    result = await db.execute(stmt)
-    posts = result.scalars().all()
+
+    stmt = stmt.order_by(desc(models.Post.created_at), desc(models.Post.id))
+    if cursor is not None:
+        stmt = stmt.where(tuple_(models.Post.created_at, models.Post.id) < tuple_(*cursor))
+    else:
+        stmt = stmt.offset((page - 1) * page_size)
+
+    # Fetch one extra row to know whether there is a next page
+    result = await db.execute(stmt.limit(page_size + 1))
+    posts = result.all()
     
-    return posts, total
+    return posts[:page_size], total, _next_cursor(posts, page_size)
 
 async def delete_post(db: AsyncSession, post_id: int) -> bool:
+    owner_id = (await db.execute(
+        select(models.Post.user_id)
+        .where(models.Post.id == post_id)
+        .where(models.Post.is_deleted == False)
+    )).scalar_one_or_none()
+    if owner_id is None:
+        return False
+
     stmt = (
         update(models.Post)
         .where(models.Post.id == post_id)
+        .where(models.Post.is_deleted == False)  # only the first delete moves the counters
         .values(is_deleted=True)
     )
     result = await db.execute(stmt)
+    deleted = result.rowcount > 0
+    if deleted:
+        await counters.bump(db, counters.live_posts(), -1)
+        await counters.bump(db, counters.live_posts_of_user(owner_id), -1)
     await db.commit()
-    return result.rowcount > 0
+    if deleted:
+        await bloom.mark_deleted("post", post_id)
+    await cache.invalidate_post_detail(post_id)
+    await counters.invalidate(counters.live_posts(), counters.live_posts_of_user(owner_id))
+    await ranking.on_post_deleted(post_id)
+    await http_cache.touch(http_cache.feed_key(), http_cache.post_key(post_id))
+    return deleted
 
 
 # =======================
 # Comment CRUD
 # =======================
-async def create_comment(db: AsyncSession, comment: schemas.CommentCreate, user_id: int) -> models.Comment:
-    # 1. Prepare base data
+# 评论列表 (CommentListItem) 需要的列；列表查询返回行而不是 ORM 对象，可在并发调用者之间共享
+COMMENT_LIST_COLUMNS = (
+    models.Comment.id,
+    models.Comment.user_id,
+    models.Comment.reply_to_user_id,
+    models.Comment.parent_id,
+    models.Comment.root_id,
+    models.Comment.content,
+    models.Comment.is_deleted,
+    models.Comment.live_reply_count,
+    models.Comment.created_at,
+)
+
+class ParentNotFound(Exception):
+    """The parent of a reply does not exist or belongs to another post."""
+
+
+async def create_comment(
+    db: AsyncSession, comment: schemas.CommentCreate, user_id: int, comment_id: Optional[int] = None
+) -> models.Comment:
+    """Raises ParentNotFound for a reply whose parent is unknown or on another post."""
+    # 0. A reply needs a parent on the same post: otherwise it would be neither listed as a root
+    #    nor counted under one, yet move the visible root counter
+    parent_comment = None
+    if comment.parent_id is not None:
+        parent_comment = await db.get(models.Comment, comment.parent_id)
+        if parent_comment is None or parent_comment.post_id != comment.post_id:
+            raise ParentNotFound(comment.parent_id)
+
+    # 1. Prepare base data (comment_id: an id reserved by comment_queue.allocate_ids, otherwise auto-increment)
     db_comment = models.Comment(
+        id=comment_id,
         post_id=comment.post_id,
         user_id=user_id,
         content=comment.content,
@@ -129,67 +288,94 @@ async def create_comment(db: AsyncSession, comment: schemas.CommentCreate, user_
     await db.flush() 
     
     # 3. Handle root_id logic
+    # A root becomes visible in the list when created, or when a deleted root gets its first live reply
+    root_became_visible = False
     if comment.parent_id is None:
         # It's a root comment, root_id = its own id
         db_comment.root_id = db_comment.id
+        root_became_visible = True
     else:
-        # It's a reply, find the parent's root_id
-        parent_comment = await db.get(models.Comment, comment.parent_id)
-        if parent_comment:
-            db_comment.root_id = parent_comment.root_id
-        else:
-            # Fallback or Error? Assuming parent exists or validation caught it.
-            # If parent doesn't exist, this might be invalid. 
-            # For robustness we effectively treat it as root or raise error.
-            db_comment.root_id = db_comment.id 
-            
-    # 4. Update Post stats (comment_count)
-    # Using specific update statement avoids race conditions better than obj.count += 1
-    await db.execute(
-        update(models.Post)
-        .where(models.Post.id == comment.post_id)
-        .values(comment_count=models.Post.comment_count + 1)
-    )
+        # It's a reply, take the parent's root_id (the parent was checked above)
+        db_comment.root_id = parent_comment.root_id
+        root = await _bump_reply_counts(db, parent_comment.root_id, 1)
+        if root is not None and root.is_deleted:
+            root_became_visible = root.live_reply_count == 1
+
+    # 4. Update Post stats (comment_count, visible root comments)
+    # Increment a random counter shard instead of the posts / counters row, so commenters on a hot post
+    # don't queue on one row lock; the shards are folded back in the background
+    await post_counters.add(db, comment.post_id, comments=1, roots=1 if root_became_visible else 0)
     
     await db.commit()
     await db.refresh(db_comment)
+    await bloom.add("comment", [db_comment.id])
+    if root_became_visible:
+        await counters.invalidate(counters.visible_root_comments(comment.post_id))
+    await ranking.on_comment_created(comment.post_id)
+    await http_cache.touch(http_cache.post_key(comment.post_id))
+
+    # 5. Refresh cached post detail so the new comment_count is visible
+    if await cache.is_post_detail_cached(comment.post_id):
+        start = time.perf_counter()
+        post = await db.get(models.Post, comment.post_id, options=[undefer(models.Post.content)], populate_existing=True)
+        if post is not None and not post.is_deleted:
+            detail = await _to_post_detail(db, post)
+            await cache.refresh_post_detail(detail, time.perf_counter() - start)
     return db_comment
 
 async def get_root_comments(
-    db: AsyncSession, post_id: int, page: int = 1, page_size: int = 10, sort: str = "newest"
-) -> tuple[Sequence[models.Comment], int]:
+    db: AsyncSession,
+    post_id: int,
+    page: int = 1,
+    page_size: int = 10,
+    sort: str = "newest",
+    cursor: Optional[Cursor] = None,
+    count_mode: schemas.CountMode = schemas.CountMode.estimated
+) -> tuple[Sequence[Row], Optional[int], Optional[str]]:
     """
-    Get paginated root comments for a post.
+    Get paginated root comments for a post (COMMENT_LIST_COLUMNS only).
+    With `cursor` the page is located by keyset seek and `page` is ignored.
+    Returns (comments, total, next_cursor); total is None for CountMode.none.
+    Identical concurrent calls share one result: rows, not ORM objects, so no session is shared.
     """
-    skip = (page - 1) * page_size
-    
-    # Define condition: Valid if not deleted OR (deleted but has active children)
-    # We need an alias for the subquery to correlate properly
-    ChildComment = aliased(models.Comment)
-    
-    # Subquery to check for valid children
-    has_valid_children = exists(
-        select(1)
-        .where(ChildComment.root_id == models.Comment.id)
-        .where(ChildComment.parent_id != None) # Must be a child
-        .where(ChildComment.is_deleted == False)
+    return await singleflight.do(
+        ("get_root_comments", db.get_bind(), post_id, page, page_size, sort, cursor, count_mode),
+        lambda: _get_root_comments(db, post_id, page, page_size, sort, cursor, count_mode),
     )
 
+async def _get_root_comments(
+    db: AsyncSession,
+    post_id: int,
+    page: int,
+    page_size: int,
+    sort: str,
+    cursor: Optional[Cursor],
+    count_mode: schemas.CountMode
+) -> tuple[Sequence[Row], Optional[int], Optional[str]]:
+    # Define condition: Valid if not deleted OR (deleted but has active children)
+    # live_reply_count is maintained by create_comment/delete_comment, so no correlated subquery
     filter_condition = or_(
         models.Comment.is_deleted == False,
-        and_(models.Comment.is_deleted == True, has_valid_children)
+        models.Comment.live_reply_count > 0
     )
 
     # Count root comments
-    count_stmt = (
-        select(func.count())
-        .select_from(models.Comment)
-        .where(models.Comment.post_id == post_id)
-        .where(models.Comment.parent_id == None)
-        .where(filter_condition)
-    )
-    total_result = await db.execute(count_stmt)
-    total = total_result.scalar() or 0
+    total: Optional[int] = None
+    if count_mode == schemas.CountMode.exact:
+        count_stmt = (
+            select(func.count())
+            .select_from(models.Comment)
+            .where(models.Comment.post_id == post_id)
+            .where(models.Comment.parent_id == None)
+            .where(filter_condition)
+        )
+        total_result = await db.execute(count_stmt)
+        total = total_result.scalar() or 0
+    elif count_mode == schemas.CountMode.estimated:
+        # The counters row plus the shards not folded into it yet
+        total = await counters.get_value(
+            db, counters.visible_root_comments(post_id), pending=lambda s: post_counters.unfolded_roots(s, post_id)
+        )
     
     # Determine ordering
     # if sort == "hottest":
@@ -200,65 +386,160 @@ async def get_root_comments(
     order_clause = desc(models.Comment.created_at)
 
     # Fetch data
+    # Authors are not loaded here: callers resolve them in one batch from user_cache
     stmt = (
-        select(models.Comment)
-        .options(selectinload(models.Comment.user))
+        select(*COMMENT_LIST_COLUMNS)
         .where(models.Comment.post_id == post_id)
         .where(models.Comment.parent_id == None)  # Root comments only
         .where(filter_condition)
         .order_by(order_clause, desc(models.Comment.id))
-        .offset(skip)
-        .limit(page_size)
     )
-    result = await db.execute(stmt)
-    return result.scalars().all(), total
+    if cursor is not None:
+        stmt = stmt.where(tuple_(models.Comment.created_at, models.Comment.id) < tuple_(*cursor))
+    else:
+        stmt = stmt.offset((page - 1) * page_size)
+
+    result = await db.execute(stmt.limit(page_size + 1))
+    comments = result.all()
+    return comments[:page_size], total, _next_cursor(comments, page_size)
 
 async def delete_comment(db: AsyncSession, comment_id: int) -> bool:
+    db_comment = await db.get(models.Comment, comment_id)
+    if db_comment is None or db_comment.is_deleted:
+        return False
+
     stmt = (
         update(models.Comment)
         .where(models.Comment.id == comment_id)
+        .where(models.Comment.is_deleted == False)  # only the first delete moves the counters
         .values(is_deleted=True)
     )
     result = await db.execute(stmt)
+    deleted = result.rowcount > 0
+
+    # A root leaves the list once it is deleted and has no live replies left
+    root_became_hidden = False
+    if deleted:
+        if db_comment.parent_id is None:
+            root = await db.get(models.Comment, comment_id, populate_existing=True)
+            root_became_hidden = root.live_reply_count == 0
+        elif db_comment.root_id is not None and db_comment.root_id != comment_id:
+            root = await _bump_reply_counts(db, db_comment.root_id, -1)
+            if root is not None and root.is_deleted:
+                root_became_hidden = root.live_reply_count == 0
+        if root_became_hidden:
+            await post_counters.add(db, db_comment.post_id, roots=-1)
+
     await db.commit()
-    return result.rowcount > 0
+    if root_became_hidden:
+        await counters.invalidate(counters.visible_root_comments(db_comment.post_id))
+    if deleted:
+        await http_cache.touch(http_cache.post_key(db_comment.post_id))
+    return deleted
+
+async def _bump_reply_counts(db: AsyncSession, root_id: int, live_delta: int) -> Optional[models.Comment]:
+    """
+    Atomically adjust the denormalized reply counters on a root comment (no commit).
+    A new reply bumps both counters, a deleted reply only the live one (never below 0).
+    Returns the root re-read after the update, i.e. with the counters this transaction wrote,
+    or None when nothing was updated.
+    """
+    stmt = update(models.Comment).where(models.Comment.id == root_id)
+    values = {"live_reply_count": models.Comment.live_reply_count + live_delta}
+    if live_delta > 0:
+        values["reply_count"] = models.Comment.reply_count + live_delta
+    else:
+        stmt = stmt.where(models.Comment.live_reply_count + live_delta >= 0)
+    result = await db.execute(stmt.values(**values).execution_options(synchronize_session=False))
+    if result.rowcount == 0:
+        return None
+    return await db.get(models.Comment, root_id, populate_existing=True)
 
 async def get_replies_by_root_id(
-    db: AsyncSession, root_id: int
-) -> Sequence[models.Comment]:
+    db: AsyncSession, root_id: int, limit: int = 20, after: Optional[Cursor] = None
+) -> tuple[Sequence[Row], Optional[str]]:
     """
-    Get all child replies for a specific root comment.
+    Get a page of child replies (COMMENT_LIST_COLUMNS only) for a specific root comment, oldest first.
+    `after` is the keyset cursor of the last reply already shown.
+    Returns (replies, next_cursor); next_cursor is None when there are no more.
+    Identical concurrent calls share one result (rows, not ORM objects).
     """
+    return await singleflight.do(
+        ("get_replies_by_root_id", db.get_bind(), root_id, limit, after),
+        lambda: _get_replies_by_root_id(db, root_id, limit, after),
+    )
+
+async def _get_replies_by_root_id(
+    db: AsyncSession, root_id: int, limit: int, after: Optional[Cursor]
+) -> tuple[Sequence[Row], Optional[str]]:
     stmt = (
-        select(models.Comment)
-        .options(
-            selectinload(models.Comment.user),
-            selectinload(models.Comment.reply_to_user)
-        )
+        select(*COMMENT_LIST_COLUMNS)
         .where(models.Comment.root_id == root_id)
         .where(models.Comment.parent_id != None) # Only children
         .where(models.Comment.is_deleted == False)
         .order_by(models.Comment.created_at.asc(), models.Comment.id.asc())
     )
-    result = await db.execute(stmt)
-    return result.scalars().all()
+    if after is not None:
+        stmt = stmt.where(tuple_(models.Comment.created_at, models.Comment.id) > tuple_(*after))
+
+    result = await db.execute(stmt.limit(limit + 1))
+    replies = result.all()
+    return replies[:limit], _next_cursor(replies, limit)
+
+async def get_first_replies(
+    db: AsyncSession, root_ids: List[int], per_root: int
+) -> Dict[int, tuple[List[models.Comment], Optional[str]]]:
+    """
+    The first `per_root` live replies (oldest first) of each root, in one window-function query.
+    Authors and reply-to users are not loaded (resolve them with user_cache).
+    Returns {root_id: (replies, next_cursor)}; next_cursor continues with get_replies_by_root_id.
+    """
+    if not root_ids or per_root <= 0:
+        return {}
+
+    rn = func.row_number().over(
+        partition_by=models.Comment.root_id,
+        order_by=(models.Comment.created_at.asc(), models.Comment.id.asc()),
+    ).label("rn")
+    ranked = (
+        select(models.Comment.id, rn)
+        .where(models.Comment.root_id.in_(root_ids))
+        .where(models.Comment.parent_id != None)
+        .where(models.Comment.is_deleted == False)
+        .subquery()
+    )
+    # One extra row per root tells whether there are more replies
+    result = await db.execute(
+        select(models.Comment)
+        .join(ranked, ranked.c.id == models.Comment.id)
+        .where(ranked.c.rn <= per_root + 1)
+    )
+    replies = result.scalars().all()
+
+    grouped: Dict[int, List[models.Comment]] = {}
+    for r in replies:
+        grouped.setdefault(r.root_id, []).append(r)
+
+    first: Dict[int, tuple[List[models.Comment], Optional[str]]] = {}
+    for root_id, rows in grouped.items():
+        rows.sort(key=lambda r: (r.created_at, r.id))
+        first[root_id] = (rows[:per_root], _next_cursor(rows, per_root))
+    return first
 
 async def count_replies_for_roots(
     db: AsyncSession, root_ids: List[int]
 ) -> Dict[int, int]:
     """
     Get existing reply counts for a list of root IDs.
+    Reads the denormalized live_reply_count, so this is a primary key lookup.
     Returns a dict {root_id: count}
     """
     if not root_ids:
         return {}
         
     stmt = (
-        select(models.Comment.root_id, func.count())
-        .where(models.Comment.root_id.in_(root_ids))
-        .where(models.Comment.parent_id != None)
-        .where(models.Comment.is_deleted == False)
-        .group_by(models.Comment.root_id)
+        select(models.Comment.id, models.Comment.live_reply_count)
+        .where(models.Comment.id.in_(root_ids))
     )
     result = await db.execute(stmt)
     # result.all() returns list of (root_id, count) tuples
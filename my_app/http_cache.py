@@ -0,0 +1,113 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from redis.exceptions import RedisError
+
+from .database import settings
+from .redis_utils import RedisClient
+
+# =======================
+# HTTP Conditional GET
+# =======================
+# 每个资源在 Redis 中有一个版本戳 (最后修改时间，纳秒)，写操作时更新：
+#     stamp:feed          帖子列表：发帖 / 删帖 / 阅读数写回
+#     stamp:post:{id}     帖子详情与评论列表：发评论 / 删评论 / 删帖
+# ETag 由版本戳和查询参数算出，If-None-Match 命中时直接 304，不查数据库。
+# 版本戳缺失 (首次访问或被淘汰) 时写入当前时间，不会与旧 ETag 冲突；Redis 不可用时不输出校验头。
+# 校验在查库之前执行：Bloom 过滤器 / 否定缓存确定不存在的帖子先排除，If-None-Match: * 不视为命中；
+# 读取时补写的版本戳带过期时间 (CREATED_STAMP_TTL)，过滤器漏过的不存在 ID 不会在 Redis 中留下永久的 key；
+# 过期后重新生成，客户端只是多一次完整响应。
+
+FEED_STAMP_KEY = "stamp:feed"
+POST_STAMP_KEY = "stamp:post:{post_id}"
+CREATED_STAMP_TTL = 3600
+
+
+def feed_key() -> str:
+    return FEED_STAMP_KEY
+
+
+def post_key(post_id: int) -> str:
+    return POST_STAMP_KEY.format(post_id=post_id)
+
+
+async def touch(*keys: str) -> None:
+    """写操作提交后调用，更新版本戳"""
+    if not keys:
+        return
+    stamp = time.time_ns()
+    try:
+        pipe = RedisClient.get_instance().pipeline(transaction=False)
+        for key in keys:
+            pipe.set(key, stamp)
+        await pipe.execute()
+    except RedisError:
+        pass
+
+
+async def _get_stamps(keys: List[str]) -> Optional[List[int]]:
+    redis = RedisClient.get_instance()
+    try:
+        values = await redis.mget(keys)
+        missing = [k for k, v in zip(keys, values) if v is None]
+        if missing:
+            stamp = time.time_ns()
+            pipe = redis.pipeline(transaction=False)
+            for key in missing:
+                pipe.set(key, stamp, nx=True, ex=CREATED_STAMP_TTL)
+            await pipe.execute()
+            values = await redis.mget(keys)
+    except RedisError:
+        return None
+    if any(v is None for v in values):
+        return None
+    return [int(v) for v in values]
+
+
+class Validators:
+    def __init__(self, etag: str, last_modified: datetime):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": format_datetime(self.last_modified, usegmt=True),
+            # 浏览器每次都带 ETag 回源校验 (写入后立刻可见)；CDN 等共享缓存可直接复用 HTTP_CACHE_MAX_AGE 秒
+            "Cache-Control": f"public, max-age=0, s-maxage={settings.HTTP_CACHE_MAX_AGE}, must-revalidate",
+        }
+
+    def matches(self, request: Request) -> bool:
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            # If-None-Match 优先于 If-Modified-Since；弱比较。
+            # "*" 只在资源存在时成立，校验发生在查库之前无法确认，按不匹配处理 (返回完整响应)
+            tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+            return self.etag.removeprefix("W/") in tags
+        if_modified_since = request.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            return self.last_modified.replace(microsecond=0) <= since
+        return False
+
+
+async def validators(request: Request, keys: List[str]) -> Optional[Validators]:
+    """按版本戳和查询参数生成 ETag / Last-Modified；Redis 不可用时返回 None"""
+    stamps = await _get_stamps(keys)
+    if stamps is None:
+        return None
+    digest = hashlib.sha1()
+    digest.update(request.url.path.encode())
+    digest.update(str(sorted(request.query_params.multi_items())).encode())
+    digest.update(",".join(map(str, stamps)).encode())
+    last_modified = datetime.fromtimestamp(max(stamps) / 1e9, tz=timezone.utc)
+    return Validators(f'W/"{digest.hexdigest()[:20]}"', last_modified)
@@ -1,13 +1,48 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from typing import List, Dict, Optional
-from fastapi import FastAPI, Depends, HTTPException, status, APIRouter
+from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, Query, Request, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from redis.exceptions import RedisError
 from sqlalchemy.ext.asyncio import AsyncSession
-from . import crud, schemas, database, models, security
+from . import crud, schemas, database, models, security, cache, view_counter, pagination, auth_cache, ranking, read_your_writes, metrics, profiling, http_cache, rate_limit, admission, comment_queue, user_cache, bloom
+from .responses import ORJSONResponse, ok
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = database.settings
+    background_tasks = [
+        # 定期把 Redis 中累积的阅读数写回数据库，并把评论数/阅读数分片折叠回 posts
+        asyncio.create_task(view_counter.run_flusher(database.AsyncSessionLocal, settings.VIEW_FLUSH_INTERVAL)),
+        # 定期裁剪热度榜，只保留前 HOT_POSTS_MAX 个帖子
+        asyncio.create_task(ranking.run_compactor(settings.HOT_COMPACT_INTERVAL, settings.HOT_POSTS_MAX)),
+        # 首次部署 (或 Redis 清空后) 从 posts 表补录热度榜
+        asyncio.create_task(ranking.ensure_backfilled(database.AsyncSessionLocal)),
+        # 接收用户信息失效通知，清除本进程的用户缓存
+        asyncio.create_task(user_cache.run_invalidation_listener()),
+        # 首次启动 (或 Bloom 参数变化) 时从数据库重建过滤器，建好之前不参与判断
+        asyncio.create_task(bloom.ensure_built(database.AsyncSessionLocal)),
+    ]
+    if settings.COMMENT_ASYNC_WRITES:
+        # 消费评论写入队列，批量写库
+        background_tasks.append(asyncio.create_task(comment_queue.run_consumer(
+            database.AsyncSessionLocal, settings.COMMENT_STREAM_BATCH,
+            settings.COMMENT_STREAM_BLOCK_MS, settings.COMMENT_STREAM_CLAIM_IDLE_MS,
+        )))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    # 退出前写回最后一批
+    async with database.AsyncSessionLocal() as db:
+        await view_counter.flush_views(db)
 
 app = FastAPI(
     title="学习社区 API",
     description="支持帖子发布、软删除及二级嵌套评论系统的 API 接口。",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS 配置
@@ -31,8 +66,85 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Dependency
-get_db = database.get_db
+@app.middleware("http")
+async def pin_writers_to_primary(request: Request, call_next):
+    # 写请求成功后，把该用户的后续读请求短暂固定到主库
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        user_id = getattr(request.state, "user_id", None)
+        if user_id is not None:
+            await read_your_writes.pin(user_id)
+    return response
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    # 管理员带 X-Profile 头 (或 ?profile=) 时剖析本次请求；另按 PROFILE_SAMPLE_RATE 抽样累加热点报告
+    mode = profiling.requested_mode(request)
+    if mode is not None and not is_admin(token_user_id(request)):
+        mode = None
+    if mode is None and not profiling.should_sample():
+        return await call_next(request)
+
+    response, profiler = await profiling.run(request, call_next, inline=mode == "inline")
+    if profiler is None:
+        return response
+    if mode is None:
+        profiling.add_sample(profiler)
+    elif mode == "inline":
+        return profiling.inline_response(profiler, response.status_code)
+    else:
+        response.headers["X-Profile-Id"] = profiling.save(profiler)
+    return response
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    # 记录每个路由的延迟、SQL 条数和 DB 耗时；DEBUG 模式下通过响应头直接暴露 SQL 条数，方便发现 N+1
+    stats = metrics.start_request()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        # 用路由模板 (/posts/{post_id}) 而不是实际路径做标签，未匹配的路径归为一类
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        metrics.observe_request(request.method, route_path, status_code, time.perf_counter() - start, stats)
+    if database.settings.DEBUG:
+        response.headers["X-DB-Query-Count"] = str(stats.queries)
+        response.headers["X-DB-Time-Ms"] = f"{stats.db_seconds * 1000:.1f}"
+    return response
+
+# =======================
+# DB Session Dependencies
+# =======================
+# 两个会话依赖都先经过准入控制 (admission)：名额用尽且排队超时，直接返回 503，不再等待连接池
+async def admit(gate: admission.Gate) -> None:
+    try:
+        await gate.acquire()
+    except admission.Overloaded as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+async def get_db():
+    """主库会话 (写接口、登录态校验)"""
+    await admit(admission.writes)
+    try:
+        async with database.AsyncSessionLocal() as session:
+            yield session
+    finally:
+        admission.writes.release()
+
+# 子回复分批加载：单次请求最多返回的条数，保证大楼层下每个请求的内存有上限
+REPLIES_DEFAULT_LIMIT = 20
+REPLIES_MAX_LIMIT = 100
+# 评论串接口默认随根评论返回的子回复条数
+THREAD_DEFAULT_REPLIES = 3
+# 帖子 / 根评论列表的每页条数上限 (pageSize 超出范围返回 422)
+PAGE_SIZE_MAX = 100
 
 # OAuth2 方案 (Token URL指向登录接口)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -41,29 +153,222 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 # Authentication Dependency
 # =======================
 async def get_current_user(
+    request: Request,
     token: str = Depends(oauth2_scheme), 
     db: AsyncSession = Depends(get_db)
 ) -> models.User:
     """
     核心依赖：验证 Token 并返回当前用户对象
+    命中认证缓存时不解码 JWT、不查库；未命中时按 token 中的 uid 主键查询
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    cached = auth_cache.get_token(token)
+    if cached is not None:
+        request.state.user_id = cached.id
+        return models.User(**cached.model_dump())
+
     try:
         payload = security.jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
         username: str = payload.get("sub")
+        user_id: Optional[int] = payload.get("uid")
         if username is None:
             raise credentials_exception
     except security.JWTError:
         raise credentials_exception
-        
-    user = await crud.get_user_by_username(db, username=username)
-    if user is None:
+
+    snapshot = await auth_cache.get_user(user_id) if user_id is not None else None
+    if snapshot is None:
+        if user_id is not None:
+            user = await crud.get_user(db, user_id=user_id)
+        else:
+            # Tokens issued before the uid claim existed
+            user = await crud.get_user_by_username(db, username=username)
+        if user is None:
+            raise credentials_exception
+        snapshot = schemas.UserOut.model_validate(user)
+        await auth_cache.put_user(snapshot)
+
+    # The token was issued for this username; a renamed user must log in again
+    if snapshot.username != username:
         raise credentials_exception
-    return user
+
+    auth_cache.put_token(token, snapshot, payload.get("exp"))
+    request.state.user_id = snapshot.id
+    return models.User(**snapshot.model_dump())
+
+def is_admin(user_id: Optional[int]) -> bool:
+    admin_ids = {int(i) for i in database.settings.ADMIN_USER_IDS.split(",") if i.strip()}
+    return user_id in admin_ids
+
+async def get_admin_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+    """运维接口：只允许 ADMIN_USER_IDS 中的用户 (管理员，也可删除任意评论) 访问"""
+    if not is_admin(current_user.id):
+        raise HTTPException(status_code=403, detail="Admin only")
+    return current_user
+
+def token_user_id(request: Request) -> Optional[int]:
+    """从 Authorization 头中取出用户 ID (只验签，不查库)，匿名或无效 token 返回 None"""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    cached = auth_cache.get_token(token)
+    if cached is not None:
+        return cached.id
+    try:
+        payload = security.jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
+    except security.JWTError:
+        return None
+    return payload.get("uid")
+
+async def get_read_db(request: Request):
+    """
+    只读接口的数据库会话：轮询健康的从库。
+    用户刚写入过 (READ_YOUR_WRITES_SECONDS 内) 时固定走主库，保证读到自己的写入。
+    """
+    user_id = token_user_id(request)
+    use_primary = user_id is not None and await read_your_writes.is_pinned(user_id)
+    await admit(admission.reads)
+    try:
+        async with database.read_session(use_primary=use_primary) as session:
+            yield session
+    finally:
+        admission.reads.release()
+
+# =======================
+# Rate Limiting
+# =======================
+def rate_limited(name: str, spec: str, by: str = "user"):
+    """
+    令牌桶限流依赖，超限返回 429 + Retry-After。
+    by="user" 按登录用户计数 (匿名请求按 IP)，by="ip" 按客户端 IP 计数。
+    """
+    rule = rate_limit.Rule.parse(name, spec)
+
+    async def dependency(request: Request, response: Response):
+        if rule is None:
+            return
+        user_id = token_user_id(request) if by == "user" else None
+        identity = f"user:{user_id}" if user_id is not None else f"ip:{request.client.host if request.client else '-'}"
+        decision = await rate_limit.hit(rule, identity)
+        if not decision.allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers=decision.headers(rule),
+            )
+        response.headers.update(decision.headers(rule))
+
+    return Depends(dependency)
+
+# =======================
+# Conditional GET
+# =======================
+# 在打开数据库会话之前比较 ETag：命中时抛出 304 (只访问 Redis)，否则返回校验头交给接口写入响应
+async def check_not_modified(request: Request, keys: List[str], on_not_modified=None) -> Optional[http_cache.Validators]:
+    validators = await http_cache.validators(request, keys)
+    if validators is not None and validators.matches(request):
+        if on_not_modified is not None:
+            await on_not_modified()
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators.headers())
+    return validators
+
+async def feed_validators(request: Request) -> Optional[http_cache.Validators]:
+    return await check_not_modified(request, [http_cache.feed_key()])
+
+async def post_validators(request: Request, post_id: int) -> Optional[http_cache.Validators]:
+    # 确定不存在的帖子不生成版本戳，接口照常查库 (返回空列表)
+    if await bloom.is_missing("post", post_id):
+        return None
+    return await check_not_modified(request, [http_cache.post_key(post_id)])
+
+async def post_detail_validators(request: Request, post_id: int) -> Optional[http_cache.Validators]:
+    # 先排除确定不存在 / 刚删除的帖子 (直接 404，不生成版本戳、不记阅读)；304 也算一次阅读
+    if await bloom.is_missing("post", post_id):
+        raise HTTPException(status_code=404, detail="Post not found")
+    return await check_not_modified(
+        request, [http_cache.post_key(post_id)], on_not_modified=lambda: crud.record_post_view(post_id)
+    )
+
+def with_validators(response: Response, validators: Optional[http_cache.Validators]) -> Response:
+    if validators is not None:
+        response.headers.update(validators.headers())
+    return response
+
+def parse_cursor(cursor: Optional[str]) -> Optional[pagination.Cursor]:
+    try:
+        return pagination.decode_cursor(cursor)
+    except pagination.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# =======================
+# Row Projections
+# =======================
+# 列表接口的快速序列化：ORM 行直接投影成与 schemas 同结构的 dict，交给 responses.ok() 输出
+def to_post_list_item(p, pending_views: int = 0) -> dict:
+    """schemas.PostListItem，p 为 crud.POST_LIST_COLUMNS 的一行"""
+    return {
+        "title": p.title,
+        "id": p.id,
+        "user_id": p.user_id,
+        "content_snippet": p.content_snippet,
+        "view_count": p.view_count + pending_views,
+        "comment_count": p.comment_count,
+        "created_at": p.created_at,
+    }
+
+def to_user_out(u: Optional[schemas.UserOut]) -> Optional[dict]:
+    """schemas.UserOut"""
+    if u is None:
+        return None
+    return {"username": u.username, "avatar_url": u.avatar_url, "id": u.id, "created_at": u.created_at}
+
+async def resolve_comment_users(db: AsyncSession, comments) -> Dict[int, schemas.UserOut]:
+    """评论作者与被回复者，从用户缓存批量解析 (L1 -> 一次 MGET -> 一次 IN 查询)"""
+    user_ids = set()
+    for c in comments:
+        user_ids.add(c.user_id)
+        if c.reply_to_user_id is not None:
+            user_ids.add(c.reply_to_user_id)
+    return await user_cache.get_users(db, user_ids)
+
+def to_comment_list_item(c, users: Dict[int, schemas.UserOut], reply_count: int = 0) -> dict:
+    """schemas.CommentListItem (replies 不内联返回)；c 为 crud.COMMENT_LIST_COLUMNS 行或 ORM 评论，users 为 resolve_comment_users 的结果"""
+    return {
+        "id": c.id,
+        "user": to_user_out(users.get(c.user_id)),
+        "reply_to_user": to_user_out(users.get(c.reply_to_user_id)),
+        "content": c.content,
+        "created_at": c.created_at,
+        "is_deleted": c.is_deleted,
+        "parent_id": c.parent_id,
+        "root_id": c.root_id,
+        "replies": [],
+        "reply_count": reply_count,
+    }
+
+def to_root_comment_item(root, users: Dict[int, schemas.UserOut]) -> dict:
+    """根评论 (reply_count 取反范式化的 live_reply_count)"""
+    root_item = to_comment_list_item(root, users, reply_count=root.live_reply_count)
+    # Edge Case A: Root deleted but has children
+    if root.is_deleted:
+        root_item["content"] = "该评论已删除"
+        root_item["user"] = None
+    return root_item
+
+def to_pagination(page: int, page_size: int, total: Optional[int], next_cursor: Optional[str],
+                  total_root_comments: Optional[int] = None) -> dict:
+    """schemas.PaginationData"""
+    return {
+        "page": page,
+        "pageSize": page_size,
+        "total": total,
+        "total_root_comments": total_root_comments,
+        "next_cursor": next_cursor,
+    }
 
 # =======================
 # Routers
@@ -71,11 +376,13 @@ async def get_current_user(
 user_router = APIRouter(prefix="/users", tags=["用户管理"])
 post_router = APIRouter(prefix="/posts", tags=["帖子管理"])
 comment_router = APIRouter(tags=["评论管理"]) 
+admin_router = APIRouter(prefix="/admin", tags=["运维"], dependencies=[Depends(get_admin_user)])
 
 # =======================
 # Auth / Login Endpoint
 # =======================
-@app.post("/token", response_model=schemas.Token, summary="用户登录")
+@app.post("/token", response_model=schemas.Token, summary="用户登录",
+          dependencies=[rate_limited("login", database.settings.RATE_LIMIT_LOGIN, by="ip")])
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(), 
     db: AsyncSession = Depends(get_db)
@@ -91,13 +398,14 @@ async def login_for_access_token(
         )
     
     # 2. 生成 Token
-    access_token = security.create_access_token(data={"sub": user.username})
+    access_token = security.create_access_token(data={"sub": user.username, "uid": user.id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 # =======================
 # Users Endpoints
 # =======================
-@user_router.post("", response_model=schemas.ResponseModel[schemas.UserOut], summary="创建用户")
+@user_router.post("", response_model=schemas.ResponseModel[schemas.UserOut], summary="创建用户",
+                  dependencies=[rate_limited("signup", database.settings.RATE_LIMIT_SIGNUP, by="ip")])
 async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     """创建新用户"""
     # 检查用户名是否存在
@@ -113,17 +421,21 @@ async def read_users_me(current_user: models.User = Depends(get_current_user)):
     return schemas.ResponseModel(data=current_user)
 
 @user_router.get("/{user_id}", response_model=schemas.ResponseModel[schemas.UserOut], summary="获取用户详情")
-async def read_user(user_id: int, db: AsyncSession = Depends(get_db)):
-    """根据ID获取用户信息"""
-    db_user = await crud.get_user(db, user_id=user_id)
+async def read_user(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    """根据ID获取用户信息 (两级用户缓存；不存在的 ID 由 Bloom 过滤器 / 否定缓存拦截)"""
+    if await bloom.is_missing("user", user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    db_user = await user_cache.get_user(db, user_id)
     if db_user is None:
+        await bloom.mark_missing(db, "user", user_id)
         raise HTTPException(status_code=404, detail="User not found")
     return schemas.ResponseModel(data=db_user)
 
 # =======================
 # Posts Endpoints
 # =======================
-@post_router.post("", response_model=schemas.ResponseModel[schemas.PostCreatedData], status_code=201, summary="发布帖子")
+@post_router.post("", response_model=schemas.ResponseModel[schemas.PostCreatedData], status_code=201, summary="发布帖子",
+                  dependencies=[rate_limited("post", database.settings.RATE_LIMIT_POST)])
 async def create_post(
     post: schemas.PostCreate, 
     db: AsyncSession = Depends(get_db),
@@ -143,54 +455,57 @@ async def create_post(
 
 @post_router.get("", response_model=schemas.ResponseModel[schemas.PaginatedList[schemas.PostListItem]], summary="获取帖子列表")
 async def read_posts(
-    page: int = 1, 
-    pageSize: int = 10, 
+    page: int = Query(1, ge=1),
+    pageSize: int = Query(10, ge=1, le=PAGE_SIZE_MAX),
     user_id: Optional[int] = None,
-    db: AsyncSession = Depends(get_db)
+    cursor: Optional[str] = None,
+    count: schemas.CountMode = schemas.CountMode.estimated,
+    validators: Optional[http_cache.Validators] = Depends(feed_validators),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """获取分页的帖子列表"""
-    posts, total = await crud.get_posts(db, page=page, page_size=pageSize, user_id=user_id)
+    """
+    获取分页的帖子列表 (传入 cursor 时按游标翻页，忽略 page)
+    - count=estimated：total 取自维护的计数器 (默认)
+    - count=exact：实时 COUNT(*)
+    - count=none：不返回 total
+    """
+    posts, total, next_cursor = await crud.get_posts(
+        db, page=page, page_size=pageSize, user_id=user_id, cursor=parse_cursor(cursor), count_mode=count
+    )
+    pending_views = await view_counter.pending_views(p.id for p in posts)
     
-    post_list = []
-    for p in posts:
-        # Create snippet (first 50 chars)
-        snippet = p.content[:50] + "..." if len(p.content) > 50 else p.content
-        item = schemas.PostListItem(
-            id=p.id,
-            user_id=p.user_id,
-            title=p.title,
-            content_snippet=snippet,
-            view_count=p.view_count,
-            comment_count=p.comment_count,
-            created_at=p.created_at
-        )
-        post_list.append(item)
+    post_list = [to_post_list_item(p, pending_views.get(p.id, 0)) for p in posts]
 
-    return schemas.ResponseModel(
-        data=schemas.PaginatedList(
-            pagination=schemas.PaginationData(page=page, pageSize=pageSize, total=total),
-            list=post_list
-        )
-    )
+    return with_validators(ok({
+        "pagination": to_pagination(page, pageSize, total, next_cursor),
+        "list": post_list,
+    }), validators)
+
+@post_router.get("/hot", response_model=schemas.ResponseModel[List[schemas.PostListItem]], summary="热门帖子")
+async def read_hot_posts(
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """按时间衰减热度排序的帖子 (Redis 有序集合取 ID + 一次批量查询)"""
+    post_ids = await ranking.top_post_ids(limit)
+    posts = await crud.get_posts_by_ids(db, post_ids)
+    pending_views = await view_counter.pending_views(p.id for p in posts)
+    return ok([to_post_list_item(p, pending_views.get(p.id, 0)) for p in posts])
 
 @post_router.get("/{post_id}", response_model=schemas.ResponseModel[schemas.PostDetail], summary="获取帖子详情")
-async def read_post(post_id: int, db: AsyncSession = Depends(get_db)):
-    """获取单篇帖子的完整内容"""
-    db_post = await crud.get_post(db, post_id=post_id)
-    if db_post is None:
+async def read_post(
+    post_id: int,
+    validators: Optional[http_cache.Validators] = Depends(post_detail_validators),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """获取单篇帖子的完整内容 (优先读取 Redis 缓存；If-None-Match 命中时返回 304；不存在的 ID 不查库)"""
+    # 确定不存在的 ID 已在 post_detail_validators 中返回 404
+    post_detail = await crud.get_post_detail(db, post_id=post_id)
+    if post_detail is None:
+        await bloom.mark_missing(db, "post", post_id)
         raise HTTPException(status_code=404, detail="Post not found")
-        
-    return schemas.ResponseModel(
-        data=schemas.PostDetail(
-            id=db_post.id,
-            user_id=db_post.user_id,
-            title=db_post.title,
-            content=db_post.content,
-            view_count=db_post.view_count,
-            comment_count=db_post.comment_count,
-            created_at=db_post.created_at
-        )
-    )
+
+    return with_validators(ok(post_detail.model_dump()), validators)
 
 @post_router.delete("/{post_id}", response_model=schemas.ResponseModel, summary="删除帖子")
 async def delete_post(
@@ -200,8 +515,11 @@ async def delete_post(
 ):
     """软删除帖子 (仅限作者)"""
     # 1. 先查帖子
+    if await bloom.is_missing("post", post_id):
+        raise HTTPException(status_code=404, detail="Post not found")
     db_post = await crud.get_post(db, post_id=post_id)
     if not db_post:
+        await bloom.mark_missing(db, "post", post_id)
         raise HTTPException(status_code=404, detail="Post not found")
     
     # 2. 权限检查：当前用户ID 是否等于 帖子作者ID
@@ -216,10 +534,12 @@ async def delete_post(
 # =======================
 # Comments Endpoints
 # =======================
-@comment_router.post("/posts/{post_id}/comments", response_model=schemas.ResponseModel[schemas.CommentCreatedData], status_code=201, summary="发布评论")
+@comment_router.post("/posts/{post_id}/comments", response_model=schemas.ResponseModel[schemas.CommentCreatedData], status_code=201, summary="发布评论",
+                     dependencies=[rate_limited("comment", database.settings.RATE_LIMIT_COMMENT)])
 async def create_comment(
     post_id: int, 
     comment: schemas.CommentCreate, 
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user) # 必须登录
 ):
@@ -227,12 +547,29 @@ async def create_comment(
     发布评论（支持根评论和子回复）。
     - parent_id 为空：根评论
     - parent_id 有值：子回复
+
+    开启 COMMENT_ASYNC_WRITES 时评论进入写入队列，返回 202 与预留的评论 ID，稍后才出现在列表中。
     """
     # Override post_id in schema with path param to be safe/consistent
     comment.post_id = post_id
+
+    comment_id = None
+    if database.settings.COMMENT_ASYNC_WRITES:
+        try:
+            queued = await comment_queue.enqueue(db, comment, user_id=current_user.id)
+        except comment_queue.CommentRejected as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        if queued is not None:
+            response.status_code = 202
+            return schemas.ResponseModel(code=202, msg="accepted", data=queued)
+        # Redis 不可用，同步写入：ID 与队列从同一处预留，不会占用已入队评论的 ID
+        comment_id = await comment_queue.allocate_ids(db, 1)
     
     # 使用当前登录用户
-    db_comment = await crud.create_comment(db=db, comment=comment, user_id=current_user.id)
+    try:
+        db_comment = await crud.create_comment(db=db, comment=comment, user_id=current_user.id, comment_id=comment_id)
+    except crud.ParentNotFound:
+        raise HTTPException(status_code=404, detail="Parent comment not found")
     
     return schemas.ResponseModel(
         code=201,
@@ -248,69 +585,97 @@ async def create_comment(
 @comment_router.get("/posts/{post_id}/comments", response_model=schemas.ResponseModel[schemas.CommentListResponse], summary="获取评论列表")
 async def read_post_comments(
     post_id: int, 
-    page: int = 1, 
-    pageSize: int = 10, 
+    page: int = Query(1, ge=1),
+    pageSize: int = Query(10, ge=1, le=PAGE_SIZE_MAX),
     sort: str = "newest",
-    db: AsyncSession = Depends(get_db)
+    cursor: Optional[str] = None,
+    count: schemas.CountMode = schemas.CountMode.estimated,
+    validators: Optional[http_cache.Validators] = Depends(post_validators),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     获取帖子下的评论列表（仅返回根评论 + 回复数量）。
+    传入 cursor 时按游标翻页，忽略 page；count 含义同帖子列表。
     """
     # 1. Get roots and total count
-    root_comments, total = await crud.get_root_comments(db, post_id=post_id, page=page, page_size=pageSize, sort=sort)
-    
-    # 2. Get reply counts
-    root_ids = [c.id for c in root_comments]
-    reply_counts_map = await crud.count_replies_for_roots(db, root_ids)
+    root_comments, total, next_cursor = await crud.get_root_comments(
+        db, post_id=post_id, page=page, page_size=pageSize, sort=sort,
+        cursor=parse_cursor(cursor), count_mode=count
+    )
     
-    # 3. Assemble
-    root_list: List[schemas.CommentListItem] = []
+    # 2. Assemble (reply counts are denormalized on the root row, authors come from the user cache)
+    users = await resolve_comment_users(db, root_comments)
+    root_list = [to_root_comment_item(root, users) for root in root_comments]
+
+    return with_validators(ok({
+        "pagination": to_pagination(page, pageSize, total, next_cursor, total_root_comments=total),
+        "list": root_list,
+    }), validators)
+
+@comment_router.get("/posts/{post_id}/thread", response_model=schemas.ResponseModel[schemas.ThreadResponse], summary="获取评论串")
+async def read_post_thread(
+    post_id: int,
+    page: int = Query(1, ge=1),
+    pageSize: int = Query(10, ge=1, le=PAGE_SIZE_MAX),
+    sort: str = "newest",
+    cursor: Optional[str] = None,
+    count: schemas.CountMode = schemas.CountMode.estimated,
+    replies: int = Query(THREAD_DEFAULT_REPLIES, ge=0, le=REPLIES_MAX_LIMIT),
+    validators: Optional[http_cache.Validators] = Depends(post_validators),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    一次返回一页根评论及每个根评论的前 replies 条子回复 (按时间正序)。
+    子回复由一条窗口函数查询取出，作者信息从用户缓存批量解析；
+    replies_next_cursor 不为空时，用 /comments/{id}/replies?after= 继续加载。
+    """
+    root_comments, total, next_cursor = await crud.get_root_comments(
+        db, post_id=post_id, page=page, page_size=pageSize, sort=sort,
+        cursor=parse_cursor(cursor), count_mode=count
+    )
+    first_replies = await crud.get_first_replies(db, [root.id for root in root_comments], per_root=replies)
+    users = await resolve_comment_users(
+        db, [*root_comments, *(r for thread, _ in first_replies.values() for r in thread)]
+    )
+
+    root_list = []
     for root in root_comments:
-        root_item = schemas.CommentListItem.model_validate(root)
-        root_item.reply_count = reply_counts_map.get(root.id, 0)
-        root_item.replies = [] # No replies returned initially
-        
-        # Edge Case A: Root deleted but has children
-        if root.is_deleted:
-            root_item.content = "该评论已删除"
-            root_item.user = None
-            
+        root_item = to_root_comment_item(root, users)
+        thread, replies_cursor = first_replies.get(root.id, ([], None))
+        root_item["replies"] = [to_comment_list_item(r, users) for r in thread]
+        root_item["replies_next_cursor"] = replies_cursor
         root_list.append(root_item)
 
-    return schemas.ResponseModel(
-        data=schemas.CommentListResponse(
-            pagination=schemas.PaginationData(
-                page=page, 
-                pageSize=pageSize, 
-                total=total, 
-                total_root_comments=total
-            ),
-            list=root_list
-        )
-    )
+    return with_validators(ok({
+        "pagination": to_pagination(page, pageSize, total, next_cursor, total_root_comments=total),
+        "list": root_list,
+    }), validators)
 
-@comment_router.get("/comments/{comment_id}/replies", response_model=schemas.ResponseModel[List[schemas.CommentListItem]], summary="获取子回复")
+@comment_router.get("/comments/{comment_id}/replies", response_model=schemas.ResponseModel[schemas.ReplyListResponse], summary="获取子回复")
 async def read_comment_replies(
     comment_id: int,
-    db: AsyncSession = Depends(get_db)
+    limit: int = Query(REPLIES_DEFAULT_LIMIT, ge=1, le=REPLIES_MAX_LIMIT),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
-    获取指定根评论下的所有子回复
+    分批获取指定根评论下的子回复 (按时间正序)
+    - limit：每批条数，服务端上限 REPLIES_MAX_LIMIT
+    - after：上一批返回的 next_cursor
     """
-    # Check if root exists (optional, but good for 404)
-    # For performance we might skip, but let's be safe
-    # db_comment = await db.get(models.Comment, comment_id)
-    # if not db_comment: ...
-    
-    replies = await crud.get_replies_by_root_id(db, root_id=comment_id)
+    if await bloom.is_missing("comment", comment_id):
+        # 不存在的根评论：与查库结果一致，返回空列表
+        return ok({"list": [], "has_more": False, "next_cursor": None})
+    replies, next_cursor = await crud.get_replies_by_root_id(
+        db, root_id=comment_id, limit=limit, after=parse_cursor(after)
+    )
     
-    # Convert to schema
-    reply_list = []
-    for r in replies:
-        item = schemas.CommentListItem.model_validate(r)
-        reply_list.append(item)
-        
-    return schemas.ResponseModel(data=reply_list)
+    users = await resolve_comment_users(db, replies)
+    return ok({
+        "list": [to_comment_list_item(r, users) for r in replies],
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor,
+    })
 
 @comment_router.delete("/comments/{comment_id}", response_model=schemas.ResponseModel, summary="删除评论")
 async def delete_comment(
@@ -318,27 +683,30 @@ async def delete_comment(
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user) # 必须登录
 ):
-    """软删除评论 (仅限作者或管理员-id=1)"""
+    """软删除评论 (仅限作者、帖子作者或管理员 ADMIN_USER_IDS)"""
     # 1. 查评论
     # 我们需要获取评论详情来检查作者，这里简单用 db.get 
+    if await bloom.is_missing("comment", comment_id):
+        raise HTTPException(status_code=404, detail="Comment not found")
     db_comment = await db.get(models.Comment, comment_id)
+    if db_comment is None:
+        await bloom.mark_missing(db, "comment", comment_id)
     
     if not db_comment or db_comment.is_deleted:
         raise HTTPException(status_code=404, detail="Comment not found")
         
     # 2. 权限检查
-    # userid=1为管理员，可以删除所有人的评论，且自己的帖子下可以删除别人的评论
+    # 管理员 (ADMIN_USER_IDS，默认 1) 可以删除所有人的评论，且自己的帖子下可以删除别人的评论
     # 逻辑：
-    # if current_user.id == 1: pass (Admin)
+    # if is_admin(current_user.id): pass (Admin)
     # elif current_user.id == db_comment.user_id: pass (Owner)
     # elif (current_user.id == post_owner_id): pass (Post Owner - need to fetch post)
     
     # 按照需求: "删除时，代码先对比 db_obj.user_id == current_user.id，如果不是本人则报 403 错误。userid=1为管理员，可以删除所有人的评论，且自己的帖子下可以删除别人的评论"
     
-    is_admin = (current_user.id == 1)
     is_author = (current_user.id == db_comment.user_id)
     
-    if is_admin or is_author:
+    if is_admin(current_user.id) or is_author:
         pass # Allow
     else:
         # Check Post Owner
@@ -354,7 +722,64 @@ async def delete_comment(
          raise HTTPException(status_code=404, detail="Comment not found")
     return schemas.ResponseModel(msg="success")
 
+# =======================
+# Admin Endpoints
+# =======================
+@admin_router.get("/cache/stats", summary="缓存命中率")
+async def read_cache_stats():
+    """帖子详情缓存与用户缓存 (L1 进程内 / L2 Redis) 的命中计数 (当前 worker 进程)"""
+    return schemas.ResponseModel(data={
+        "post_detail": cache.CacheStats.snapshot(),
+        "user_profile": user_cache.UserCacheStats.snapshot(),
+    })
+
+@admin_router.get("/slow-queries", summary="慢查询日志")
+async def read_slow_queries(limit: int = Query(50, ge=1, le=500)):
+    """最近的慢查询 (当前 worker 进程)，新的在前；被采样的 SELECT 带有 EXPLAIN 结果"""
+    log = database.slow_query_log
+    return schemas.ResponseModel(data={
+        "threshold_ms": database.settings.SLOW_QUERY_MS,
+        "queries": log.recent(limit),
+    })
+
+@admin_router.get("/admission", summary="准入控制与连接池状态")
+async def read_admission_status():
+    """读/写闸门的在途数、排队数、已放行与拒绝数，以及各连接池占用 (当前 worker 进程)"""
+    return schemas.ResponseModel(data=admission.snapshot())
+
+@admin_router.get("/comment-queue", summary="评论写入队列状态")
+async def read_comment_queue_status():
+    """积压的评论数、最早一条的等待秒数、死信数与各消费者未确认的消息数"""
+    try:
+        return schemas.ResponseModel(data=await comment_queue.status())
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Redis unavailable")
+
+@admin_router.get("/bloom", summary="Bloom 过滤器状态")
+async def read_bloom_status():
+    """各过滤器是否可用、填充率与估算误判率，以及本进程拦截 / 否定缓存命中 / 漏到数据库的次数"""
+    try:
+        return schemas.ResponseModel(data=await bloom.status())
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Redis unavailable")
+
+@admin_router.get("/profile", summary="抽样剖析报告")
+async def read_profile_report(top: int = Query(None, ge=1, le=500)):
+    """按 PROFILE_SAMPLE_RATE 抽样的请求累加后的热点函数 (按累计耗时排序，当前 worker 进程)"""
+    return schemas.ResponseModel(data=profiling.sampled_report(top or database.settings.PROFILE_TOP))
+
+@admin_router.delete("/profile", summary="清空抽样剖析报告")
+async def reset_profile_report():
+    profiling.reset_samples()
+    return schemas.ResponseModel(msg="Profile samples cleared")
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    """Prometheus 抓取入口 (当前 worker 进程)"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # Register Routers
 app.include_router(user_router)
 app.include_router(post_router)
 app.include_router(comment_router)
+app.include_router(admin_router)
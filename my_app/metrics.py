@@ -0,0 +1,186 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from redis import asyncio as aioredis
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# =======================
+# Metrics
+# =======================
+# Prometheus 指标，由 /metrics 暴露 (每个 worker 进程独立计数)：
+#   - HTTP: 每个路由的延迟、每个请求的 SQL 条数与 DB 耗时 (中间件)
+#   - DB:   每条 SQL 的耗时 (engine 事件)、连接池取连接的等待时间 (连接池子类)
+#   - Redis: 每个命令 / pipeline 的往返耗时 (客户端子类)
+#   - 限流: 被拒绝的请求数 (rate_limit)
+#   - 准入控制: 读/写闸门的在途数、排队数、排队耗时、拒绝数，以及连接池占用 (admission)
+#   - 用户缓存: L1 / L2 命中与回源次数 (user_cache)
+#   - 防穿透: 过滤器与否定缓存的判断结果 (bloom)
+#   - 并发读合并: 每个读路径执行与共享的次数 (singleflight)
+#   - 评论写入队列: 积压量、入队到落库的延迟、按结果统计的消息数 (comment_queue)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+_QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+HTTP_REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements executed per HTTP request", ["method", "route"],
+    buckets=_QUERY_COUNT_BUCKETS,
+)
+HTTP_REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in SQL statements per HTTP request", ["method", "route"],
+    buckets=_LATENCY_BUCKETS,
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "SQL statement latency", ["statement"],
+    buckets=_LATENCY_BUCKETS,
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds", "Time to get a connection from the pool (includes opening a new one)",
+    buckets=_LATENCY_BUCKETS,
+)
+REDIS_COMMAND_SECONDS = Histogram(
+    "redis_command_duration_seconds", "Redis command round-trip latency", ["command"],
+    buckets=_LATENCY_BUCKETS,
+)
+REDIS_ERRORS = Counter("redis_command_errors_total", "Redis commands that raised", ["command"])
+RATE_LIMITED = Counter(
+    "http_rate_limited_total", "Requests rejected with 429 by the rate limiter", ["rule", "backend"],
+)
+ADMISSION_IN_FLIGHT = Gauge("admission_in_flight", "Requests holding a DB session slot", ["route_class"])
+ADMISSION_WAITING = Gauge("admission_waiting", "Requests queued for a DB session slot", ["route_class"])
+ADMISSION_WAIT_SECONDS = Histogram(
+    "admission_wait_seconds", "Time queued for a DB session slot (queued requests only)", ["route_class"],
+    buckets=_LATENCY_BUCKETS,
+)
+ADMISSION_SHED = Counter("admission_shed_total", "Requests rejected with 503 by admission control", ["route_class", "reason"])
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "Connection pool size and usage", ["pool", "state"])
+COMMENT_INGEST_BACKLOG = Gauge("comment_ingest_backlog", "Comments queued in the Redis Stream and not yet written")
+COMMENT_INGEST_DELAY_SECONDS = Histogram(
+    "comment_ingest_delay_seconds", "Time from enqueue to the comment being committed",
+    buckets=_LATENCY_BUCKETS + (10.0, 30.0, 60.0),
+)
+USER_CACHE_LOOKUPS = Counter("user_cache_lookups_total", "User profile lookups by the tier that answered", ["tier"])
+BLOOM_CHECKS = Counter(
+    "bloom_checks_total", "Existence checks: absent/negative = answered 404 without a query", ["kind", "result"],
+)
+SINGLEFLIGHT_CALLS = Counter(
+    "singleflight_calls_total", "Coalesced reads: leader = ran the query, shared = waited for the leader's result",
+    ["name", "role"],
+)
+COMMENT_INGEST_MESSAGES = Counter("comment_ingest_messages_total", "Queued comments processed", ["result"])
+
+
+def render():
+    return generate_latest()
+
+
+# =======================
+# Per-request SQL stats
+# =======================
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def start_request() -> RequestStats:
+    """中间件在请求开始时调用，之后本请求内执行的 SQL 都计入返回的对象"""
+    stats = RequestStats()
+    _request_stats.set(stats)
+    return stats
+
+
+def observe_request(method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+    HTTP_REQUEST_SECONDS.labels(method, route, str(status)).observe(seconds)
+    HTTP_REQUEST_QUERIES.labels(method, route).observe(stats.queries)
+    HTTP_REQUEST_DB_SECONDS.labels(method, route).observe(stats.db_seconds)
+
+
+# =======================
+# SQLAlchemy hooks
+# =======================
+def _statement_kind(statement: str) -> str:
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return kind if kind in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    DB_QUERY_SECONDS.labels(_statement_kind(statement)).observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def _handle_error(exception_context):
+    # 出错的语句不会触发 after_cursor_execute，丢掉它的开始时间
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """记录取连接等待时间的连接池 (连接池打满时这里就是请求排队的地方)"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+
+
+# =======================
+# Redis hooks
+# =======================
+class TimedPipeline(aioredis.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        except Exception:
+            REDIS_ERRORS.labels("PIPELINE").inc()
+            raise
+        finally:
+            REDIS_COMMAND_SECONDS.labels("PIPELINE").observe(time.perf_counter() - start)
+
+
+class TimedRedis(aioredis.Redis):
+    async def execute_command(self, *args, **options):
+        command = str(args[0]).upper()
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception:
+            REDIS_ERRORS.labels(command).inc()
+            raise
+        finally:
+            REDIS_COMMAND_SECONDS.labels(command).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> TimedPipeline:
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
@@ -1,11 +1,15 @@
 from datetime import datetime
 from typing import Optional, List
-from sqlalchemy import String, Text, Boolean, Integer, ForeignKey, BigInteger, func
+from sqlalchemy import String, Text, Boolean, Integer, ForeignKey, BigInteger, SmallInteger, Index, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .database import Base
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # 登录 / 注册查重: WHERE username = ?
+        Index("ix_users_username", "username"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     username: Mapped[str] = mapped_column(String(50), nullable=False, comment="用户名")
@@ -21,11 +25,20 @@ class User(Base):
 
 class Post(Base):
     __tablename__ = "posts"
+    __table_args__ = (
+        # 帖子流: WHERE is_deleted = 0 ORDER BY created_at DESC, id DESC
+        Index("ix_posts_feed", "is_deleted", "created_at", "id"),
+        # 个人帖子: WHERE user_id = ? AND is_deleted = 0 ORDER BY created_at DESC, id DESC
+        Index("ix_posts_user_feed", "user_id", "is_deleted", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False, comment="作者ID")
     title: Mapped[str] = mapped_column(String(100), nullable=False, comment="帖子标题")
-    content: Mapped[str] = mapped_column(Text, nullable=False, comment="帖子内容")
+    # 正文只在详情页需要，列表查询不加载 (访问前须 undefer)
+    content: Mapped[str] = mapped_column(Text, nullable=False, deferred=True, comment="帖子内容")
+    # 写入时截取，列表接口直接使用
+    content_snippet: Mapped[str] = mapped_column(String(64), nullable=False, default="", server_default="", comment="正文摘要")
     
     is_deleted: Mapped[bool] = mapped_column(Boolean, default=False, comment="软删除标记")
     
@@ -45,6 +58,13 @@ class Post(Base):
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        # 根评论列表: WHERE post_id = ? AND parent_id IS NULL ORDER BY created_at DESC, id DESC
+        Index("ix_comments_post_roots", "post_id", "parent_id", "created_at", "id"),
+        # 子回复列表 / 回复计数 / 存活子回复判断:
+        # WHERE root_id = ? AND is_deleted = 0 [AND parent_id IS NOT NULL] ORDER BY created_at, id
+        Index("ix_comments_root_replies", "root_id", "is_deleted", "created_at", "id", "parent_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     post_id: Mapped[int] = mapped_column(Integer, ForeignKey("posts.id"), nullable=False, comment="归属的帖子ID")
@@ -57,6 +77,10 @@ class Comment(Base):
     content: Mapped[str] = mapped_column(Text, nullable=False, comment="评论内容")
     # like_count removed
     is_deleted: Mapped[bool] = mapped_column(Boolean, default=False, comment="软删除标记")
+
+    # 仅根评论使用：由 create_comment / delete_comment 原子维护
+    reply_count: Mapped[int] = mapped_column(Integer, default=0, comment="子回复总数 (含已删除)")
+    live_reply_count: Mapped[int] = mapped_column(Integer, default=0, comment="未删除的子回复数")
     
     created_at: Mapped[datetime] = mapped_column(
         insert_default=func.now(), comment="创建时间"
@@ -69,3 +93,20 @@ class Comment(Base):
     
     # Optional: Logic relationships for nested comments usually handled by query, 
     # but we can declare them if needed.
+
+class Counter(Base):
+    __tablename__ = "counters"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True, comment="计数器名称")
+    value: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, comment="计数值")
+
+class PostCounterShard(Base):
+    # posts.comment_count / view_count 与可见根评论数的增量分片：写入随机落在一个分片上，
+    # 避免所有评论争抢同一行 posts / counters 的行锁；后台任务定期把分片折叠回去 (见 post_counters.py)
+    __tablename__ = "post_counter_shards"
+
+    post_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False, comment="帖子ID")
+    shard: Mapped[int] = mapped_column(SmallInteger, primary_key=True, autoincrement=False, comment="分片号")
+    comments: Mapped[int] = mapped_column(Integer, nullable=False, default=0, comment="未折叠的评论数增量")
+    views: Mapped[int] = mapped_column(Integer, nullable=False, default=0, comment="未折叠的阅读数增量")
+    roots: Mapped[int] = mapped_column(Integer, nullable=False, default=0, comment="未折叠的可见根评论数增量")
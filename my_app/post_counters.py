@@ -0,0 +1,148 @@
+import random
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, http_cache, counters
+from .database import settings
+
+# =======================
+# Sharded Post Counters
+# =======================
+# 每条评论都 UPDATE posts SET comment_count = comment_count + 1 时，热门帖子下的所有评论事务
+# 会排队等待同一行 posts 的行锁。改为在 post_counter_shards 中随机选一个分片累加：
+#     实际计数 = posts.comment_count + SUM(shards.comments)   (view_count 同理)
+# 可见根评论数 (评论列表的 total) 同样走分片，折叠进 counters 表中对应帖子的计数行：
+#     实际计数 = counters[visible_root_comments] + SUM(shards.roots)
+# 后台任务定期把分片折叠回 posts / counters (这些计数从此只有折叠任务一个写入者)：
+#     帖子列表直接读取 posts 列 (最多滞后一个折叠周期)，详情页与评论列表的 total 额外加上未折叠的分片。
+# 折叠在同一事务中 "posts 加上读到的值、分片减去同样的值"，总和始终不变，多个 worker 同时折叠也不会重复计数。
+
+_table = models.PostCounterShard.__table__
+
+
+def _upsert(db: AsyncSession):
+    """INSERT ... 冲突时在原分片上累加"""
+    if db.get_bind().dialect.name == "mysql":
+        stmt = mysql.insert(_table)
+        return stmt.on_duplicate_key_update(
+            comments=_table.c.comments + stmt.inserted.comments,
+            views=_table.c.views + stmt.inserted.views,
+            roots=_table.c.roots + stmt.inserted.roots,
+        )
+    stmt = sqlite.insert(_table)
+    return stmt.on_conflict_do_update(
+        index_elements=[_table.c.post_id, _table.c.shard],
+        set_={
+            "comments": _table.c.comments + stmt.excluded.comments,
+            "views": _table.c.views + stmt.excluded.views,
+            "roots": _table.c.roots + stmt.excluded.roots,
+        },
+    )
+
+
+async def add(db: AsyncSession, post_id: int, comments: int = 0, views: int = 0, roots: int = 0) -> None:
+    """在当前事务中给帖子的一个随机分片累加 (不提交)；roots 为可见根评论数的变化"""
+    await add_many(db, {post_id: (comments, views, roots)})
+
+
+async def add_many(db: AsyncSession, deltas: Dict[int, Tuple[int, int, int]]) -> None:
+    """批量累加 {post_id: (comments, views, roots)}，一条 executemany (不提交)"""
+    rows = [
+        {
+            "post_id": post_id, "shard": random.randrange(settings.POST_COUNTER_SHARDS),
+            "comments": c, "views": v, "roots": r,
+        }
+        for post_id, (c, v, r) in deltas.items()
+        if c or v or r
+    ]
+    if rows:
+        await db.execute(_upsert(db), rows)
+
+
+async def unfolded(db: AsyncSession, post_ids: Iterable[int]) -> Dict[int, Tuple[int, int, int]]:
+    """尚未折叠的增量 {post_id: (comments, views, roots)}，没有分片的帖子不在结果中"""
+    ids = list(post_ids)
+    if not ids:
+        return {}
+    result = await db.execute(
+        select(_table.c.post_id, func.sum(_table.c.comments), func.sum(_table.c.views), func.sum(_table.c.roots))
+        .where(_table.c.post_id.in_(ids))
+        .group_by(_table.c.post_id)
+    )
+    return {post_id: (int(c or 0), int(v or 0), int(r or 0)) for post_id, c, v, r in result.all()}
+
+
+async def unfolded_roots(db: AsyncSession, post_id: int) -> int:
+    return (await unfolded(db, [post_id])).get(post_id, (0, 0, 0))[2]
+
+
+async def _fold_batch(db: AsyncSession, batch_size: int) -> Tuple[int, int]:
+    # Returns (shard rows read, posts updated)
+    shards = (await db.execute(
+        select(_table.c.post_id, _table.c.shard, _table.c.comments, _table.c.views, _table.c.roots)
+        .limit(batch_size)
+    )).all()
+    if not shards:
+        return 0, 0
+
+    totals: Dict[int, List[int]] = defaultdict(lambda: [0, 0, 0])
+    for post_id, _, comments, views, roots in shards:
+        totals[post_id][0] += comments
+        totals[post_id][1] += views
+        totals[post_id][2] += roots
+
+    # Group posts by delta so one UPDATE covers many rows (as in view_counter)
+    by_delta: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+    for post_id, (comments, views, roots) in totals.items():
+        if comments or views:
+            by_delta[(comments, views)].append(post_id)
+        if roots:
+            await counters.bump(db, counters.visible_root_comments(post_id), roots)
+    for (comments, views), post_ids in by_delta.items():
+        await db.execute(
+            update(models.Post)
+            .where(models.Post.id.in_(post_ids))
+            .values(comment_count=models.Post.comment_count + comments, view_count=models.Post.view_count + views)
+            .execution_options(synchronize_session=False)
+        )
+
+    # Subtract what was read instead of zeroing: increments committed meanwhile stay in the shard
+    await db.execute(
+        update(_table)
+        .where(_table.c.post_id == bindparam("b_post_id"), _table.c.shard == bindparam("b_shard"))
+        .values(
+            comments=_table.c.comments - bindparam("b_comments"),
+            views=_table.c.views - bindparam("b_views"),
+            roots=_table.c.roots - bindparam("b_roots"),
+        ),
+        [{"b_post_id": p, "b_shard": s, "b_comments": c, "b_views": v, "b_roots": r} for p, s, c, v, r in shards],
+    )
+    await db.execute(
+        delete(_table)
+        .where(_table.c.post_id.in_(list(totals)))
+        .where(_table.c.comments == 0, _table.c.views == 0, _table.c.roots == 0)
+    )
+    await db.commit()
+    return len(shards), sum(len(post_ids) for post_ids in by_delta.values())
+
+
+async def fold(db: AsyncSession, batch_size: int = 1000, max_batches: int = 100) -> int:
+    """
+    把分片累加回 posts / counters 并删除已折叠的分片 (每批一个事务)，返回更新的帖子数。
+    可见根评论数的缓存值 = counters 行 + 分片，折叠前后总和不变，无需失效。
+    """
+    folded = 0
+    for _ in range(max_batches):
+        read, updated = await _fold_batch(db, batch_size)
+        folded += updated
+        if read < batch_size:
+            break
+    if folded:
+        # 列表中的计数变了，让帖子列表的 ETag 失效
+        await http_cache.touch(http_cache.feed_key())
+    return folded
+
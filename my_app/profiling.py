@@ -0,0 +1,107 @@
+import asyncio
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import uuid
+from typing import Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import PlainTextResponse
+
+from .database import settings
+
+# =======================
+# Request Profiler
+# =======================
+# 按需用 cProfile 剖析单个请求 (X-Profile 头或 ?profile= 参数，仅管理员)：
+#   inline -> 直接返回按累计耗时排序的函数列表 (替换原响应体)
+#   file   -> 保存 .prof 文件到 PROFILE_DIR，响应头 X-Profile-Id 给出文件名
+# PROFILE_SAMPLE_RATE = N 时，每 N 个请求抽样剖析一个，累加成热点函数报告。
+# cProfile 是线程级的：剖析期间同一事件循环上并发请求的代码也会被统计，同一时间只剖析一个请求。
+
+_lock = asyncio.Lock()
+_request_counter = itertools.count(1)
+
+_aggregate: Optional[pstats.Stats] = None
+_aggregate_requests = 0
+
+
+def requested_mode(request: Request) -> Optional[str]:
+    value = request.headers.get("X-Profile") or request.query_params.get("profile")
+    if not value:
+        return None
+    return "file" if value == "file" else "inline"
+
+
+def should_sample() -> bool:
+    rate = settings.PROFILE_SAMPLE_RATE
+    return rate > 0 and next(_request_counter) % rate == 0
+
+
+async def run(request: Request, call_next, inline: bool = False) -> Tuple[Response, Optional[cProfile.Profile]]:
+    """
+    剖析请求，返回原响应 (不重建，响应头原样保留)；已有请求在剖析时不剖析，返回的 profiler 为 None。
+    inline 时响应体会被报告替换：在剖析期间读完响应体，流式响应的生成耗时也计入报告。
+    """
+    if _lock.locked():
+        return await call_next(request), None
+    async with _lock:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = await call_next(request)
+            if inline:
+                async for _ in response.body_iterator:
+                    pass
+        finally:
+            profiler.disable()
+    return response, profiler
+
+
+def format_stats(source: pstats.Stats, top: int) -> str:
+    """累计耗时前 top 的函数，再附上自身耗时前 top 的函数 (SQL 驱动、ORM 装载、Pydantic、JSON 编码多在这里)"""
+    out = io.StringIO()
+    # 复制一份再 strip_dirs，不改动累加中的报告
+    stats = pstats.Stats(stream=out)
+    stats.add(source)
+    stats.strip_dirs()
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+    return out.getvalue()
+
+
+def inline_response(profiler: cProfile.Profile, status_code: int) -> PlainTextResponse:
+    report = format_stats(pstats.Stats(profiler), settings.PROFILE_TOP)
+    return PlainTextResponse(report, headers={"X-Profiled-Status": str(status_code)})
+
+
+def save(profiler: cProfile.Profile) -> str:
+    """保存为 .prof 文件 (可用 snakeviz / pstats 打开)，返回 profile id"""
+    profile_id = uuid.uuid4().hex
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(settings.PROFILE_DIR, f"{profile_id}.prof"))
+    return profile_id
+
+
+def add_sample(profiler: cProfile.Profile) -> None:
+    global _aggregate, _aggregate_requests
+    if _aggregate is None:
+        _aggregate = pstats.Stats(profiler)
+    else:
+        _aggregate.add(profiler)
+    _aggregate_requests += 1
+
+
+def sampled_report(top: int) -> dict:
+    return {
+        "sampled_requests": _aggregate_requests,
+        "report": format_stats(_aggregate, top) if _aggregate is not None else "",
+    }
+
+
+def reset_samples() -> None:
+    global _aggregate, _aggregate_requests
+    _aggregate = None
+    _aggregate_requests = 0
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .database import settings
+from .redis_utils import RedisClient
+
+logger = logging.getLogger(__name__)
+
+# =======================
+# Hot Posts Ranking
+# =======================
+# 热度榜保存在 Redis 有序集合中，分数带时间衰减：
+#     score = log10(points) + (created_ts - EPOCH) / HOT_DECAY_SECONDS
+# 新帖天然有时间优势，旧帖需要 10 倍互动才能追平晚 HOT_DECAY_SECONDS 秒发布的帖子。
+# 互动 (发帖 / 评论 / 阅读) 累加 points 并原子地重算分数，删除帖子时移出榜单。
+# 裁剪只把帖子移出有序集合，HOT_RETENTION_SECONDS 内的帖子保留 points / created，之后的互动可以让它重新上榜。
+# 部署前已有的帖子 (或 Redis 被清空后) 由 backfill() 从 posts 表补录，启动时自动执行一次，
+# 也可手动运行 python -m my_app.ranking。
+
+HOT_KEY = "posts:hot"
+HOT_POINTS_KEY = "posts:hot:points"
+HOT_CREATED_KEY = "posts:hot:created"
+BACKFILLED_KEY = "posts:hot:backfilled"
+BACKFILL_CHUNK = 500
+
+# 分数起点，只影响分数的绝对值，不影响排序
+EPOCH = 1735689600  # 2025-01-01 00:00:00 UTC
+
+WEIGHT_POST = 1
+WEIGHT_VIEW = 1
+WEIGHT_COMMENT = 5
+
+# KEYS: zset, points hash, created hash
+# ARGV: post_id, weight, created_ts ('' = use stored value), epoch, decay seconds
+_SCORE_LUA = """
+local created = ARGV[3]
+if created == '' then
+    created = redis.call('HGET', KEYS[3], ARGV[1])
+    if not created then
+        return nil
+    end
+else
+    redis.call('HSET', KEYS[3], ARGV[1], created)
+end
+local points = tonumber(redis.call('HINCRBYFLOAT', KEYS[2], ARGV[1], ARGV[2]))
+local score = math.log10(math.max(points, 1)) + (tonumber(created) - tonumber(ARGV[4])) / tonumber(ARGV[5])
+redis.call('ZADD', KEYS[1], score, ARGV[1])
+return tostring(score)
+"""
+
+# KEYS: zset, points hash, created hash
+# ARGV: epoch, decay seconds, then (post_id, created_ts, points) triples
+# Seeds only posts the ranking does not track yet; tracked posts keep their live points
+_BACKFILL_LUA = """
+local seeded = 0
+for i = 3, #ARGV, 3 do
+    if redis.call('HSETNX', KEYS[3], ARGV[i], ARGV[i + 1]) == 1 then
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 2])
+        local score = math.log10(math.max(tonumber(ARGV[i + 2]), 1))
+            + (tonumber(ARGV[i + 1]) - tonumber(ARGV[1])) / tonumber(ARGV[2])
+        redis.call('ZADD', KEYS[1], score, ARGV[i])
+        seeded = seeded + 1
+    end
+end
+return seeded
+"""
+
+_score_script = None
+_backfill_script = None
+
+
+async def _bump(post_id: int, weight: float, created_at: Optional[datetime] = None) -> None:
+    global _score_script
+    try:
+        redis = RedisClient.get_instance()
+        if _score_script is None:
+            _score_script = redis.register_script(_SCORE_LUA)
+        created = str(created_at.timestamp()) if created_at is not None else ""
+        await _score_script(
+            keys=[HOT_KEY, HOT_POINTS_KEY, HOT_CREATED_KEY],
+            args=[post_id, weight, created, EPOCH, settings.HOT_DECAY_SECONDS],
+            client=redis,
+        )
+    except RedisError:
+        pass
+
+
+async def on_post_created(post_id: int, created_at: datetime) -> None:
+    await _bump(post_id, WEIGHT_POST, created_at)
+
+
+async def on_comment_created(post_id: int, count: int = 1) -> None:
+    await _bump(post_id, WEIGHT_COMMENT * count)
+
+
+async def on_post_viewed(post_id: int) -> None:
+    await _bump(post_id, WEIGHT_VIEW)
+
+
+async def on_post_deleted(post_id: int) -> None:
+    try:
+        pipe = RedisClient.get_instance().pipeline(transaction=True)
+        pipe.zrem(HOT_KEY, post_id)
+        pipe.hdel(HOT_POINTS_KEY, post_id)
+        pipe.hdel(HOT_CREATED_KEY, post_id)
+        await pipe.execute()
+    except RedisError:
+        pass
+
+
+async def top_post_ids(limit: int) -> List[int]:
+    """按热度从高到低返回帖子 ID，O(log N + limit)"""
+    try:
+        ids = await RedisClient.get_instance().zrevrange(HOT_KEY, 0, limit - 1)
+    except RedisError:
+        return []
+    return [int(i) for i in ids]
+
+
+async def compact(keep: int) -> int:
+    """只保留热度最高的 keep 个帖子，返回移出榜单的数量；不在榜单上且超过保留期的帖子同时清除互动记录"""
+    redis = RedisClient.get_instance()
+    stale = await redis.zrange(HOT_KEY, 0, -(keep + 1))
+    if stale:
+        await redis.zrem(HOT_KEY, *stale)
+
+    cutoff = time.time() - settings.HOT_RETENTION_SECONDS
+    expired = [pid async for pid, created in redis.hscan_iter(HOT_CREATED_KEY) if float(created) < cutoff]
+    if expired:
+        # Old posts still on the board keep counting
+        scores = await redis.zmscore(HOT_KEY, expired)
+        expired = [pid for pid, score in zip(expired, scores) if score is None]
+    for i in range(0, len(expired), BACKFILL_CHUNK):
+        chunk = expired[i:i + BACKFILL_CHUNK]
+        pipe = redis.pipeline(transaction=True)
+        pipe.hdel(HOT_POINTS_KEY, *chunk)
+        pipe.hdel(HOT_CREATED_KEY, *chunk)
+        await pipe.execute()
+    return len(stale)
+
+
+async def backfill(db: AsyncSession) -> int:
+    """把保留期内、榜单尚未记录的帖子按 posts 表中的计数补录进热度榜，返回补录数量"""
+    global _backfill_script
+    redis = RedisClient.get_instance()
+    if _backfill_script is None:
+        _backfill_script = redis.register_script(_BACKFILL_LUA)
+    cutoff = datetime.now() - timedelta(seconds=settings.HOT_RETENTION_SECONDS)
+    stmt = (
+        select(models.Post.id, models.Post.created_at, models.Post.comment_count, models.Post.view_count)
+        .where(models.Post.is_deleted == False)
+        .where(models.Post.created_at >= cutoff)
+        .order_by(models.Post.id)
+        .limit(BACKFILL_CHUNK)
+    )
+    seeded, last_id = 0, 0
+    while True:
+        rows = (await db.execute(stmt.where(models.Post.id > last_id))).all()
+        if not rows:
+            break
+        args = [EPOCH, settings.HOT_DECAY_SECONDS]
+        for row in rows:
+            points = WEIGHT_POST + WEIGHT_COMMENT * row.comment_count + WEIGHT_VIEW * row.view_count
+            args += [row.id, str(row.created_at.timestamp()), points]
+        seeded += await _backfill_script(keys=[HOT_KEY, HOT_POINTS_KEY, HOT_CREATED_KEY], args=args, client=redis)
+        last_id = rows[-1].id
+    await redis.set(BACKFILLED_KEY, 1)
+    return seeded
+
+
+async def ensure_backfilled(session_factory) -> None:
+    """启动时：Redis 中没有补录标记 (首次部署或被清空) 时补录一次并裁剪"""
+    try:
+        if await RedisClient.get_instance().exists(BACKFILLED_KEY):
+            return
+        async with session_factory() as db:
+            seeded = await backfill(db)
+        await compact(settings.HOT_POSTS_MAX)
+        logger.info("hot ranking: backfilled %d posts", seeded)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception("hot ranking: backfill failed")
+
+
+async def run_compactor(interval: float, keep: int) -> None:
+    """后台任务：定期裁剪热度榜"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await compact(keep)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("hot ranking: compaction failed")
+
+
+async def _backfill() -> None:
+    from . import database
+
+    async with database.AsyncSessionLocal() as db:
+        seeded = await backfill(db)
+    await compact(settings.HOT_POSTS_MAX)
+    print(f"backfilled {seeded} posts")
+    await RedisClient.close()
+
+
+if __name__ == "__main__":
+    # Seed the ranking from the posts table: python -m my_app.ranking
+    asyncio.run(_backfill())
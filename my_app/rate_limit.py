@@ -0,0 +1,123 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from . import metrics
+from .redis_utils import RedisClient
+
+# =======================
+# Rate Limiting
+# =======================
+# 令牌桶：容量 capacity，每 period 秒补满 (补充速率 capacity / period 个/秒)，每个请求消耗 1 个。
+# 桶状态保存在 Redis 哈希中，由 Lua 脚本原子地 "补充 + 扣减"，所有 worker 共享；时间取 Redis 服务器时钟。
+# Redis 不可用时退化为进程内的桶 (每个 worker 各自计数，限制相应放宽)。
+# 规则写成 "次数/秒数"，例如 "20/60"；空字符串表示不限制。
+
+BUCKET_KEY = "ratelimit:{rule}:{identity}"
+
+# 进程内后备桶的数量上限 (LRU)
+LOCAL_BUCKETS_MAX = 10000
+
+# KEYS: bucket hash
+# ARGV: capacity, refill rate (tokens / second)
+# 返回 {是否放行, 剩余令牌, 需等待的秒数}
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(tokens), tostring(wait)}
+"""
+
+_bucket_script = None
+
+
+class Rule:
+    def __init__(self, name: str, capacity: int, period: float):
+        self.name = name
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+
+    @classmethod
+    def parse(cls, name: str, spec: str) -> Optional["Rule"]:
+        """"20/60" -> 60 秒内最多 20 次 (可突发 20 次)；空字符串返回 None"""
+        spec = spec.strip()
+        if not spec:
+            return None
+        count, _, seconds = spec.partition("/")
+        capacity, period = int(count), float(seconds or 1)
+        if capacity <= 0 or period <= 0:
+            raise ValueError(f"Invalid rate limit for {name}: {spec!r}")
+        return cls(name, capacity, period)
+
+
+class Decision:
+    def __init__(self, allowed: bool, remaining: int, retry_after: float):
+        self.allowed = allowed
+        self.remaining = remaining
+        self.retry_after = retry_after
+
+    def headers(self, rule: Rule) -> dict:
+        headers = {"X-RateLimit-Limit": str(rule.capacity), "X-RateLimit-Remaining": str(self.remaining)}
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+# key -> (tokens, monotonic ts)
+_local_buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+
+def _take_local(key: str, rule: Rule) -> Decision:
+    now = time.monotonic()
+    tokens, ts = _local_buckets.get(key, (rule.capacity, now))
+    tokens = min(rule.capacity, tokens + (now - ts) * rule.rate)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    _local_buckets[key] = (tokens, now)
+    _local_buckets.move_to_end(key)
+    while len(_local_buckets) > LOCAL_BUCKETS_MAX:
+        _local_buckets.popitem(last=False)
+    return Decision(allowed, int(tokens), 0.0 if allowed else (1 - tokens) / rule.rate)
+
+
+async def _take_redis(key: str, rule: Rule) -> Decision:
+    global _bucket_script
+    redis = RedisClient.get_instance()
+    if _bucket_script is None:
+        _bucket_script = redis.register_script(_TOKEN_BUCKET_LUA)
+    allowed, tokens, wait = await _bucket_script(keys=[key], args=[rule.capacity, rule.rate], client=redis)
+    return Decision(bool(int(allowed)), int(float(tokens)), float(wait))
+
+
+async def hit(rule: Rule, identity: str) -> Decision:
+    """为 identity (如 user:1 / ip:1.2.3.4) 在 rule 下消耗一个令牌"""
+    key = BUCKET_KEY.format(rule=rule.name, identity=identity)
+    try:
+        decision = await _take_redis(key, rule)
+        backend = "redis"
+    except RedisError:
+        decision = _take_local(key, rule)
+        backend = "local"
+    if not decision.allowed:
+        metrics.RATE_LIMITED.labels(rule.name, backend).inc()
+    return decision
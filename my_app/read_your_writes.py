@@ -0,0 +1,38 @@
+import time
+from typing import Dict
+
+from redis.exceptions import RedisError
+
+from .database import settings
+from .redis_utils import RedisClient
+
+# =======================
+# Read-Your-Writes Pinning
+# =======================
+# 用户写入后的几秒内，其读请求固定走主库，避免从库复制延迟导致“刚发的帖子看不到”。
+# 标记存放在 Redis 中以便所有 worker 共享，Redis 不可用时退化为进程内标记。
+
+PIN_KEY = "rw:pin:{user_id}"
+
+_local_pins: Dict[int, float] = {}
+
+
+async def pin(user_id: int) -> None:
+    seconds = settings.READ_YOUR_WRITES_SECONDS
+    _local_pins[user_id] = time.monotonic() + seconds
+    try:
+        await RedisClient.get_instance().set(PIN_KEY.format(user_id=user_id), 1, px=int(seconds * 1000))
+    except RedisError:
+        pass
+
+
+async def is_pinned(user_id: int) -> bool:
+    until = _local_pins.get(user_id)
+    if until is not None:
+        if until > time.monotonic():
+            return True
+        _local_pins.pop(user_id, None)
+    try:
+        return bool(await RedisClient.get_instance().exists(PIN_KEY.format(user_id=user_id)))
+    except RedisError:
+        return False
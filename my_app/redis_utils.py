@@ -1,6 +1,7 @@
 from redis import asyncio as aioredis
 from typing import Optional
 from .database import settings
+from .metrics import TimedRedis
 
 class RedisClient:
     _instance: Optional[aioredis.Redis] = None
@@ -9,7 +10,8 @@ class RedisClient:
     def get_instance(cls) -> aioredis.Redis:
         if cls._instance is None:
             # Initialize Redis connection
-            cls._instance = aioredis.Redis(
+            # TimedRedis records per-command latency for /metrics
+            cls._instance = TimedRedis(
                 host=settings.REDIS_HOST,
                 port=settings.REDIS_PORT,
                 username=settings.REDIS_USERNAME if settings.REDIS_USERNAME else None,
@@ -28,3 +30,22 @@ class RedisClient:
 # Dependency for FastAPI
 async def get_redis() -> aioredis.Redis:
     return RedisClient.get_instance()
+
+# KEYS: lock; ARGV: token
+# Compare-and-delete in one step: a lock that expired and was taken by someone else is left alone
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_release_lock_script = None
+
+async def release_lock(key: str, token: str) -> bool:
+    """释放 SET NX PX 取得的锁，只删除自己 (token 相同) 持有的锁"""
+    global _release_lock_script
+    redis = RedisClient.get_instance()
+    if _release_lock_script is None:
+        _release_lock_script = redis.register_script(_RELEASE_LOCK_LUA)
+    return bool(await _release_lock_script(keys=[key], args=[token], client=redis))
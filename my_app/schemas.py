@@ -1,4 +1,5 @@
 from datetime import datetime
+from enum import Enum
 from typing import Optional, List, Generic, TypeVar, Any
 from pydantic import BaseModel, ConfigDict, Field
 
@@ -20,16 +21,23 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
 
+class CountMode(str, Enum):
+    exact = "exact"          # 实时 COUNT(*)
+    estimated = "estimated"  # 读取维护的计数器 (默认)
+    none = "none"            # 不返回 total
+
 class PaginationData(BaseModel):
     page: int
     pageSize: int
-    total: int
+    total: Optional[int] = None
     # Specific field for comments as per doc, but we can make it generic or use alias
     # The doc says "total" for posts, "total_root_comments" for comments.
     # We can handle this by using a loose schema or specific subclass, 
     # but for simplicity let's stick to 'total' and mapping it, 
     # or allow extra fields via strict=False (default).
     total_root_comments: Optional[int] = None 
+    # Opaque keyset cursor for the next page; None on the last page
+    next_cursor: Optional[str] = None
 
 class PaginatedList(BaseModel, Generic[T]):
     pagination: PaginationData
@@ -94,6 +102,20 @@ class CommentListResponse(BaseModel):
     pagination: PaginationData
     list: List[CommentListItem]
 
+class ThreadCommentItem(CommentListItem):
+    # replies holds the first N replies; pass this as `after` to /comments/{id}/replies for the rest
+    replies_next_cursor: Optional[str] = None
+
+class ThreadResponse(BaseModel):
+    pagination: PaginationData
+    list: List[ThreadCommentItem]
+
+class ReplyListResponse(BaseModel):
+    list: List[CommentListItem]
+    has_more: bool = False
+    # Pass back as `after` to load the next chunk
+    next_cursor: Optional[str] = None
+
 
 # =======================
 # Post Schemas
@@ -0,0 +1,51 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from . import metrics
+
+T = TypeVar("T")
+
+# =======================
+# Single-Flight
+# =======================
+# 同一 worker 内，相同 key 的并发读只执行一次：第一个调用者执行，其余调用者等待并共享它的结果 (或异常)。
+# 热门帖子被几百个请求同时读取时，只有一组 SQL 发往数据库。
+#   - 结果在调用者之间共享，调用方不得修改；只合并返回 schema 或查询行 (Row) 的调用，
+#     ORM 对象属于第一个调用者的会话，不能交给其他会话使用
+#   - 执行者被取消 (客户端断开) 时，等待者重新发起，其中一个成为新的执行者
+#   - 只合并 "同时" 的调用，不缓存结果；跨 worker 的重建由 cache 中的 Redis 锁控制
+
+_calls: Dict[Hashable, asyncio.Future] = {}
+
+
+async def do(key: tuple, fn: Callable[[], Awaitable[T]]) -> T:
+    """执行 fn()，或等待相同 key 正在执行的调用；key 的第一个元素作为指标名"""
+    while True:
+        future = _calls.get(key)
+        if future is None:
+            break
+        metrics.SINGLEFLIGHT_CALLS.labels(key[0], "shared").inc()
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if future.cancelled():
+                continue  # the leader was cancelled, not us: run it again
+            raise
+
+    metrics.SINGLEFLIGHT_CALLS.labels(key[0], "leader").inc()
+    future = asyncio.get_running_loop().create_future()
+    _calls[key] = future
+    try:
+        result = await fn()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # retrieved: no "never retrieved" warning when nobody was waiting
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        del _calls[key]
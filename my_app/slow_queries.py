@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import greenlet
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# =======================
+# Slow Query Log
+# =======================
+# 超过阈值的 SQL 记录语句、脱敏后的参数、耗时和发起查询的 crud 函数，
+# 按采样率在另一个连接上补跑 EXPLAIN 保存执行计划。
+# 结果保存在定长环形缓冲区 (管理员接口查看)，可选地按 JSON 行追加写入日志文件。
+
+CRUD_MODULE = __package__ + ".crud"
+
+
+def redact(value: Any) -> Any:
+    """参数脱敏：保留数字/布尔/空值 (多为 ID 和分页参数)，其余只保留类型和长度"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, dict):
+        return {k: redact(v) for k, v in value.items()}
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__} len={len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def calling_crud_function() -> Optional[str]:
+    """
+    找出发起当前 SQL 的 crud 函数名。
+    engine 事件运行在 SQLAlchemy 的 greenlet 里，crud 协程的栈帧在父 greenlet 上，逐级向上找。
+    """
+    frame = sys._getframe(1)
+    current = greenlet.getcurrent()
+    while True:
+        while frame is not None:
+            if frame.f_globals.get("__name__") == CRUD_MODULE:
+                return frame.f_code.co_name
+            frame = frame.f_back
+        current = current.parent
+        if current is None:
+            return None
+        frame = current.gr_frame
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, explain_rate: float, size: int, log_file: str = ""):
+        self.threshold = threshold_ms / 1000
+        self.explain_rate = explain_rate
+        self.entries: "deque[Dict[str, Any]]" = deque(maxlen=size)
+        self._explain_tasks = set()
+        self._file_logger: Optional[logging.Logger] = None
+        if log_file:
+            self._file_logger = logging.getLogger(__name__ + ".file")
+            self._file_logger.propagate = False
+            self._file_logger.setLevel(logging.INFO)
+            self._file_logger.addHandler(logging.FileHandler(log_file, encoding="utf-8"))
+
+    def instrument(self, engine: AsyncEngine) -> None:
+        if self.threshold <= 0:
+            return
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("slow_query_start", []).append(time.perf_counter())
+
+        @event.listens_for(engine.sync_engine, "after_cursor_execute")
+        def after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["slow_query_start"].pop()
+            # 自己补跑的 EXPLAIN 不再记录
+            if elapsed >= self.threshold and context.execution_options.get("slow_query_log", True):
+                self._record(engine, statement, parameters, executemany, elapsed)
+
+        @event.listens_for(engine.sync_engine, "handle_error")
+        def on_error(exception_context):
+            conn = exception_context.connection
+            if conn is not None and conn.info.get("slow_query_start"):
+                conn.info["slow_query_start"].pop()
+
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        """最近的慢查询，新的在前"""
+        return list(reversed(self.entries))[:limit]
+
+    def _record(self, engine: AsyncEngine, statement: str, parameters, executemany: bool, elapsed: float) -> None:
+        entry = {
+            "at": datetime.now().isoformat(timespec="milliseconds"),
+            "duration_ms": round(elapsed * 1000, 2),
+            "function": calling_crud_function(),
+            "statement": statement,
+            "parameters": redact(parameters),
+            "explain": None,
+        }
+        self.entries.append(entry)
+
+        explain = (
+            not executemany
+            and statement.lstrip().upper().startswith("SELECT")
+            and random.random() < self.explain_rate
+        )
+        if not explain:
+            self._write(entry)
+            return
+        # 当前在 SQLAlchemy 的同步回调里，EXPLAIN 交给后台任务在另一个连接上执行
+        task = asyncio.get_running_loop().create_task(self._explain(engine, entry, statement, parameters))
+        self._explain_tasks.add(task)
+        task.add_done_callback(self._explain_tasks.discard)
+
+    async def _explain(self, engine: AsyncEngine, entry: Dict[str, Any], statement: str, parameters) -> None:
+        prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+        try:
+            async with engine.connect() as conn:
+                result = await conn.exec_driver_sql(
+                    prefix + statement, parameters, execution_options={"slow_query_log": False}
+                )
+                entry["explain"] = [
+                    {k: v if isinstance(v, (int, float, type(None))) else str(v) for k, v in row._mapping.items()}
+                    for row in result
+                ]
+        except Exception as e:
+            entry["explain"] = f"EXPLAIN failed: {e}"
+        self._write(entry)
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        if self._file_logger is not None:
+            try:
+                self._file_logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+            except Exception:
+                logger.exception("slow query log: write failed")
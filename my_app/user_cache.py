@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas, metrics
+from .database import settings
+from .redis_utils import RedisClient
+
+logger = logging.getLogger(__name__)
+
+# =======================
+# User Profile Cache
+# =======================
+# 评论列表中的作者 / 被回复者、用户详情、登录态快照共用的两级缓存 (UserOut)：
+#   L1: 每个 worker 进程内的 LRU + TTL，活跃用户通常在这里命中
+#   L2: Redis，所有 worker 共享，批量读取只需一次 MGET
+#   未命中的用户一次 IN 查询加载并回填两级缓存
+# 用户信息变更时调用 invalidate()：删除 L2，并通过 Redis pub/sub 通知所有 worker 清除各自的 L1。
+# 订阅断开期间可能错过通知，重新订阅时清空整个 L1；L1 的 TTL 兜底。
+
+USER_KEY = "user:profile:{user_id}"
+INVALIDATE_CHANNEL = "user:profile:invalidate"
+
+# user_id -> (expires_at, snapshot)
+_local: "OrderedDict[int, Tuple[float, schemas.UserOut]]" = OrderedDict()
+# Called with the user_id on every invalidation received (None = all users), e.g. to drop auth tokens
+_on_invalidate: List[Callable[[Optional[int]], None]] = []
+
+
+class UserCacheStats:
+    """进程内各级命中计数 (按用户 ID 计，每个 worker 独立统计)"""
+    l1_hits: int = 0
+    l2_hits: int = 0
+    misses: int = 0
+    errors: int = 0
+
+    @classmethod
+    def record(cls, tier: str, n: int) -> None:
+        if n:
+            setattr(cls, tier, getattr(cls, tier) + n)
+            metrics.USER_CACHE_LOOKUPS.labels(tier).inc(n)
+
+    @classmethod
+    def snapshot(cls) -> dict:
+        lookups = cls.l1_hits + cls.l2_hits + cls.misses
+        return {
+            "l1_hits": cls.l1_hits,
+            "l2_hits": cls.l2_hits,
+            "misses": cls.misses,
+            "errors": cls.errors,
+            "l1_hit_ratio": round(cls.l1_hits / lookups, 4) if lookups else 0.0,
+            "l2_hit_ratio": round(cls.l2_hits / (lookups - cls.l1_hits), 4) if lookups > cls.l1_hits else 0.0,
+            "l1_size": len(_local),
+        }
+
+
+def _key(user_id: int) -> str:
+    return USER_KEY.format(user_id=user_id)
+
+
+def _get_local(user_id: int) -> Optional[schemas.UserOut]:
+    entry = _local.get(user_id)
+    if entry is None:
+        return None
+    expires_at, user = entry
+    if expires_at <= time.time():
+        _local.pop(user_id, None)
+        return None
+    _local.move_to_end(user_id)
+    return user
+
+
+def _put_local(user: schemas.UserOut) -> None:
+    _local[user.id] = (time.time() + settings.USER_CACHE_LOCAL_TTL, user)
+    _local.move_to_end(user.id)
+    while len(_local) > settings.USER_CACHE_SIZE:
+        _local.popitem(last=False)
+
+
+def on_invalidate(callback: Callable[[Optional[int]], None]) -> None:
+    _on_invalidate.append(callback)
+
+
+def _evict_local(user_id: Optional[int]) -> None:
+    if user_id is None:
+        _local.clear()
+    else:
+        _local.pop(user_id, None)
+    for callback in _on_invalidate:
+        callback(user_id)
+
+
+async def get_cached(user_ids: Iterable[int]) -> Dict[int, schemas.UserOut]:
+    """只查 L1 / L2，不查库；返回命中的 {user_id: UserOut}"""
+    found: Dict[int, schemas.UserOut] = {}
+    remote = []
+    for user_id in dict.fromkeys(user_ids):
+        user = _get_local(user_id)
+        if user is not None:
+            found[user_id] = user
+        else:
+            remote.append(user_id)
+    UserCacheStats.record("l1_hits", len(found))
+    if not remote:
+        return found
+
+    try:
+        raw = await RedisClient.get_instance().mget([_key(user_id) for user_id in remote])
+    except RedisError:
+        UserCacheStats.errors += 1
+        return found
+    l2_hits = 0
+    for value in raw:
+        if value is not None:
+            user = schemas.UserOut.model_validate_json(value)
+            _put_local(user)
+            found[user.id] = user
+            l2_hits += 1
+    UserCacheStats.record("l2_hits", l2_hits)
+    return found
+
+
+async def put(users: Iterable[schemas.UserOut]) -> None:
+    """回填两级缓存"""
+    users = list(users)
+    for user in users:
+        _put_local(user)
+    if not users:
+        return
+    try:
+        pipe = RedisClient.get_instance().pipeline(transaction=False)
+        for user in users:
+            pipe.set(_key(user.id), user.model_dump_json(), ex=settings.USER_CACHE_TTL)
+        await pipe.execute()
+    except RedisError:
+        UserCacheStats.errors += 1
+
+
+async def get_users(db: AsyncSession, user_ids: Iterable[int]) -> Dict[int, schemas.UserOut]:
+    """批量解析用户：L1 -> 一次 MGET -> 一次 IN 查询；不存在的用户不在结果中"""
+    ids = [user_id for user_id in dict.fromkeys(user_ids) if user_id is not None]
+    if not ids:
+        return {}
+    users = await get_cached(ids)
+    missing = [user_id for user_id in ids if user_id not in users]
+    UserCacheStats.record("misses", len(missing))
+    if missing:
+        result = await db.execute(select(models.User).where(models.User.id.in_(missing)))
+        loaded = [schemas.UserOut.model_validate(u) for u in result.scalars().all()]
+        await put(loaded)
+        users.update((u.id, u) for u in loaded)
+    return users
+
+
+async def get_user(db: AsyncSession, user_id: int) -> Optional[schemas.UserOut]:
+    return (await get_users(db, [user_id])).get(user_id)
+
+
+async def invalidate(user_id: int) -> None:
+    """用户信息变更后调用：删除 L2 并通知所有 worker (含本进程) 清除 L1"""
+    _evict_local(user_id)
+    try:
+        redis = RedisClient.get_instance()
+        await redis.delete(_key(user_id))
+        await redis.publish(INVALIDATE_CHANNEL, user_id)
+    except RedisError:
+        UserCacheStats.errors += 1
+
+
+async def run_invalidation_listener() -> None:
+    """后台任务：订阅失效通知，清除本进程 L1"""
+    while True:
+        pubsub = None
+        try:
+            pubsub = RedisClient.get_instance().pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(INVALIDATE_CHANNEL)
+            # Notifications sent while we were not subscribed are lost: start from an empty L1
+            _evict_local(None)
+            while True:
+                message = await pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    _evict_local(int(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except (RedisError, OSError):
+            logger.warning("user cache: invalidation channel unavailable, retrying")
+            await asyncio.sleep(1)
+        except Exception:
+            logger.exception("user cache: invalidation listener failed")
+            await asyncio.sleep(1)
+        finally:
+            if pubsub is not None:
+                try:
+                    await pubsub.aclose()
+                except (RedisError, OSError):
+                    pass
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import secrets
+import uuid
+from collections import defaultdict
+from typing import Dict, Iterable
+
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import cache, counters, models, post_counters
+from .redis_utils import RedisClient, release_lock
+
+logger = logging.getLogger(__name__)
+
+# =======================
+# Write-Behind View Counter
+# =======================
+# 阅读数先累加在 Redis Hash 中 (Redis 不可用时累加在进程内存)，
+# 由后台任务定期批量写入计数分片 (随后折叠进 posts.view_count，见 post_counters)，读请求不再产生写事务。
+#
+# pending  : 尚未写回的增量 {post_id: n}
+# flushing : 正在写回的增量，写回期间读请求仍需计入，避免计数回退
+#
+# 每个 flushing hash 在 rename 时原子地分到一个随机 batch id；写回事务把它记入 counters 表
+# (counters.applied_view_batch)，锁过期或 worker 在提交后、删除 flushing 前退出时，
+# 下一轮看到同一个 batch id 已提交，只删除 flushing 而不重复计数。
+
+PENDING_KEY = "post:views:pending"
+FLUSHING_KEY = "post:views:flushing"
+FLUSHING_BATCH_KEY = "post:views:flushing:batch"
+FLUSH_LOCK_KEY = "post:views:flush_lock"
+FLUSH_LOCK_TTL_MS = 60_000
+
+_local_pending: Dict[int, int] = defaultdict(int)
+
+# KEYS: pending, flushing, flushing batch; ARGV: batch id for a new flushing hash
+# Returns the batch id of the flushing hash (a leftover one first), nil if there is nothing to flush
+_CLAIM_LUA = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    local batch = redis.call('GET', KEYS[3])
+    if batch then return batch end
+    redis.call('SET', KEYS[3], ARGV[1])
+    return ARGV[1]
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('SET', KEYS[3], ARGV[1])
+return ARGV[1]
+"""
+
+# KEYS: flushing, flushing batch; ARGV: batch id
+# Only drops the batch we applied: a worker whose lock expired must not delete the next one
+_FINISH_LUA = """
+if redis.call('GET', KEYS[2]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1], KEYS[2])
+end
+return 0
+"""
+
+_claim_script = None
+_finish_script = None
+
+
+async def record_view(post_id: int) -> int:
+    """记录一次阅读，返回该帖子当前尚未写回数据库的增量 (含本次)"""
+    try:
+        pipe = RedisClient.get_instance().pipeline(transaction=False)
+        pipe.hincrby(PENDING_KEY, post_id, 1)
+        pipe.hget(FLUSHING_KEY, post_id)
+        pending, flushing = await pipe.execute()
+        return int(pending) + int(flushing or 0) + _local_pending.get(post_id, 0)
+    except RedisError:
+        _local_pending[post_id] += 1
+        return _local_pending[post_id]
+
+
+async def pending_views(post_ids: Iterable[int]) -> Dict[int, int]:
+    """批量获取未写回的阅读增量 {post_id: n}"""
+    ids = list(post_ids)
+    if not ids:
+        return {}
+
+    deltas = {pid: _local_pending.get(pid, 0) for pid in ids}
+    try:
+        pipe = RedisClient.get_instance().pipeline(transaction=False)
+        pipe.hmget(PENDING_KEY, ids)
+        pipe.hmget(FLUSHING_KEY, ids)
+        pending, flushing = await pipe.execute()
+    except RedisError:
+        return deltas
+
+    for pid, p, f in zip(ids, pending, flushing):
+        deltas[pid] += int(p or 0) + int(f or 0)
+    return deltas
+
+
+async def _apply_deltas(db: AsyncSession, deltas: Dict[int, int]) -> None:
+    await post_counters.add_many(db, {post_id: (0, n, 0) for post_id, n in deltas.items() if n > 0})
+
+
+async def _flush_local(db: AsyncSession) -> int:
+    if not _local_pending:
+        return 0
+
+    deltas = dict(_local_pending)
+    _local_pending.clear()
+    try:
+        await _apply_deltas(db, deltas)
+        await db.commit()
+    except Exception:
+        # Put the views back so the next round retries them
+        for pid, n in deltas.items():
+            _local_pending[pid] += n
+        raise
+
+    await cache.add_views(deltas)
+    return len(deltas)
+
+
+async def _mark_applied(db: AsyncSession, batch: int) -> bool:
+    """在当前事务中记录 batch 已写回；该 batch 已被提交过时返回 False"""
+    name = counters.applied_view_batch()
+    # Creates the row if needed and locks it: a concurrent flush of the same batch waits for our commit
+    await counters.bump(db, name, 0)
+    result = await db.execute(
+        update(models.Counter)
+        .where(models.Counter.name == name, models.Counter.value != batch)
+        .values(value=batch)
+    )
+    return result.rowcount > 0
+
+
+async def _flush_redis(db: AsyncSession) -> int:
+    global _claim_script, _finish_script
+    redis = RedisClient.get_instance()
+    token = uuid.uuid4().hex
+    # Only one worker flushes at a time; the batch id below still guards against an expired lock
+    if not await redis.set(FLUSH_LOCK_KEY, token, nx=True, px=FLUSH_LOCK_TTL_MS):
+        return 0
+
+    try:
+        if _claim_script is None:
+            _claim_script = redis.register_script(_CLAIM_LUA)
+            _finish_script = redis.register_script(_FINISH_LUA)
+        # A leftover FLUSHING hash means the previous round died mid-way: finish it first
+        batch = await _claim_script(
+            keys=[PENDING_KEY, FLUSHING_KEY, FLUSHING_BATCH_KEY], args=[secrets.randbits(62)], client=redis
+        )
+        if batch is None:
+            return 0  # no pending views
+        batch = int(batch)
+
+        raw = await redis.hgetall(FLUSHING_KEY)
+        deltas = {int(pid): int(n) for pid, n in raw.items()}
+        applied = await _mark_applied(db, batch)
+        if applied:
+            await _apply_deltas(db, deltas)
+            await db.commit()
+        else:
+            await db.rollback()
+            logger.warning("view counter: batch %s was already written, dropping it", batch)
+
+        await _finish_script(keys=[FLUSHING_KEY, FLUSHING_BATCH_KEY], args=[batch], client=redis)
+        if not applied:
+            # Whether the earlier round moved these views into the cached details is unknown: reload them
+            for post_id in deltas:
+                await cache.invalidate_post_detail(post_id)
+            return 0
+        # Hot posts keep their cached detail: the flushed views move from the pending overlay into it
+        await cache.add_views(deltas)
+        return len(deltas)
+    finally:
+        await release_lock(FLUSH_LOCK_KEY, token)
+
+
+async def flush_views(db: AsyncSession) -> int:
+    """把累积的阅读增量写入计数分片并折叠回 posts，返回本轮写入阅读数的帖子数"""
+    flushed = await _flush_local(db)
+    try:
+        flushed += await _flush_redis(db)
+    except RedisError:
+        logger.warning("view counter: redis unavailable, skipped redis flush")
+    # Right after the flush, so list views (posts.view_count + Redis pending) don't dip in between
+    await post_counters.fold(db)
+    return flushed
+
+
+async def run_flusher(session_factory, interval: float) -> None:
+    """后台任务：每隔 interval 秒写回一次阅读数"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as db:
+                await flush_views(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("view counter: flush failed")
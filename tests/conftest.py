@@ -0,0 +1,96 @@
+"""
+Shared test setup: settings from the environment, fakeredis in place of Redis and an empty database.
+
+The database is an in-memory SQLite database (aiosqlite) unless TEST_DATABASE_URL points
+to an empty MySQL schema (mysql+aiomysql://...).
+"""
+import os
+
+# Settings are read when my_app.database is imported: set the required ones before any test module imports it
+os.environ.setdefault("DB_CONNECTION", "mysql")
+os.environ.setdefault("DB_HOST", "localhost")
+os.environ.setdefault("DB_PORT", "3306")
+os.environ.setdefault("DB_USERNAME", "test")
+os.environ.setdefault("DB_PASSWORD", "test")
+os.environ.setdefault("DB_DATABASE", "test")
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("SECRET_KEY", "test")
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from my_app import models  # registers the tables on Base.metadata
+from my_app.database import Base
+from my_app.redis_utils import RedisClient
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL", "sqlite+aiosqlite://")
+
+
+def session_factory(engine: AsyncEngine) -> async_sessionmaker:
+    # Same options as database._session_factory
+    return async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+
+
+async def create_engine(url: str) -> AsyncEngine:
+    if url.startswith("sqlite"):
+        pytest.importorskip("aiosqlite")
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    return engine
+
+
+@pytest.fixture
+def fake_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    RedisClient._instance = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield RedisClient._instance
+    RedisClient._instance = None
+
+
+@pytest.fixture
+async def engine():
+    engine = await create_engine(TEST_DATABASE_URL)
+    yield engine
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+@pytest.fixture
+def Session(engine):
+    return session_factory(engine)
+
+
+def _reset_process_state() -> None:
+    # In-process caches outlive a test's database and Redis
+    from my_app import auth_cache, bloom, rate_limit, read_your_writes, user_cache, view_counter
+    auth_cache._tokens.clear()
+    user_cache._local.clear()
+    read_your_writes._local_pins.clear()
+    rate_limit._local_buckets.clear()
+    view_counter._local_pending.clear()
+    bloom._dirty.clear()
+
+
+@pytest.fixture
+async def client(engine, fake_redis, monkeypatch):
+    """HTTP client for the app (lifespan tasks not started), with the test database as primary"""
+    httpx = pytest.importorskip("httpx")
+    from my_app import database, main
+
+    monkeypatch.setattr(database, "AsyncSessionLocal", session_factory(engine))
+    _reset_process_state()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as c:
+        yield c
+    _reset_process_state()
+
+
+async def login(client, username: str) -> dict:
+    """Sign up (simulation mode: no password) and return the Authorization header"""
+    r = await client.post("/users", json={"username": username})
+    assert r.status_code == 200, r.text
+    r = await client.post("/token", data={"username": username, "password": "x"})
+    assert r.status_code == 200, r.text
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
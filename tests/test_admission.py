@@ -0,0 +1,46 @@
+"""
+Admission control (admission) in front of the DB session dependencies: with every slot taken,
+a request waits at most max_wait, or is refused at once when the queue is full, with 503 + Retry-After.
+"""
+import asyncio
+
+import pytest
+
+from my_app import admission
+
+
+async def test_gate_sheds_when_saturated():
+    gate = admission.Gate("test", concurrency=1, max_wait=0.05, max_queue=1)
+    await gate.acquire()
+
+    waiter = asyncio.create_task(gate.acquire())
+    await asyncio.sleep(0)
+    assert gate.waiting == 1
+    # Queue full: refused without waiting
+    with pytest.raises(admission.Overloaded) as exc:
+        await gate.acquire()
+    assert exc.value.reason == "queue_full"
+
+    # The waiter gives up after max_wait
+    with pytest.raises(admission.Overloaded) as exc:
+        await waiter
+    assert (exc.value.reason, exc.value.retry_after) == ("timeout", 1)
+    assert gate.shed == 2
+
+    gate.release()
+    await gate.acquire()
+    assert gate.in_flight == 1
+
+
+async def test_saturated_reads_get_503(client, monkeypatch):
+    gate = admission.Gate("read", concurrency=1, max_wait=0.05, max_queue=10)
+    monkeypatch.setattr(admission, "reads", gate)
+    await gate.acquire()
+
+    r = await client.get("/posts")
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+
+    gate.release()
+    assert (await client.get("/posts")).status_code == 200
+    assert gate.in_flight == 0
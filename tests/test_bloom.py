@@ -0,0 +1,94 @@
+"""
+Bloom filter / negative cache (bloom) against fakeredis and an in-memory SQLite database:
+ids unknown to a built filter are rejected, new ids are added, the filter is unused until built.
+"""
+import contextlib
+
+import pytest
+
+from my_app import bloom, crud, database, models, schemas
+from my_app.database import settings
+from my_app.redis_utils import RedisClient
+
+
+@pytest.fixture(autouse=True)
+def small_filters(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "BLOOM_EXPECTED_IDS", 1000)
+    bloom._scripts.clear()
+    yield
+    bloom._scripts.clear()
+
+
+async def test_unused_until_built(Session):
+    assert not await bloom.is_missing("post", 42)
+    await bloom.ensure_built(Session)
+    assert await bloom.is_missing("post", 42)
+    assert (await bloom.status())["post"]["ready"]
+
+
+async def test_rebuild_and_add(Session):
+    async with Session() as db:
+        user = await crud.create_user(db, schemas.UserCreate(username="alice"))
+        kept = await crud.create_post(db, schemas.PostCreate(title="kept", content="x"), user_id=user.id)
+        gone = await crud.create_post(db, schemas.PostCreate(title="gone", content="x"), user_id=user.id)
+        user_id, kept_id, gone_id = user.id, kept.id, gone.id
+        await crud.delete_post(db, gone_id)
+        await RedisClient.get_instance().delete(bloom.NEGATIVE_KEY.format(kind="post", id=gone_id))
+        assert await bloom.rebuild(db, "post") == 1
+
+    assert not await bloom.is_missing("post", kept_id)
+    # Soft-deleted posts are left out of the rebuilt filter
+    assert await bloom.is_missing("post", gone_id)
+
+    async with Session() as db:
+        new = await crud.create_post(db, schemas.PostCreate(title="new", content="x"), user_id=user_id)
+    assert not await bloom.is_missing("post", new.id)
+
+
+async def test_negative_cache_cleared_on_create(Session):
+    # Filter not built: only the negative cache answers
+    async with Session() as db:
+        await bloom.mark_missing(db, "user", 1)
+    assert await bloom.is_missing("user", 1)
+    async with Session() as db:
+        user = await crud.create_user(db, schemas.UserCreate(username="alice"))
+    assert user.id == 1
+    assert not await bloom.is_missing("user", 1)
+
+
+async def test_replica_miss_confirmed_on_primary(Session, monkeypatch):
+    async with Session() as db:
+        user = await crud.create_user(db, schemas.UserCreate(username="alice"))
+        user_id = user.id
+
+    @contextlib.asynccontextmanager
+    async def primary_session(use_primary=False):
+        async with Session() as db:
+            yield db
+
+    # The row exists on the primary but the (lagging) replica did not find it: no negative entry
+    monkeypatch.setattr(database, "is_replica_session", lambda db: True)
+    monkeypatch.setattr(database, "read_session", primary_session)
+    async with Session() as db:
+        await bloom.mark_missing(db, "user", user_id)
+        assert not await bloom.is_missing("user", user_id)
+        await bloom.mark_missing(db, "user", user_id + 1)
+    assert await bloom.is_missing("user", user_id + 1)
+
+
+async def test_lost_add_is_checked_in_db(Session):
+    await bloom.ensure_built(Session)
+    async with Session() as db:
+        await crud.create_user(db, schemas.UserCreate(username="alice"))
+        # Committed without add(), as if the process died right after the commit
+        db.add(models.User(username="lost"))
+        await db.commit()
+    lost_id = 2
+
+    # Above every id added so far: not distinguishable from a probe yet
+    assert await bloom.is_missing("user", lost_id)
+    async with Session() as db:
+        await crud.create_user(db, schemas.UserCreate(username="bob"))
+    # Below the largest added id but not in the filter: looked up in the DB instead of a 404
+    assert not await bloom.is_missing("user", lost_id)
+    assert await bloom.is_missing("user", lost_id + 2)
@@ -0,0 +1,122 @@
+"""
+Async comment ingestion (comment_queue) against fakeredis and an in-memory SQLite database:
+batched inserts with coalesced counters, idempotent redelivery, replies to queued parents.
+"""
+import pytest
+from sqlalchemy import select
+
+from my_app import comment_queue, counters, crud, models, post_counters, schemas
+from my_app.redis_utils import RedisClient
+
+pytestmark = pytest.mark.usefixtures("fake_redis")
+
+
+@pytest.fixture
+async def post(Session):
+    async with Session() as db:
+        user = await crud.create_user(db, schemas.UserCreate(username="alice"))
+        return await crud.create_post(db, schemas.PostCreate(title="post", content="x"), user_id=user.id)
+
+
+async def enqueue(Session, post_id: int, parent_id=None) -> schemas.CommentCreatedData:
+    async with Session() as db:
+        return await comment_queue.enqueue(
+            db, schemas.CommentCreate(post_id=post_id, content="c", parent_id=parent_id), user_id=1
+        )
+
+
+async def consume(Session) -> int:
+    return await comment_queue.consume_once(Session, "test", batch_size=100, block_ms=1, claim_idle_ms=60000)
+
+
+async def test_batch_insert_coalesces_counters(Session, post):
+    # A deleted root without replies is hidden; a queued reply brings it back
+    async with Session() as db:
+        old_root = await crud.create_comment(db, schemas.CommentCreate(post_id=post.id, content="old"), user_id=1)
+        await crud.delete_comment(db, old_root.id)
+
+    root = await enqueue(Session, post.id)
+    reply = await enqueue(Session, post.id, parent_id=root.id)
+    nested = await enqueue(Session, post.id, parent_id=reply.id)
+    await enqueue(Session, post.id, parent_id=old_root.id)
+    assert nested.root_id == root.id
+
+    assert await consume(Session) == 4
+    async with Session() as db:
+        rows = {c.id: c for c in (await db.execute(select(models.Comment))).scalars()}
+        assert rows[nested.id].root_id == root.id
+        assert (rows[root.id].reply_count, rows[root.id].live_reply_count) == (2, 2)
+        assert rows[old_root.id].live_reply_count == 1
+        assert (await post_counters.unfolded(db, [post.id]))[post.id] == (5, 0, 2)
+        await post_counters.fold(db)
+        assert await counters.get_value(db, counters.visible_root_comments(post.id)) == 2
+    assert await RedisClient.get_instance().xlen(comment_queue.STREAM_KEY) == 0
+
+
+async def test_redelivery_is_idempotent(Session, post):
+    root = await enqueue(Session, post.id)
+    await enqueue(Session, post.id, parent_id=root.id)
+    redis = RedisClient.get_instance()
+    messages = await redis.xrange(comment_queue.STREAM_KEY)
+    assert await consume(Session) == 2
+
+    # The same messages again, as if the XACK after the commit had been lost
+    for _, fields in messages:
+        await redis.xadd(comment_queue.STREAM_KEY, fields)
+    assert await consume(Session) == 2
+    async with Session() as db:
+        assert len((await db.execute(select(models.Comment))).all()) == 2
+        root_row = await db.get(models.Comment, root.id)
+        assert root_row.reply_count == 1
+        assert (await post_counters.unfolded(db, [post.id]))[post.id][0] == 2
+
+
+async def test_reply_to_queued_parent_waits(Session, post):
+    root = await enqueue(Session, post.id)
+    await enqueue(Session, post.id, parent_id=root.id)
+    redis = RedisClient.get_instance()
+    root_entry, reply_entry = await redis.xrange(comment_queue.STREAM_KEY)
+
+    # The reply alone (its root is in another consumer's batch) is retried, not turned into a root
+    async with Session() as db:
+        with pytest.raises(comment_queue.ParentNotWritten):
+            await comment_queue.write_batch(db, [reply_entry])
+    async with Session() as db:
+        assert await comment_queue.write_batch(db, [root_entry]) == 1
+        assert await comment_queue.write_batch(db, [reply_entry]) == 1
+
+
+async def test_enqueue_rejects_unknown_parent(Session, post):
+    with pytest.raises(comment_queue.CommentRejected):
+        await enqueue(Session, post.id, parent_id=12345)
+    with pytest.raises(comment_queue.CommentRejected):
+        await enqueue(Session, post.id + 1)
+
+
+async def test_fallback_ids_skip_queued_ids(Session, post):
+    # Redis went down after this comment was queued: the synchronous write must not take its id
+    queued = await enqueue(Session, post.id)
+    async with Session() as db:
+        comment_id = await comment_queue.allocate_ids(db, 1)
+        written = await crud.create_comment(
+            db, schemas.CommentCreate(post_id=post.id, content="sync"), user_id=1, comment_id=comment_id
+        )
+    assert written.id != queued.id
+    assert await consume(Session) == 1
+    async with Session() as db:
+        assert (await db.get(models.Comment, queued.id)).content == "c"
+
+
+async def test_id_conflict_is_dead_lettered(Session, post):
+    queued = await enqueue(Session, post.id)
+    # Bypasses the reservation, e.g. written while async writes were switched off with a backlog
+    async with Session() as db:
+        await crud.create_comment(
+            db, schemas.CommentCreate(post_id=post.id, content="other"), user_id=1, comment_id=queued.id
+        )
+    assert await consume(Session) == 1
+    redis = RedisClient.get_instance()
+    assert await redis.xlen(comment_queue.STREAM_KEY) == 0
+    assert await redis.xlen(comment_queue.DEAD_KEY) == 1
+    async with Session() as db:
+        assert (await db.get(models.Comment, queued.id)).content == "other"
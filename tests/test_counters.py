@@ -0,0 +1,139 @@
+"""
+Maintained counters against fakeredis and an in-memory SQLite database: after every write the
+estimated totals (counters rows + unfolded shards) and the denormalized reply counters on roots
+must agree with counting the rows.
+"""
+import pytest
+from sqlalchemy import func, select
+
+from my_app import crud, models, post_counters, schemas
+
+from conftest import login
+
+pytestmark = pytest.mark.usefixtures("fake_redis")
+
+
+@pytest.fixture
+async def data(Session):
+    async with Session() as db:
+        alice = await crud.create_user(db, schemas.UserCreate(username="alice"))
+        bob = await crud.create_user(db, schemas.UserCreate(username="bob"))
+        post = await crud.create_post(db, schemas.PostCreate(title="p", content="x"), user_id=alice.id)
+        other = await crud.create_post(db, schemas.PostCreate(title="o", content="x"), user_id=bob.id)
+        return {"alice": alice.id, "bob": bob.id, "post": post.id, "other": other.id}
+
+
+async def comment(Session, post_id: int, parent_id=None) -> int:
+    async with Session() as db:
+        c = await crud.create_comment(
+            db, schemas.CommentCreate(post_id=post_id, content="c", parent_id=parent_id), user_id=1
+        )
+        return c.id
+
+
+async def delete(Session, comment_id: int) -> None:
+    async with Session() as db:
+        assert await crud.delete_comment(db, comment_id)
+
+
+async def assert_consistent(Session, data) -> None:
+    async with Session() as db:
+        for post_id in (data["post"], data["other"]):
+            totals = {
+                mode: (await crud.get_root_comments(db, post_id, page_size=100, count_mode=mode))[1]
+                for mode in (schemas.CountMode.exact, schemas.CountMode.estimated)
+            }
+            assert totals[schemas.CountMode.estimated] == totals[schemas.CountMode.exact], post_id
+
+            post = await db.get(models.Post, post_id, populate_existing=True)
+            comments, _, _ = (await post_counters.unfolded(db, [post_id])).get(post_id, (0, 0, 0))
+            stored = (await db.execute(
+                select(func.count()).select_from(models.Comment).where(models.Comment.post_id == post_id)
+            )).scalar()
+            assert post.comment_count + comments == stored
+
+        for user_id in (None, data["alice"], data["bob"]):
+            totals = {
+                mode: (await crud.get_posts(db, page_size=1, user_id=user_id, count_mode=mode))[1]
+                for mode in (schemas.CountMode.exact, schemas.CountMode.estimated)
+            }
+            assert totals[schemas.CountMode.estimated] == totals[schemas.CountMode.exact], user_id
+
+        roots = (await db.execute(
+            select(models.Comment).where(models.Comment.parent_id == None).execution_options(populate_existing=True)
+        )).scalars().all()
+        for root in roots:
+            replies = select(func.count()).select_from(models.Comment).where(
+                models.Comment.root_id == root.id, models.Comment.parent_id != None
+            )
+            assert root.reply_count == (await db.execute(replies)).scalar(), root.id
+            live = replies.where(models.Comment.is_deleted == False)
+            assert root.live_reply_count == (await db.execute(live)).scalar(), root.id
+            assert root.live_reply_count >= 0
+
+
+async def test_counters_follow_creates_and_deletes(Session, data):
+    post = data["post"]
+    roots = [await comment(Session, post) for _ in range(3)]
+    reply = await comment(Session, post, parent_id=roots[0])
+    await comment(Session, post, parent_id=reply)
+    await comment(Session, post, parent_id=roots[0])
+    await comment(Session, data["other"])
+    await assert_consistent(Session, data)
+
+    # A deleted root without replies leaves the list, one with live replies stays
+    await delete(Session, roots[1])
+    await delete(Session, roots[0])
+    await delete(Session, reply)
+    await assert_consistent(Session, data)
+
+    async with Session() as db:
+        for c in (await db.execute(
+            select(models.Comment.id).where(models.Comment.root_id == roots[0], models.Comment.is_deleted == False)
+        )).scalars():
+            assert await crud.delete_comment(db, c)
+    await assert_consistent(Session, data)
+
+    async with Session() as db:
+        assert await crud.delete_post(db, data["other"])
+    await assert_consistent(Session, data)
+
+
+async def test_reply_to_deleted_root_brings_it_back(Session, data):
+    post = data["post"]
+    root = await comment(Session, post)
+    await delete(Session, root)
+    await assert_consistent(Session, data)
+
+    reply = await comment(Session, post, parent_id=root)
+    await assert_consistent(Session, data)
+    await delete(Session, reply)
+    await assert_consistent(Session, data)
+
+
+async def test_unknown_or_foreign_parent_is_rejected(Session, data):
+    foreign_root = await comment(Session, data["other"])
+    for post_id, parent_id in ((data["post"], 9999), (data["post"], foreign_root)):
+        with pytest.raises(crud.ParentNotFound):
+            await comment(Session, post_id, parent_id=parent_id)
+    await assert_consistent(Session, data)
+
+
+async def test_counters_survive_folding(Session, data):
+    post = data["post"]
+    root = await comment(Session, post)
+    await comment(Session, post, parent_id=root)
+    await delete(Session, root)
+    async with Session() as db:
+        await post_counters.fold(db)
+        assert (await post_counters.unfolded(db, [post])).get(post, (0, 0, 0)) == (0, 0, 0)
+    await assert_consistent(Session, data)
+
+
+async def test_orphan_reply_is_404(client, Session, data):
+    headers = await login(client, "carol")
+    r = await client.post(f"/posts/{data['post']}/comments", json={"content": "c", "parent_id": 9999}, headers=headers)
+    assert r.status_code == 404
+    r = await client.get(f"/posts/{data['post']}/comments", params={"count": "estimated"})
+    assert r.json()["data"]["pagination"]["total"] == 0
+    await assert_consistent(Session, data)
@@ -0,0 +1,72 @@
+"""
+Conditional GET (http_cache) through the app: If-None-Match answers 304 until a write touches the
+version stamp, and ids that don't exist never get a 304 or a stamp.
+"""
+from my_app import bloom, database, http_cache
+
+from conftest import login
+
+
+async def create_post(client, headers) -> int:
+    r = await client.post("/posts", json={"title": "t", "content": "x"}, headers=headers)
+    assert r.status_code == 201, r.text
+    return r.json()["data"]["id"]
+
+
+async def test_post_detail_not_modified_until_commented(client):
+    headers = await login(client, "alice")
+    post_id = await create_post(client, headers)
+
+    r = await client.get(f"/posts/{post_id}")
+    etag = r.headers["ETag"]
+    assert r.headers["Last-Modified"]
+    views = r.json()["data"]["view_count"]
+
+    r = await client.get(f"/posts/{post_id}", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+    # The 304 still counts as a view
+    r = await client.get(f"/posts/{post_id}")
+    assert r.json()["data"]["view_count"] == views + 2
+
+    r = await client.get(f"/posts/{post_id}/comments")
+    comments_etag = r.headers["ETag"]
+    assert (await client.get(f"/posts/{post_id}/comments", headers={"If-None-Match": comments_etag})).status_code == 304
+
+    r = await client.post(f"/posts/{post_id}/comments", json={"content": "c"}, headers=headers)
+    assert r.status_code == 201
+    for path, tag in ((f"/posts/{post_id}", etag), (f"/posts/{post_id}/comments", comments_etag)):
+        r = await client.get(path, headers={"If-None-Match": tag})
+        assert r.status_code == 200, path
+        assert r.headers["ETag"] != tag
+
+
+async def test_feed_not_modified_until_posted(client):
+    headers = await login(client, "alice")
+    await create_post(client, headers)
+    etag = (await client.get("/posts", params={"pageSize": 5})).headers["ETag"]
+    assert (await client.get("/posts", params={"pageSize": 5}, headers={"If-None-Match": etag})).status_code == 304
+    # Other query parameters are another representation
+    assert (await client.get("/posts", params={"pageSize": 6}, headers={"If-None-Match": etag})).status_code == 200
+
+    await create_post(client, headers)
+    assert (await client.get("/posts", params={"pageSize": 5}, headers={"If-None-Match": etag})).status_code == 200
+
+
+async def test_missing_or_deleted_post_is_never_not_modified(client, fake_redis):
+    headers = await login(client, "alice")
+    post_id = await create_post(client, headers)
+    etag = (await client.get(f"/posts/{post_id}")).headers["ETag"]
+
+    # "*" can't be confirmed before the DB is read: full response
+    assert (await client.get(f"/posts/{post_id}", headers={"If-None-Match": "*"})).status_code == 200
+
+    assert (await client.delete(f"/posts/{post_id}", headers=headers)).status_code == 200
+    for tag in (etag, "*"):
+        assert (await client.get(f"/posts/{post_id}", headers={"If-None-Match": tag})).status_code == 404
+
+    # Ids ruled out by the filter get no version stamp
+    await bloom.ensure_built(database.AsyncSessionLocal)
+    r = await client.get("/posts/12345", headers={"If-None-Match": "*"})
+    assert r.status_code == 404
+    assert not await fake_redis.exists(http_cache.post_key(12345))
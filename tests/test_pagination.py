@@ -0,0 +1,64 @@
+"""
+Keyset (cursor) pagination through the app: following next_cursor visits every post / root comment
+exactly once, newest first, also when rows are added while paging.
+"""
+import pytest
+
+from conftest import login
+
+
+async def walk(client, path: str, page_size: int) -> list:
+    ids, cursor = [], None
+    while True:
+        params = {"pageSize": page_size, "count": "none"}
+        if cursor:
+            params["cursor"] = cursor
+        r = await client.get(path, params=params)
+        assert r.status_code == 200, r.text
+        data = r.json()["data"]
+        assert len(data["list"]) <= page_size
+        ids += [item["id"] for item in data["list"]]
+        cursor = data["pagination"]["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+async def test_post_feed_cursor(client):
+    headers = await login(client, "alice")
+    # RATE_LIMIT_POST allows a burst of 5
+    post_ids = []
+    for _ in range(4):
+        r = await client.post("/posts", json={"title": "t", "content": "x"}, headers=headers)
+        post_ids.append(r.json()["data"]["id"])
+
+    assert await walk(client, "/posts", 3) == post_ids[::-1]
+    assert await walk(client, "/posts", 4) == post_ids[::-1]
+
+    # A post created after the first page does not shift the next pages
+    first = (await client.get("/posts", params={"pageSize": 2})).json()["data"]
+    assert [p["id"] for p in first["list"]] == post_ids[:1:-1]
+    await client.post("/posts", json={"title": "t", "content": "x"}, headers=headers)
+    r = await client.get("/posts", params={"pageSize": 10, "cursor": first["pagination"]["next_cursor"]})
+    assert [p["id"] for p in r.json()["data"]["list"]] == post_ids[1::-1]
+
+
+async def test_root_comment_cursor(client):
+    headers = await login(client, "alice")
+    r = await client.post("/posts", json={"title": "t", "content": "x"}, headers=headers)
+    post_id = r.json()["data"]["id"]
+    root_ids = []
+    for _ in range(5):
+        r = await client.post(f"/posts/{post_id}/comments", json={"content": "c"}, headers=headers)
+        root_ids.append(r.json()["data"]["id"])
+    # Replies are not listed as roots
+    await client.post(f"/posts/{post_id}/comments", json={"content": "r", "parent_id": root_ids[0]}, headers=headers)
+
+    assert await walk(client, f"/posts/{post_id}/comments", 2) == root_ids[::-1]
+    assert await walk(client, f"/posts/{post_id}/thread", 3) == root_ids[::-1]
+
+
+async def test_invalid_paging_parameters(client):
+    assert (await client.get("/posts", params={"cursor": "not-a-cursor"})).status_code == 400
+    for params in ({"pageSize": 0}, {"pageSize": 101}, {"page": 0}):
+        assert (await client.get("/posts", params=params)).status_code == 422, params
+        assert (await client.get("/posts/1/comments", params=params)).status_code == 422, params
@@ -0,0 +1,46 @@
+"""
+Token-bucket rate limits (rate_limit) through the app: the request past the bucket gets 429 with
+Retry-After, other users keep their own bucket, and the in-process fallback still limits without Redis.
+"""
+import pytest
+
+from my_app import database, rate_limit
+from my_app.redis_utils import RedisClient
+
+from conftest import login
+
+
+async def create_post(client, headers):
+    return await client.post("/posts", json={"title": "t", "content": "x"}, headers=headers)
+
+
+async def test_posting_past_the_limit_is_429(client):
+    capacity = rate_limit.Rule.parse("post", database.settings.RATE_LIMIT_POST).capacity
+    alice, bob = await login(client, "alice"), await login(client, "bob")
+
+    for i in range(capacity):
+        r = await create_post(client, alice)
+        assert r.status_code == 201, r.text
+        assert r.headers["X-RateLimit-Remaining"] == str(capacity - i - 1)
+
+    r = await create_post(client, alice)
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+    assert r.headers["X-RateLimit-Remaining"] == "0"
+
+    # Counted per user
+    assert (await create_post(client, bob)).status_code == 201
+
+
+async def test_local_buckets_when_redis_is_down(client, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    rule = rate_limit.Rule.parse("test", "2/60")
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setattr(RedisClient, "_instance", fakeredis.aioredis.FakeRedis(server=server))
+    monkeypatch.setattr(rate_limit, "_bucket_script", None)
+
+    decisions = [await rate_limit.hit(rule, "user:1") for _ in range(3)]
+    assert [d.allowed for d in decisions] == [True, True, False]
+    assert decisions[-1].retry_after > 0
+    assert (await rate_limit.hit(rule, "user:2")).allowed
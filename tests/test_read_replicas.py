@@ -0,0 +1,95 @@
+"""
+Read replica routing (database.read_session / get_read_db) with SQLite files as primary and replicas:
+round-robin over replicas, failover when a replica can't connect, read-your-writes pinning.
+"""
+import pytest
+from sqlalchemy import select
+
+from my_app import cache, crud, database, models, read_your_writes, schemas
+
+from conftest import create_engine, login, session_factory
+
+
+@pytest.fixture
+async def replicas(engine, tmp_path, monkeypatch):
+    """Two replica files, each holding one user named after it; the primary is the conftest engine"""
+    urls = []
+    for name in ("replica1", "replica2"):
+        url = f"sqlite+aiosqlite:///{tmp_path / name}.db"
+        replica_engine = await create_engine(url)
+        async with session_factory(replica_engine)() as db:
+            await crud.create_user(db, schemas.UserCreate(username=name))
+        await replica_engine.dispose()
+        urls.append(url)
+    async with session_factory(engine)() as db:
+        await crud.create_user(db, schemas.UserCreate(username="primary"))
+
+    router = database.ReplicaRouter(urls)
+    monkeypatch.setattr(database, "replica_router", router)
+    monkeypatch.setattr(database, "AsyncSessionLocal", session_factory(engine))
+    yield router
+    for replica in router.replicas:
+        await replica.engine.dispose()
+
+
+async def served_by(**kwargs) -> str:
+    async with database.read_session(**kwargs) as db:
+        return (await db.execute(select(models.User.username))).scalar_one()
+
+
+async def test_round_robin(fake_redis, replicas):
+    assert [await served_by() for _ in range(4)] == ["replica1", "replica2", "replica1", "replica2"]
+    assert await served_by(use_primary=True) == "primary"
+
+    async with database.read_session() as db:
+        assert database.is_replica_session(db)
+    async with database.read_session(use_primary=True) as db:
+        assert not database.is_replica_session(db)
+
+
+async def test_failover(fake_redis, replicas, tmp_path):
+    replicas.replicas.insert(0, database.Replica(f"sqlite+aiosqlite:///{tmp_path}/missing/dir.db"))
+    broken = replicas.replicas[0]
+
+    # The broken replica is skipped and marked down, reads keep going to the healthy ones
+    assert await served_by() == "replica1"
+    assert not broken.healthy
+    assert {await served_by() for _ in range(4)} == {"replica1", "replica2"}
+
+    # Every replica down: the primary serves the reads
+    for replica in replicas.replicas:
+        replica.mark_down()
+    assert await served_by() == "primary"
+    await broken.engine.dispose()
+
+
+async def test_writers_are_pinned_to_primary(client, fake_redis, replicas):
+    # Replicas never receive the post (no replication here): only the primary can see it
+    headers = await login(client, "alice")
+    r = await client.post("/posts", json={"title": "t", "content": "x"}, headers=headers)
+    assert r.status_code == 201, r.text
+
+    r = await client.get("/posts", params={"count": "exact"}, headers=headers)
+    assert r.json()["data"]["pagination"]["total"] == 1
+    r = await client.get("/posts", params={"count": "exact"})
+    assert r.json()["data"]["pagination"]["total"] == 0
+
+    # Once the pin is gone (READ_YOUR_WRITES_SECONDS) the writer reads from replicas again
+    read_your_writes._local_pins.clear()
+    await fake_redis.delete(*await fake_redis.keys(read_your_writes.PIN_KEY.format(user_id="*")))
+    r = await client.get("/posts", params={"count": "exact"}, headers=headers)
+    assert r.json()["data"]["pagination"]["total"] == 0
+
+
+async def test_post_cache_is_filled_from_primary(fake_redis, replicas):
+    # The replicas still have a post the primary has deleted
+    for factory in [r.session_factory for r in replicas.replicas] + [database.AsyncSessionLocal]:
+        async with factory() as db:
+            post = await crud.create_post(db, schemas.PostCreate(title="t", content="x"), user_id=1)
+    async with database.AsyncSessionLocal() as db:
+        assert await crud.delete_post(db, post.id)
+
+    async with database.read_session() as db:
+        assert database.is_replica_session(db)
+        assert await crud.get_post_detail(db, post.id) is None
+    assert not await cache.is_post_detail_cached(post.id)
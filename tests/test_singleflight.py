@@ -0,0 +1,55 @@
+"""
+singleflight: concurrent calls with the same key share one execution.
+"""
+import asyncio
+
+import pytest
+
+from my_app import singleflight
+
+
+async def test_concurrent_calls_share_one_execution():
+    runs = []
+
+    async def load(key):
+        runs.append(key)
+        await asyncio.sleep(0.01)
+        return [key]
+
+    results = await asyncio.gather(
+        *(singleflight.do(("test", 1), lambda: load(1)) for _ in range(10)),
+        singleflight.do(("test", 2), lambda: load(2)),
+    )
+    assert sorted(runs) == [1, 2]
+    assert results[:10] == [[1]] * 10 and results[0] is results[9]
+    assert results[10] == [2]
+    assert singleflight._calls == {}
+
+
+async def test_errors_are_shared():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(*(singleflight.do(("test",), fail) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+async def test_cancelled_leader_hands_over():
+    runs = 0
+
+    async def load():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.05)
+        return runs
+
+    leader = asyncio.create_task(singleflight.do(("test",), load))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(singleflight.do(("test",), load))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    # The follower runs the call itself instead of failing with the leader's cancellation
+    assert await follower == 2
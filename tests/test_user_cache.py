@@ -0,0 +1,61 @@
+"""
+Two-level user cache (user_cache): a notification published by another worker clears this
+worker's L1 through the listener, and invalidate() drops L2 so the next read reloads from the DB.
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import update
+
+from my_app import crud, models, schemas, user_cache
+
+
+async def wait_for(predicate, timeout: float = 3.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+async def listener(fake_redis):
+    user_cache._local.clear()
+    task = asyncio.create_task(user_cache.run_invalidation_listener())
+    # Wait for the subscription before anything is published
+    while (await fake_redis.pubsub_numsub(user_cache.INVALIDATE_CHANNEL))[0][1] == 0:
+        await asyncio.sleep(0.01)
+    yield task
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    user_cache._local.clear()
+
+
+async def test_published_invalidation_clears_l1(Session, fake_redis, listener):
+    async with Session() as db:
+        alice = await crud.create_user(db, schemas.UserCreate(username="alice"))
+        bob = await crud.create_user(db, schemas.UserCreate(username="bob"))
+        await user_cache.get_users(db, [alice.id, bob.id])
+    assert set(user_cache._local) == {alice.id, bob.id}
+
+    # Sent by another worker: only the channel, this process did not call invalidate()
+    await fake_redis.publish(user_cache.INVALIDATE_CHANNEL, alice.id)
+    await wait_for(lambda: alice.id not in user_cache._local)
+    assert bob.id in user_cache._local
+
+
+async def test_invalidate_reloads_from_db(Session, fake_redis, listener):
+    async with Session() as db:
+        alice = await crud.create_user(db, schemas.UserCreate(username="alice"))
+        assert (await user_cache.get_user(db, alice.id)).username == "alice"
+        assert await fake_redis.exists(user_cache._key(alice.id))
+
+        await db.execute(update(models.User).where(models.User.id == alice.id).values(username="alice2"))
+        await db.commit()
+        # Still served from the cache until someone invalidates
+        assert (await user_cache.get_user(db, alice.id)).username == "alice"
+
+        await user_cache.invalidate(alice.id)
+        assert alice.id not in user_cache._local
+        assert not await fake_redis.exists(user_cache._key(alice.id))
+        assert (await user_cache.get_user(db, alice.id)).username == "alice2"
@@ -0,0 +1,73 @@
+"""
+Write-behind view counter (view_counter) against fakeredis and SQLite: a FLUSHING hash whose
+batch was already committed is dropped instead of being counted a second time.
+"""
+import pytest
+
+from my_app import crud, models, post_counters, schemas, view_counter
+
+
+@pytest.fixture
+async def post_id(Session, fake_redis, monkeypatch):
+    # Scripts are registered on the fake client of this test
+    monkeypatch.setattr(view_counter, "_claim_script", None)
+    monkeypatch.setattr(view_counter, "_finish_script", None)
+    async with Session() as db:
+        user = await crud.create_user(db, schemas.UserCreate(username="alice"))
+        post = await crud.create_post(db, schemas.PostCreate(title="t", content="x"), user_id=user.id)
+        return post.id
+
+
+async def flush(Session) -> int:
+    async with Session() as db:
+        return await view_counter.flush_views(db)
+
+
+async def views(Session, post_id: int) -> int:
+    """Views committed to the DB, folded or still in the shards"""
+    async with Session() as db:
+        _, unfolded, _ = (await post_counters.unfolded(db, [post_id])).get(post_id, (0, 0, 0))
+        return (await db.get(models.Post, post_id)).view_count + unfolded
+
+
+async def record(post_id: int, n: int) -> None:
+    for _ in range(n):
+        await view_counter.record_view(post_id)
+
+
+async def test_flush_writes_views(Session, fake_redis, post_id):
+    await record(post_id, 3)
+    assert (await view_counter.pending_views([post_id]))[post_id] == 3
+    assert await flush(Session) == 1
+    assert await views(Session, post_id) == 3
+    assert (await view_counter.pending_views([post_id]))[post_id] == 0
+    assert not await fake_redis.exists(view_counter.FLUSHING_KEY, view_counter.FLUSHING_BATCH_KEY)
+    assert await flush(Session) == 0
+
+
+async def test_committed_batch_is_not_applied_twice(Session, fake_redis, post_id, monkeypatch):
+    await record(post_id, 1)
+    await flush(Session)
+
+    # The worker dies after the commit, before FLUSHING is deleted
+    finish = view_counter._finish_script
+
+    async def crash(**kwargs):
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(view_counter, "_finish_script", crash)
+    await record(post_id, 2)
+    with pytest.raises(RuntimeError):
+        await flush(Session)
+    assert await views(Session, post_id) == 3
+    assert await fake_redis.exists(view_counter.FLUSHING_KEY)
+    # Views recorded meanwhile stay in PENDING for the next batch
+    await record(post_id, 4)
+
+    monkeypatch.setattr(view_counter, "_finish_script", finish)
+    assert await flush(Session) == 0
+    assert await views(Session, post_id) == 3
+    assert not await fake_redis.exists(view_counter.FLUSHING_KEY)
+
+    assert await flush(Session) == 1
+    assert await views(Session, post_id) == 7